@@ -1,4 +1,4 @@
-from robomimic.algo.algo import register_algo_factory_func, algo_name_to_factory_func, algo_factory, Algo, PolicyAlgo, ValueAlgo, PlannerAlgo, HierarchicalAlgo, RolloutPolicy
+from robomimic.algo.algo import register_algo_factory_func, algo_name_to_factory_func, algo_factory, merge_seq_fetch_indices, Algo, PolicyAlgo, ValueAlgo, PlannerAlgo, HierarchicalAlgo, RolloutPolicy
 
 # note: these imports are needed to register these classes in the global algo registry
 from robomimic.algo.bc import BC, BC_Gaussian, BC_GMM, BC_VAE, BC_RNN, BC_RNN_GMM
@@ -8,6 +8,7 @@ These factory functions are registered into a global dictionary with the
 @algo_factory to instantiate the correct `Algo` subclass.
 """
 import textwrap
+import numpy as np
 from copy import deepcopy
 from collections import OrderedDict
 
@@ -48,6 +49,26 @@ def algo_name_to_factory_func(algo_name):
     return REGISTERED_ALGO_FACTORY_FUNCS[algo_name]
 
 
+def merge_seq_fetch_indices(*all_fetch_indices):
+    """
+    Merges the sequence timesteps declared by several algorithms that train on the same batches
+    (see @Algo.get_seq_fetch_indices), such as the components of hierarchical algorithms. A key
+    is only fetched sparsely if every algorithm declares timesteps for it.
+
+    Args:
+        all_fetch_indices (dict or None): fetch indices of each algorithm
+
+    Returns:
+        fetch_indices (dict or None): merged fetch indices, with sorted timesteps
+    """
+    all_fetch_indices = [(dict() if x is None else x) for x in all_fetch_indices]
+    fetch_indices = OrderedDict()
+    for k in all_fetch_indices[0]:
+        if all(k in x for x in all_fetch_indices):
+            fetch_indices[k] = sorted(set(int(t) for x in all_fetch_indices for t in x[k]))
+    return fetch_indices if len(fetch_indices) > 0 else None
+
+
 def algo_factory(algo_name, config, obs_key_shapes, ac_dim, device):
     """
     Factory function for creating algorithms based on the algorithm name and config.
@@ -124,14 +145,26 @@ class Algo(object):
         self.device = device
         self.obs_key_shapes = obs_key_shapes
 
+        # mixed precision settings (see @autocast and @_create_optimizers)
+        self.amp_enabled = global_config.train.amp.enabled
+        self.amp_dtype = TorchUtils.get_autocast_dtype(device=device, dtype=global_config.train.amp.dtype)
+
         self.nets = nn.ModuleDict()
         self._create_shapes(obs_config.modalities, obs_key_shapes)
         self._create_networks()
+        if global_config.train.channels_last:
+            # only 4D parameters (convolution weights) change layout - convolution outputs follow their weights,
+            # so activations of visual encoders stay channels-last without converting the image inputs
+            self.nets.to(memory_format=torch.channels_last)
         self._create_optimizers()
 
+        # timesteps of each sequence that the dataset fetches for this algorithm (see @get_seq_fetch_indices)
+        self.set_seq_fetch_indices(self.get_seq_fetch_indices() if global_config.train.sparse_fetch else None)
+
         # Classifier Stuff
-        self.past_actions = []
-        self.past_observations = []
+        # history of (state, zero-padded action) pairs from recent training batches, of which the classifier
+        # sees windows of the last num_past batches plus the current one (see BC._compute_losses)
+        self.classifier_history = TorchUtils.TensorRingBuffer(capacity=global_config.classifier.num_past + 1)
 
         self.classifier = TrajectoryClassifier(state_dim=global_config.classifier.state_dim, 
         action_dim=ac_dim,
@@ -204,9 +237,14 @@ class Algo(object):
     def _create_optimizers(self):
         """
         Creates optimizers using @self.optim_params and places them into @self.optimizers.
+        Also creates the gradient scaler shared by all optimizers, which is only enabled for
+        float16 mixed precision training.
         """
         self.optimizers = dict()
         self.lr_schedulers = dict()
+        self.grad_scaler = TorchUtils.get_grad_scaler(device=self.device, dtype=self.amp_dtype, enabled=self.amp_enabled)
+        # whether an optimizer step went through @self.grad_scaler since its last update
+        self._scaler_stepped = False
 
         for k in self.optim_params:
             # only make optimizers for networks that have been created - @optim_params may have more
@@ -227,6 +265,80 @@ class Algo(object):
                     self.lr_schedulers[k] = TorchUtils.lr_scheduler_from_optim_params(
                         net_optim_params=self.optim_params[k], net=self.nets[k], optimizer=self.optimizers[k])
 
+    def autocast(self):
+        """
+        Context for the forward passes and loss computations in @train_on_batch. Runs them under
+        torch.autocast if mixed precision training is enabled, and is a dummy context otherwise.
+        Backward passes and optimizer steps should be outside of this context.
+        """
+        if not self.amp_enabled:
+            return TorchUtils.dummy_context_mgr()
+        return torch.autocast(device_type=torch.device(self.device).type, dtype=self.amp_dtype)
+
+    def backprop_for_loss(self, net, optim, loss, max_grad_norm=None, retain_graph=False):
+        """
+        Backpropagate @loss and step @optim through the gradient scaler of this algo. See
+        @TorchUtils.backprop_for_loss for arguments. Records that the scaler was stepped, so
+        that @on_train_batch_end knows to update the loss scale.
+
+        Returns:
+            grad_norms (torch.Tensor): 0-dim tensor with the sum of squared gradient norms
+        """
+        grad_norms = TorchUtils.backprop_for_loss(
+            net=net,
+            optim=optim,
+            loss=loss,
+            max_grad_norm=max_grad_norm,
+            retain_graph=retain_graph,
+            scaler=self.grad_scaler,
+        )
+        if self.grad_scaler.is_enabled():
+            self._scaler_stepped = True
+        return grad_norms
+
+    def on_train_batch_end(self):
+        """
+        Called at the end of @train_on_batch, after all optimizer steps for the batch. Updates the
+        loss scale of the gradient scaler once per batch, so that all losses of a batch are scaled
+        the same way and the scaler's growth interval counts training iterations.
+        """
+        # the scaler can only be updated if at least one optimizer step went through it
+        if self._scaler_stepped:
+            self.grad_scaler.update()
+            self._scaler_stepped = False
+
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes,
+        so that the dataset only fetches those timesteps when config.train.sparse_fetch is set.
+        Timesteps are positions in the fetched sequence, which has length (frame_stack - 1 + seq_length).
+
+        Returns:
+            fetch_indices (dict or None): maps "obs", "next_obs", or dataset keys (e.g. "actions") to
+                lists of timesteps. Keys that are not present are fetched in full, and None fetches
+                every key in full.
+        """
+        return None
+
+    def set_seq_fetch_indices(self, fetch_indices):
+        """
+        Sets the timesteps that the dataset fetches for each key, which determines where
+        @process_batch_for_training finds each timestep (see @_seq_index).
+
+        Args:
+            fetch_indices (dict or None): fetch indices, as returned by @get_seq_fetch_indices
+        """
+        self.seq_fetch_indices = merge_seq_fetch_indices(fetch_indices)
+
+    def _seq_index(self, key, t):
+        """
+        Position of timestep @t of the sequence for @key in batches from the data loader. When
+        sparse fetching is enabled, these sequences only contain the timesteps in @self.seq_fetch_indices.
+        """
+        if (self.seq_fetch_indices is None) or (key not in self.seq_fetch_indices):
+            return t
+        return self.seq_fetch_indices[key].index(t)
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -254,16 +366,18 @@ class Algo(object):
                 training will occur (after @process_batch_for_training
                 is called)
 
-            obs_normalization_stats (dict or None): if provided, this should map observation 
-                keys to dicts with a "mean" and "std" of shape (1, ...) where ... is the 
-                default shape for the observation.
+            obs_normalization_stats (ObsUtils.ObsNormalizationStats or dict or None): if provided, this
+                should map observation keys to dicts with a "mean" and "std" of shape (1, ...) where ... 
+                is the default shape for the observation. Pass an @ObsUtils.ObsNormalizationStats
+                object so that the statistics are only moved to the device once.
 
         Returns:
             batch (dict): postproceesed batch
         """
 
-        # ensure obs_normalization_stats are torch Tensors on proper device
-        obs_normalization_stats = TensorUtils.to_float(TensorUtils.to_device(TensorUtils.to_tensor(obs_normalization_stats), self.device))
+        # ensure obs_normalization_stats can be applied to torch Tensors on the proper device
+        if (obs_normalization_stats is not None) and (not isinstance(obs_normalization_stats, ObsUtils.ObsNormalizationStats)):
+            obs_normalization_stats = ObsUtils.ObsNormalizationStats(obs_normalization_stats)
 
         # we will search the nested batch dictionary for the following special batch dict keys
         # and apply the processing function to their values (which correspond to observations)
@@ -512,12 +626,14 @@ class RolloutPolicy(object):
         Args:
             policy (Algo instance): @Algo object to wrap to prepare for rollouts
 
-            obs_normalization_stats (dict): optionally pass a dictionary for observation
-                normalization. This should map observation keys to dicts
+            obs_normalization_stats (ObsUtils.ObsNormalizationStats or dict): optionally pass statistics
+                for observation normalization. This should map observation keys to dicts
                 with a "mean" and "std" of shape (1, ...) where ... is the default
                 shape for the observation.
         """
         self.policy = policy
+        if (obs_normalization_stats is not None) and (not isinstance(obs_normalization_stats, ObsUtils.ObsNormalizationStats)):
+            obs_normalization_stats = ObsUtils.ObsNormalizationStats(obs_normalization_stats)
         self.obs_normalization_stats = obs_normalization_stats
 
     def start_episode(self):
@@ -527,24 +643,24 @@ class RolloutPolicy(object):
         self.policy.set_eval()
         self.policy.reset()
 
-    def _prepare_observation(self, ob):
+    def _prepare_observation(self, ob, batched=False):
         """
         Prepare raw observation dict from environment for policy.
 
         Args:
             ob (dict): single observation dictionary from environment (no batch dimension, 
                 and np.array values for each key)
+            batched (bool): if True, @ob already has a leading batch dimension
         """
         ob = TensorUtils.to_tensor(ob)
-        ob = TensorUtils.to_batch(ob)
+        if not batched:
+            ob = TensorUtils.to_batch(ob)
         ob = TensorUtils.to_device(ob, self.policy.device)
         ob = TensorUtils.to_float(ob)
         if self.obs_normalization_stats is not None:
-            # ensure obs_normalization_stats are torch Tensors on proper device
-            obs_normalization_stats = TensorUtils.to_float(TensorUtils.to_device(TensorUtils.to_tensor(self.obs_normalization_stats), self.policy.device))
             # limit normalization to obs keys being used, in case environment includes extra keys
             ob = { k : ob[k] for k in self.policy.global_config.all_obs_keys }
-            ob = ObsUtils.normalize_obs(ob, obs_normalization_stats=obs_normalization_stats)
+            ob = ObsUtils.normalize_obs(ob, obs_normalization_stats=self.obs_normalization_stats)
         return ob
 
     def __repr__(self):
@@ -565,3 +681,23 @@ class RolloutPolicy(object):
             goal = self._prepare_observation(goal)
         ac = self.policy.get_action(obs_dict=ob, goal_dict=goal)
         return TensorUtils.to_numpy(ac[0])
+
+    def get_batch_action(self, obs, goals=None):
+        """
+        Produce actions for a list of raw observation dicts (e.g. one per environment
+        in a vectorized rollout) with a single policy forward pass.
+
+        Args:
+            obs (list): list of observation dictionaries from environments (no batch
+                dimension, and np.array values for each key)
+            goals (list): optional list of goal observations, one per entry of @obs
+
+        Returns:
+            actions (np.array): actions of shape [len(obs), ac_dim]
+        """
+        ob = self._prepare_observation({ k : np.stack([o[k] for o in obs]) for k in obs[0] }, batched=True)
+        goal = None
+        if goals is not None:
+            goal = self._prepare_observation({ k : np.stack([g[k] for g in goals]) for k in goals[0] }, batched=True)
+        ac = self.policy.get_action(obs_dict=ob, goal_dict=goal)
+        return TensorUtils.to_numpy(ac)
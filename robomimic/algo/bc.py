@@ -99,6 +99,13 @@ class BC(PolicyAlgo):
     
 
 
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices). Only the first observation and action are used.
+        """
+        return OrderedDict(obs=[0], next_obs=[], actions=[0])
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -113,9 +120,9 @@ class BC(PolicyAlgo):
                 will be used for training 
         """
         input_batch = dict()
-        input_batch["obs"] = {k: batch["obs"][k][:, 0, :] for k in batch["obs"]}
+        input_batch["obs"] = {k: batch["obs"][k][:, self._seq_index("obs", 0), :] for k in batch["obs"]}
         input_batch["goal_obs"] = batch.get("goal_obs", None) # goals may not be present
-        input_batch["actions"] = batch["actions"][:, 0, :]
+        input_batch["actions"] = batch["actions"][:, self._seq_index("actions", 0), :]
 
         # we move to device first before float conversion because image observation modalities will be uint8 -
         # this minimizes the amount of data transferred to GPU
@@ -154,13 +161,14 @@ class BC(PolicyAlgo):
                 that might be relevant for logging
         """
         with TorchUtils.maybe_no_grad(no_grad=validate):
-            concatenated_state_tensor = self.concatenate_state_dict(batch['obs'])
+            with self.autocast():
+                concatenated_state_tensor = self.concatenate_state_dict(batch['obs'])
 
-            # print("Batch Goal Obs: ", batch['goal_obs'].keys())
-            # self.concatenate_state_dict(batch['goal_obs'])
-            info = super(BC, self).train_on_batch(batch, epoch, validate=validate)
-            predictions = self._forward_training(batch)
-            losses = self._compute_losses(predictions, batch, concatenated_state_tensor)
+                # print("Batch Goal Obs: ", batch['goal_obs'].keys())
+                # self.concatenate_state_dict(batch['goal_obs'])
+                info = super(BC, self).train_on_batch(batch, epoch, validate=validate)
+                predictions = self._forward_training(batch)
+                losses = self._compute_losses(predictions, batch, concatenated_state_tensor)
 
             info["predictions"] = TensorUtils.detach(predictions)
             info["losses"] = TensorUtils.detach(losses)
@@ -168,6 +176,7 @@ class BC(PolicyAlgo):
             if not validate:
                 step_info = self._train_step(losses)
                 info.update(step_info)
+                self.on_train_batch_end()
 
         return info
 
@@ -214,41 +223,23 @@ class BC(PolicyAlgo):
 
         # Classifier Loss
         
-        # Check if past_actions and past_observations are longer than num_past
+        # Check if there are at least num_past batches of history before the current one
         num_past = self.classifier.get_num_past()
 
         current_action = actions.squeeze(1)
         current_state = current_state.squeeze(1)
 
-            
-        if len(self.past_actions) >= num_past:
-            if num_past == 0:
-                actions_window = [current_action.clone().detach()]
-                states_window = [current_state.clone().detach()]
-            else:
-                actions_window = self.past_actions[-num_past:].copy()
-                states_window = self.past_observations[-num_past:].copy()
-
-                actions_window.append(current_action.clone().detach())
-                states_window.append(current_state.clone().detach())
-                
-            padded_actions = []
-            for action in actions_window:
-                # Create a padded action tensor to match the state dimension
-                action_pad = torch.zeros_like(current_state)  # Match observation dimension
-                action_pad[:, :action.shape[1]] = action
-                padded_actions.append(action_pad)
-            
-            # Convert past states and padded actions to tensors
+        # store the current state and the action zero-padded to the state dimension
+        padded_action = F.pad(current_action, (0, current_state.shape[-1] - current_action.shape[-1]))
+        self.classifier_history.append(torch.stack([current_state, padded_action], dim=1))  # Shape: [batch_size, 2, state_dim]
+        has_history = (len(self.classifier_history) == num_past + 1)
 
-            states_tensor = torch.stack([state.clone().detach() for state in states_window], dim=0)  # Shape: [num_past + 1, batch_size, state_dim]
-            actions_tensor = torch.stack(padded_actions, dim=0)  # Shape: [num_past, batch_size, state_dim]
-            
-            # Concatenate states and actions along the time dimension
-            combined_tensor = torch.cat((states_tensor, actions_tensor), dim=0)  # Shape: [2 * (num_past + 1), batch_size, state_dim]
-            
-            # Reshape to desired output: [batch_size, state_dim, num_past * 2 + 2]
-            final_tensor = combined_tensor.permute(1, 2, 0)  # Shape: [batch_size, state_dim, num_past * 2 + 2]
+        if has_history:
+            # gather the window of the last num_past batches and the current one
+            window = self.classifier_history.last(num_past + 1)  # Shape: [num_past + 1, batch_size, 2, state_dim]
+
+            # Reshape to desired output: [batch_size, state_dim, num_past * 2 + 2], with all states before all actions
+            final_tensor = window.permute(1, 3, 2, 0).reshape(window.shape[1], window.shape[3], -1)
 
 
             output = self.classifier(final_tensor)
@@ -261,7 +252,7 @@ class BC(PolicyAlgo):
         
 
 
-        if len(self.past_actions) >= num_past:
+        if has_history:
             action_losses = [
                 self.algo_config.loss.l2_weight * losses["l2_loss"],
                 self.algo_config.loss.l1_weight * losses["l1_loss"],
@@ -276,9 +267,6 @@ class BC(PolicyAlgo):
             ]
         action_loss = sum(action_losses)
         losses["action_loss"] = action_loss
-
-        self.past_actions.append(current_action.clone().detach())
-        self.past_observations.append(current_state.clone().detach())
         return losses
 
     def _train_step(self, losses):
@@ -292,7 +280,7 @@ class BC(PolicyAlgo):
 
         # gradient step
         info = OrderedDict()
-        policy_grad_norms = TorchUtils.backprop_for_loss(
+        policy_grad_norms = self.backprop_for_loss(
             net=self.nets["policy"],
             optim=self.optimizers["policy"],
             loss=losses["action_loss"],
@@ -596,6 +584,16 @@ class BC_RNN(BC):
 
 
 
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices). Observation and action sequences are used in full, except
+        for open-loop training, which only uses the first observation.
+        """
+        if self._rnn_is_open_loop:
+            return OrderedDict(obs=[0], next_obs=[])
+        return OrderedDict(next_obs=[])
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -619,7 +617,7 @@ class BC_RNN(BC):
             # This way, all actions are predicted "open-loop" after the first observation, based
             # on the rnn hidden state.
             n_steps = batch["actions"].shape[1]
-            obs_seq_start = TensorUtils.index_at_time(batch["obs"], ind=0)
+            obs_seq_start = TensorUtils.index_at_time(batch["obs"], ind=self._seq_index("obs", 0))
             input_batch["obs"] = TensorUtils.unsqueeze_expand_at(obs_seq_start, size=n_steps, dim=1)
 
         # we move to device first before float conversion because image observation modalities will be uint8 -
@@ -794,6 +792,19 @@ class BC_Transformer(BC):
         self.context_length = self.algo_config.transformer.context_length
         self.supervise_all_steps = self.algo_config.transformer.supervise_all_steps
 
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices). Observations are used for the whole context, and actions
+        either for the whole context or just for the current timestep.
+        """
+        h = self.context_length
+        return OrderedDict(
+            obs=list(range(h)),
+            next_obs=[],
+            actions=(list(range(h)) if self.supervise_all_steps else [h - 1]),
+        )
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -815,7 +826,7 @@ class BC_Transformer(BC):
             input_batch["actions"] = batch["actions"][:, :h, :]
         else:
             # just use current timestep
-            input_batch["actions"] = batch["actions"][:, h-1, :]
+            input_batch["actions"] = batch["actions"][:, self._seq_index("actions", h-1), :]
 
         input_batch = TensorUtils.to_device(TensorUtils.to_float(input_batch), self.device)
         return input_batch
@@ -858,7 +869,19 @@ class BC_Transformer(BC):
         """
         assert not self.nets.training
 
-        return self.nets["policy"](obs_dict, actions=None, goal_dict=goal_dict)[:, -1, :]
+        return self.nets["policy"](
+            obs_dict,
+            actions=None,
+            goal_dict=goal_dict,
+            incremental=self.algo_config.transformer.incremental_inference,
+        )[:, -1, :]
+
+    def reset(self):
+        """
+        Reset algo state to prepare for environment rollouts.
+        """
+        # cached encoder features from the last episode are no longer valid
+        self.nets["policy"].reset_inference_cache()
 
 
 class BC_Transformer_GMM(BC_Transformer):
@@ -41,6 +41,28 @@ def algo_config_to_class(algo_config):
     return BCQ, {}
 
 
+def _merge_features(feats, other_feats):
+    """
+    Merge two nested feature dictionaries returned by @encode_features for different
+    observation groups (for example, observations and goals encoded separately).
+
+    Args:
+        feats (dict or None): nested dictionary of features
+        other_feats (dict or None): nested dictionary of features
+
+    Returns:
+        merged_feats (dict or None): nested dictionary with the features of both
+    """
+    if feats is None:
+        return other_feats
+    if other_feats is None:
+        return feats
+    merged_feats = OrderedDict(feats)
+    for k in other_feats:
+        merged_feats[k] = _merge_features(merged_feats.get(k, None), other_feats[k])
+    return merged_feats
+
+
 class BCQ(PolicyAlgo, ValueAlgo):
     """
     Default BCQ training, based on https://arxiv.org/abs/1812.02900 and
@@ -155,6 +177,21 @@ class BCQ(PolicyAlgo, ValueAlgo):
         """
         self.discount = discount
 
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices). The first observation and action are used, along with
+        the next observation, rewards, and dones for n-step returns.
+        """
+        n_step = self.algo_config.n_step
+        return OrderedDict(
+            obs=[0],
+            next_obs=[n_step - 1],
+            actions=[0],
+            rewards=list(range(n_step)),
+            dones=list(range(n_step)),
+        )
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -172,13 +209,14 @@ class BCQ(PolicyAlgo, ValueAlgo):
 
         # n-step returns (default is 1)
         n_step = self.algo_config.n_step
-        assert batch["actions"].shape[1] >= n_step
+        assert batch["rewards"].shape[1] >= n_step
 
         # remove temporal batches for all
-        input_batch["obs"] = {k: batch["obs"][k][:, 0, :] for k in batch["obs"]}
-        input_batch["next_obs"] = {k: batch["next_obs"][k][:, n_step - 1, :] for k in batch["next_obs"]}
+        input_batch["obs"] = {k: batch["obs"][k][:, self._seq_index("obs", 0), :] for k in batch["obs"]}
+        next_obs_index = self._seq_index("next_obs", n_step - 1)
+        input_batch["next_obs"] = {k: batch["next_obs"][k][:, next_obs_index, :] for k in batch["next_obs"]}
         input_batch["goal_obs"] = batch.get("goal_obs", None) # goals may not be present
-        input_batch["actions"] = batch["actions"][:, 0, :]
+        input_batch["actions"] = batch["actions"][:, self._seq_index("actions", 0), :]
 
         # note: ensure scalar signals (rewards, done) retain last dimension of 1 to be compatible with model outputs
 
@@ -242,11 +280,12 @@ class BCQ(PolicyAlgo, ValueAlgo):
         if (self.algo_config.action_sampler.freeze_encoder_epoch != -1) and (epoch >= self.algo_config.action_sampler.freeze_encoder_epoch):
             vae_inputs["freeze_encoder"] = True
 
-        # VAE forward
-        vae_outputs = self.nets["action_sampler"].forward_train(**vae_inputs)
-        recons_loss = vae_outputs["reconstruction_loss"]
-        kl_loss = vae_outputs["kl_loss"]
-        vae_loss = recons_loss + self.algo_config.action_sampler.vae.kl_weight * kl_loss
+        with self.autocast():
+            # VAE forward
+            vae_outputs = self.nets["action_sampler"].forward_train(**vae_inputs)
+            recons_loss = vae_outputs["reconstruction_loss"]
+            kl_loss = vae_outputs["kl_loss"]
+            vae_loss = recons_loss + self.algo_config.action_sampler.vae.kl_weight * kl_loss
         info["action_sampler/loss"] = vae_loss
         info["action_sampler/recons_loss"] = recons_loss
         info["action_sampler/kl_loss"] = kl_loss
@@ -258,7 +297,7 @@ class BCQ(PolicyAlgo, ValueAlgo):
 
         # VAE gradient step
         if not no_backprop:
-            vae_grad_norms = TorchUtils.backprop_for_loss(
+            vae_grad_norms = self.backprop_for_loss(
                 net=self.nets["action_sampler"],
                 optim=self.optimizers["action_sampler"],
                 loss=vae_loss,
@@ -303,31 +342,33 @@ class BCQ(PolicyAlgo, ValueAlgo):
         done_mask_batch = 1. - batch["dones"]
         info["done_masks"] = done_mask_batch
 
-        # Bellman backup for Q-targets
-        q_targets = self._get_target_values(
-            next_states=ns_batch, 
-            goal_states=goal_s_batch, 
-            rewards=r_batch, 
-            dones=done_mask_batch,
-            action_sampler_outputs=action_sampler_outputs,
-        )
+        with self.autocast():
+            # Bellman backup for Q-targets
+            q_targets = self._get_target_values(
+                next_states=ns_batch, 
+                goal_states=goal_s_batch, 
+                rewards=r_batch, 
+                dones=done_mask_batch,
+                action_sampler_outputs=action_sampler_outputs,
+            )
         info["critic/q_targets"] = q_targets
 
         # Train all critics using this set of targets for regression
         critic_outputs = []
         for critic_ind, critic in enumerate(self.nets["critic"]):
-            critic_loss, critic_output = self._compute_critic_loss(
-                critic=critic, 
-                states=s_batch, 
-                actions=a_batch, 
-                goal_states=goal_s_batch, 
-                q_targets=q_targets,
-            )
+            with self.autocast():
+                critic_loss, critic_output = self._compute_critic_loss(
+                    critic=critic, 
+                    states=s_batch, 
+                    actions=a_batch, 
+                    goal_states=goal_s_batch, 
+                    q_targets=q_targets,
+                )
             info["critic/critic{}_loss".format(critic_ind + 1)] = critic_loss
             critic_outputs.append(critic_output)
 
             if not no_backprop:
-                critic_grad_norms = TorchUtils.backprop_for_loss(
+                critic_grad_norms = self.backprop_for_loss(
                     net=self.nets["critic"][critic_ind],
                     optim=self.optimizers["critic"][critic_ind],
                     loss=critic_loss, 
@@ -370,15 +411,16 @@ class BCQ(PolicyAlgo, ValueAlgo):
         s_batch = batch["obs"]
         goal_s_batch = batch["goal_obs"]
 
-        # sample some actions from action sampler and perturb them, then improve perturbations
-        # where improvement is measured by the critic
-        sampled_actions = self.nets["action_sampler"](s_batch, goal_s_batch).detach() # don't backprop into samples
-        perturbed_actions = self.nets["actor"](s_batch, sampled_actions, goal_s_batch)
-        actor_loss = -(self.nets["critic"][0](s_batch, perturbed_actions, goal_s_batch)).mean()
+        with self.autocast():
+            # sample some actions from action sampler and perturb them, then improve perturbations
+            # where improvement is measured by the critic
+            sampled_actions = self.nets["action_sampler"](s_batch, goal_s_batch).detach() # don't backprop into samples
+            perturbed_actions = self.nets["actor"](s_batch, sampled_actions, goal_s_batch)
+            actor_loss = -(self.nets["critic"][0](s_batch, perturbed_actions, goal_s_batch)).mean()
         info["actor/loss"] = actor_loss
 
         if not no_backprop:
-            actor_grad_norms = TorchUtils.backprop_for_loss(
+            actor_grad_norms = self.backprop_for_loss(
                 net=self.nets["actor"],
                 optim=self.optimizers["actor"],
                 loss=actor_loss,
@@ -404,79 +446,110 @@ class BCQ(PolicyAlgo, ValueAlgo):
         """
 
         with torch.no_grad():
-            # we need to stack the observations with redundancy @num_action_samples here, then decode 
-            # to get all sampled actions. for example, if we generate 2 samples per observation and
-            # the batch size is 3, then ob_tiled = [ob1; ob1; ob2; ob2; ob3; ob3]
-            next_states_tiled = ObsUtils.repeat_and_stack_observation(next_states, n=self.algo_config.critic.num_action_samples)
-            goal_states_tiled = None
-            if len(self.goal_shapes) > 0:
-                goal_states_tiled = ObsUtils.repeat_and_stack_observation(goal_states, n=self.algo_config.critic.num_action_samples)
-
             # sample action proposals
             next_sampled_actions = self._sample_actions_for_value_maximization(
-                states_tiled=next_states_tiled,
-                goal_states_tiled=goal_states_tiled,
+                states=next_states,
+                goal_states=goal_states,
+                num_samples=self.algo_config.critic.num_action_samples,
                 for_target_update=True,
             )
 
             q_targets = self._get_target_values_from_sampled_actions(
-                next_states_tiled=next_states_tiled, 
+                next_states=next_states, 
                 next_sampled_actions=next_sampled_actions, 
-                goal_states_tiled=goal_states_tiled, 
+                goal_states=goal_states, 
                 rewards=rewards, 
                 dones=dones,
             )
 
         return q_targets
 
-    def _sample_actions_for_value_maximization(self, states_tiled, goal_states_tiled, for_target_update):
+    def _encode_and_tile(self, net, states, goal_states, num_samples, goal_repeats=1):
+        """
+        Helper function to evaluate @net on @num_samples candidates (such as action proposals)
+        per observation. Observations are encoded once with the observation encoder of @net,
+        and only the flat features are tiled, instead of running the encoder (and any visual
+        backbone) on @num_samples copies of each observation. For example, if we generate 2
+        samples per observation and the batch size is 3, the features are tiled as
+        [ob1; ob1; ob2; ob2; ob3; ob3], like @ObsUtils.repeat_and_stack_observation.
+
+        Args:
+            net (torch.nn.Module): network with an @encode_features method, whose forward
+                accepts the tiled features through its @feats argument
+
+            states (dict): batch of observations
+
+            goal_states (dict): if not None, batch of goal observations
+
+            num_samples (int): number of candidates per observation
+
+            goal_repeats (int): if greater than 1, @states holds @goal_repeats consecutive
+                observations per goal in @goal_states (for example, several subgoal proposals
+                per goal). Goals are then encoded once and only their features are tiled to
+                match @states.
+
+        Returns:
+            feats (dict): tiled features with leading dimension B * @num_samples
+        """
+        if (goal_states is None) or (goal_repeats == 1):
+            feats = net.encode_features(states, goal_states)
+        else:
+            goal_feats = TensorUtils.repeat_by_expand_at(net.encode_features(None, goal_states), repeats=goal_repeats, dim=0)
+            feats = _merge_features(net.encode_features(states, None), goal_feats)
+        return TensorUtils.repeat_by_expand_at(feats, repeats=num_samples, dim=0)
+
+    def _sample_actions_for_value_maximization(self, states, goal_states, num_samples, for_target_update, goal_repeats=1):
         """
         Helper function to sample actions for maximization (the "batch-constrained" part of 
         batch-constrained q-learning).
 
         Args:
-            states_tiled (dict): observations to use for sampling actions. Assumes that tiling
-                has already occurred - so that if the batch size is B, and N samples are
-                desired for each observation in the batch, the leading dimension for each
-                observation in the dict is B * N
+            states (dict): batch of observations to use for sampling actions
 
-            goal_states_tiled (dict): if not None, goal observations
+            goal_states (dict): if not None, batch of goal observations
+
+            num_samples (int): number of actions to sample per observation
 
             for_target_update (bool): if True, actions are being sampled for use in training the
                 critic - which means the target actor network should be used
 
+            goal_repeats (int): number of consecutive observations in @states per goal in
+                @goal_states (see @_encode_and_tile)
+
         Returns:
             sampled_actions (torch.Tensor): actions sampled from the action sampler, and maybe
-                perturbed by the actor network
+                perturbed by the actor network, of shape [B * N, ...] - the N samples for each
+                observation are contiguous
         """
 
         with torch.no_grad():
-            sampled_actions = self.nets["action_sampler"](states_tiled, goal_states_tiled)
+            action_sampler = self.nets["action_sampler"]
+            sampled_actions = action_sampler(
+                None, None, feats=self._encode_and_tile(action_sampler, states, goal_states, num_samples, goal_repeats))
             if self.algo_config.actor.enabled:
                 actor = self.nets["actor"]
                 if for_target_update:
                     actor = self.nets["actor_target"]
                 # perturb the actions with the policy
-                sampled_actions = actor(states_tiled, sampled_actions, goal_states_tiled)
+                sampled_actions = actor(
+                    None, sampled_actions, None, feats=self._encode_and_tile(actor, states, goal_states, num_samples, goal_repeats))
 
         return sampled_actions
 
-    def _get_target_values_from_sampled_actions(self, next_states_tiled, next_sampled_actions, goal_states_tiled, rewards, dones):
+    def _get_target_values_from_sampled_actions(self, next_states, next_sampled_actions, goal_states, rewards, dones):
         """
         Helper function to get target values for training Q-function with TD-loss. The function
-        assumes that action candidates to maximize over have already been computed, and that
-        the input states have been tiled (repeated) to be compatible with the sampled actions.
+        assumes that action candidates to maximize over have already been computed with
+        @_sample_actions_for_value_maximization.
 
         Args:
-            next_states_tiled (dict): next observations to use for sampling actions. Assumes that 
-                tiling has already occurred - so that if the batch size is B, and N samples are
-                desired for each observation in the batch, the leading dimension for each
-                observation in the dict is B * N
+            next_states (dict): batch of next observations
 
-            next_sampled_actions (torch.Tensor): actions sampled from the action sampler. This function
-                will maximize the critic over these action candidates (using the TD3 trick)
+            next_sampled_actions (torch.Tensor): actions sampled from the action sampler, with
+                @self.algo_config.critic.num_action_samples contiguous samples per observation. 
+                This function will maximize the critic over these action candidates (using the TD3 trick)
 
-            goal_states_tiled (dict): if not None, goal observations
+            goal_states (dict): if not None, batch of goal observations
 
             rewards (torch.Tensor): batch of rewards - should be shape (B, 1)
 
@@ -485,18 +558,22 @@ class BCQ(PolicyAlgo, ValueAlgo):
         Returns:
             q_targets (torch.Tensor): target Q-values to use for TD loss
         """
+        num_samples = self.algo_config.critic.num_action_samples
         with torch.no_grad():
-            # feed tiled observations and sampled actions into the critics and then
+            # feed tiled observation features and sampled actions into the critics and then
             # reshape to get all Q-values in second dimension per observation in batch.
-            all_value_targets = self.nets["critic_target"][0](next_states_tiled, next_sampled_actions, goal_states_tiled).reshape(
-                -1, self.algo_config.critic.num_action_samples)
+            critic_target = self.nets["critic_target"][0]
+            all_value_targets = critic_target(
+                None, next_sampled_actions, None, feats=self._encode_and_tile(critic_target, next_states, goal_states, num_samples),
+            ).reshape(-1, num_samples)
             max_value_targets = all_value_targets
             min_value_targets = all_value_targets
 
             # TD3 trick to combine max and min over all Q-ensemble estimates into single target estimates
             for critic_target in self.nets["critic_target"][1:]:
-                all_value_targets = critic_target(next_states_tiled, next_sampled_actions, goal_states_tiled).reshape(
-                    -1, self.algo_config.critic.num_action_samples)
+                all_value_targets = critic_target(
+                    None, next_sampled_actions, None, feats=self._encode_and_tile(critic_target, next_states, goal_states, num_samples),
+                ).reshape(-1, num_samples)
                 max_value_targets = torch.max(max_value_targets, all_value_targets)
                 min_value_targets = torch.min(min_value_targets, all_value_targets)
             all_value_targets = self.algo_config.critic.ensemble.weight * min_value_targets + \
@@ -595,16 +672,17 @@ class BCQ(PolicyAlgo, ValueAlgo):
             if not validate:
                 # restore to train mode if necessary
                 self.nets["action_sampler"].train()
+                self.on_train_batch_end()
 
             # update the target critic networks (only when critic has gradient update)
             if not no_critic_backprop:
                 with torch.no_grad():
-                    for critic_ind in range(len(self.nets["critic"])):
-                        TorchUtils.soft_update(
-                            source=self.nets["critic"][critic_ind], 
-                            target=self.nets["critic_target"][critic_ind], 
-                            tau=self.algo_config.target_tau,
-                        )
+                    # whole ensemble at once
+                    TorchUtils.soft_update(
+                        source=self.nets["critic"], 
+                        target=self.nets["critic_target"], 
+                        tau=self.algo_config.target_tau,
+                    )
 
             # update target actor network (only when actor has gradient update)
             if self.algo_config.actor.enabled and (not no_actor_backprop):
@@ -730,7 +808,7 @@ class BCQ(PolicyAlgo, ValueAlgo):
         if self.algo_config.actor.enabled and self.lr_schedulers["actor"] is not None:
             self.lr_schedulers["actor"].step()
 
-    def _get_best_value(self, obs_dict, goal_dict=None):
+    def _get_best_value(self, obs_dict, goal_dict=None, goal_repeats=1):
         """
         Internal helper function for getting the best value for a given state and 
         the corresponding best action. Meant to be used at test-time. Key differences 
@@ -741,6 +819,8 @@ class BCQ(PolicyAlgo, ValueAlgo):
         Args:
             obs_dict (dict): batch of current observations
             goal_dict (dict): (optional) goal
+            goal_repeats (int): number of consecutive observations in @obs_dict per goal
+                in @goal_dict - goals are encoded once instead of being tiled to match
 
         Returns:
             best_value (torch.Tensor): best values
@@ -754,24 +834,26 @@ class BCQ(PolicyAlgo, ValueAlgo):
         # number of action proposals from action sampler
         num_action_samples = self.algo_config.critic.num_action_samples_rollout
 
-        # we need to stack the observations with redundancy @num_action_samples here, then decode 
-        # to get all sampled actions. for example, if we generate 2 samples per observation and
-        # the batch size is 3, then ob_tiled = [ob1; ob1; ob2; ob2; ob3; ob3]
-        ob_tiled = ObsUtils.repeat_and_stack_observation(obs_dict, n=num_action_samples)
-        goal_tiled = None
-        if len(self.goal_shapes) > 0:
-            goal_tiled = ObsUtils.repeat_and_stack_observation(goal_dict, n=num_action_samples)
-
+        # sample @num_action_samples actions per observation - for example, if we generate 2 samples per
+        # observation and the batch size is 3, actions are ordered by observation as [ob1; ob1; ob2; ob2; ob3; ob3]
+        if len(self.goal_shapes) == 0:
+            goal_dict = None
         sampled_actions = self._sample_actions_for_value_maximization(
-            states_tiled=ob_tiled, 
-            goal_states_tiled=goal_tiled,
+            states=obs_dict, 
+            goal_states=goal_dict,
+            num_samples=num_action_samples,
             for_target_update=False,
+            goal_repeats=goal_repeats,
         )
 
-        # feed tiled observations and perturbed sampled actions into the critic and then
+        # feed tiled observation features and perturbed sampled actions into the critic and then
         # reshape to get all Q-values in second dimension per observation in batch.
         # finally, just take a maximum across that second dimension to take the best sampled action
-        all_critic_values = self.nets["critic"][0](ob_tiled, sampled_actions, goal_tiled).reshape(-1, num_action_samples)
+        critic = self.nets["critic"][0]
+        all_critic_values = critic(
+            None, sampled_actions, None,
+            feats=self._encode_and_tile(critic, obs_dict, goal_dict, num_action_samples, goal_repeats),
+        ).reshape(-1, num_action_samples)
         best_action_index = torch.argmax(all_critic_values, dim=1)
 
         all_actions = sampled_actions.reshape(batch_size, num_action_samples, -1)
@@ -796,20 +878,23 @@ class BCQ(PolicyAlgo, ValueAlgo):
         _, best_action = self._get_best_value(obs_dict=obs_dict, goal_dict=goal_dict)
         return best_action
 
-    def get_state_value(self, obs_dict, goal_dict=None):
+    def get_state_value(self, obs_dict, goal_dict=None, goal_repeats=1):
         """
         Get state value outputs.
 
         Args:
             obs_dict (dict): current observation
             goal_dict (dict): (optional) goal
+            goal_repeats (int): number of consecutive observations in @obs_dict per goal
+                in @goal_dict, for evaluating several observations (such as subgoal
+                proposals) against the same goal without encoding it several times
 
         Returns:
             value (torch.Tensor): value tensor
         """
         assert not self.nets.training
 
-        best_value, _ = self._get_best_value(obs_dict=obs_dict, goal_dict=goal_dict)
+        best_value, _ = self._get_best_value(obs_dict=obs_dict, goal_dict=goal_dict, goal_repeats=goal_repeats)
         return best_value
 
     def get_state_action_value(self, obs_dict, actions, goal_dict=None):
@@ -875,22 +960,23 @@ class BCQ_GMM(BCQ):
         """
         info = OrderedDict()
 
-        # GMM forward
-        dists = self.nets["action_sampler"].forward_train(
-            obs_dict=batch["obs"], 
-            goal_dict=batch["goal_obs"],
-        )
+        with self.autocast():
+            # GMM forward
+            dists = self.nets["action_sampler"].forward_train(
+                obs_dict=batch["obs"], 
+                goal_dict=batch["goal_obs"],
+            )
 
-        # make sure that this is a batch of multivariate action distributions, so that
-        # the log probability computation will be correct
-        assert len(dists.batch_shape) == 1
-        log_probs = dists.log_prob(batch["actions"])
-        loss = -log_probs.mean()
+            # make sure that this is a batch of multivariate action distributions, so that
+            # the log probability computation will be correct
+            assert len(dists.batch_shape) == 1
+            log_probs = dists.log_prob(batch["actions"])
+            loss = -log_probs.mean()
         info["action_sampler/loss"] = loss
 
         # GMM gradient step
         if not no_backprop:
-            gmm_grad_norms = TorchUtils.backprop_for_loss(
+            gmm_grad_norms = self.backprop_for_loss(
                 net=self.nets["action_sampler"],
                 optim=self.optimizers["action_sampler"],
                 loss=loss,
@@ -943,21 +1029,19 @@ class BCQ_Distributional(BCQ):
         critic_target = critic_class(**critic_args)
         self.nets["critic_target"].append(critic_target)
 
-    def _get_target_values_from_sampled_actions(self, next_states_tiled, next_sampled_actions, goal_states_tiled, rewards, dones):
+    def _get_target_values_from_sampled_actions(self, next_states, next_sampled_actions, goal_states, rewards, dones):
         """
         Helper function to get target values for training Q-function with TD-loss. Update from superclass
         to account for distributional value functions.
 
         Args:
-            next_states_tiled (dict): next observations to use for sampling actions. Assumes that 
-                tiling has already occurred - so that if the batch size is B, and N samples are
-                desired for each observation in the batch, the leading dimension for each
-                observation in the dict is B * N
+            next_states (dict): batch of next observations
 
-            next_sampled_actions (torch.Tensor): actions sampled from the action sampler. This function
-                will maximize the critic over these action candidates (using the TD3 trick)
+            next_sampled_actions (torch.Tensor): actions sampled from the action sampler, with
+                @self.algo_config.critic.num_action_samples contiguous samples per observation. 
+                This function will maximize the critic over these action candidates
 
-            goal_states_tiled (dict): if not None, goal observations
+            goal_states (dict): if not None, batch of goal observations
 
             rewards (torch.Tensor): batch of rewards - should be shape (B, 1)
 
@@ -970,7 +1054,11 @@ class BCQ_Distributional(BCQ):
 
         with torch.no_grad():
             # compute expected returns of the sampled actions and maximize to find the best action
-            all_vds = self.nets["critic_target"][0].forward_train(next_states_tiled, next_sampled_actions, goal_states_tiled)
+            critic_target = self.nets["critic_target"][0]
+            all_vds = critic_target.forward_train(
+                None, next_sampled_actions, None,
+                feats=self._encode_and_tile(critic_target, next_states, goal_states, self.algo_config.critic.num_action_samples),
+            )
             expected_values = all_vds.mean().reshape(-1, self.algo_config.critic.num_action_samples)
             best_action_index = torch.argmax(expected_values, dim=1)
             all_actions = next_sampled_actions.reshape(-1, self.algo_config.critic.num_action_samples, self.ac_dim)
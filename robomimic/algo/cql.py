@@ -110,19 +110,32 @@ class CQL(PolicyAlgo, ValueAlgo):
         )
 
         # Critics
-        self.nets["critic"] = nn.ModuleList()
-        self.nets["critic_target"] = nn.ModuleList()
-        for _ in range(self.algo_config.critic.ensemble.n):
-            for net_list in (self.nets["critic"], self.nets["critic_target"]):
-                critic = ValueNets.ActionValueNetwork(
+        if self.algo_config.critic.ensemble.shared_encoder:
+            # a single module that encodes observations once and evaluates all ensemble members together
+            for k in ("critic", "critic_target"):
+                self.nets[k] = ValueNets.ActionValueEnsembleNetwork(
                     obs_shapes=self.obs_shapes,
                     ac_dim=self.ac_dim,
                     mlp_layer_dims=self.algo_config.critic.layer_dims,
+                    ensemble_size=self.algo_config.critic.ensemble.n,
                     value_bounds=self.algo_config.critic.value_bounds,
                     goal_shapes=self.goal_shapes,
                     encoder_kwargs=ObsUtils.obs_encoder_kwargs_from_config(self.obs_config.encoder),
                 )
-                net_list.append(critic)
+        else:
+            self.nets["critic"] = nn.ModuleList()
+            self.nets["critic_target"] = nn.ModuleList()
+            for _ in range(self.algo_config.critic.ensemble.n):
+                for net_list in (self.nets["critic"], self.nets["critic_target"]):
+                    critic = ValueNets.ActionValueNetwork(
+                        obs_shapes=self.obs_shapes,
+                        ac_dim=self.ac_dim,
+                        mlp_layer_dims=self.algo_config.critic.layer_dims,
+                        value_bounds=self.algo_config.critic.value_bounds,
+                        goal_shapes=self.goal_shapes,
+                        encoder_kwargs=ObsUtils.obs_encoder_kwargs_from_config(self.obs_config.encoder),
+                    )
+                    net_list.append(critic)
 
         # Entropy (if automatically tuning)
         if self.automatic_entropy_tuning:
@@ -137,11 +150,10 @@ class CQL(PolicyAlgo, ValueAlgo):
 
         # sync target networks at beginning of training
         with torch.no_grad():
-            for critic, critic_target in zip(self.nets["critic"], self.nets["critic_target"]):
-                TorchUtils.hard_update(
-                    source=critic,
-                    target=critic_target,
-                )
+            TorchUtils.hard_update(
+                source=self.nets["critic"],
+                target=self.nets["critic_target"],
+            )
 
     def _create_optimizers(self):
         """
@@ -239,6 +251,8 @@ class CQL(PolicyAlgo, ValueAlgo):
             actor_info = self._train_policy_on_batch(batch, epoch, validate)
             # Train critic(s)
             critic_info = self._train_critic_on_batch(batch, epoch, validate)
+            if not validate:
+                self.on_train_batch_end()
             # Update info
             info.update(super_info)
             info.update(actor_info)
@@ -282,25 +296,26 @@ class CQL(PolicyAlgo, ValueAlgo):
         """
         info = OrderedDict()
 
-        # Sample actions from policy and get log probs
-        dist = self.nets["actor"].forward_train(obs_dict=batch["obs"], goal_dict=batch["goal_obs"])
-        actions, log_prob = self._get_actions_and_log_prob(dist=dist)
+        with self.autocast():
+            # Sample actions from policy and get log probs
+            dist = self.nets["actor"].forward_train(obs_dict=batch["obs"], goal_dict=batch["goal_obs"])
+            actions, log_prob = self._get_actions_and_log_prob(dist=dist)
 
-        # Calculate alpha
-        entropy_weight_loss = -(self.log_entropy_weight * (log_prob + self.target_entropy).detach()).mean() if\
-            self.automatic_entropy_tuning else 0.0
-        entropy_weight = self.log_entropy_weight.exp()
+            # Calculate alpha
+            entropy_weight_loss = -(self.log_entropy_weight * (log_prob + self.target_entropy).detach()).mean() if\
+                self.automatic_entropy_tuning else 0.0
+            entropy_weight = self.log_entropy_weight.exp()
 
-        # Get predicted Q-values for all state, action pairs
-        pred_qs = [critic(obs_dict=batch["obs"], acts=actions, goal_dict=batch["goal_obs"])
-                   for critic in self.nets["critic"]]
-        # We take the minimum for stability
-        pred_qs, _ = torch.cat(pred_qs, dim=1).min(dim=1, keepdim=True)
+            # Get predicted Q-values for all state, action pairs
+            pred_qs = self._get_critic_qs(
+                obs_dict=batch["obs"], actions=actions.unsqueeze(1), goal_dict=batch["goal_obs"])     # shape (E, B, 1)
+            # We take the minimum for stability
+            pred_qs, _ = pred_qs.min(dim=0)
 
-        # Use BC if we're in the beginning of training, otherwise calculate policy loss normally
-        baseline = dist.log_prob(batch["actions"]).unsqueeze(dim=-1) if\
-            self._num_batch_steps < self.bc_start_steps else pred_qs
-        policy_loss = (entropy_weight * log_prob - baseline).mean()
+            # Use BC if we're in the beginning of training, otherwise calculate policy loss normally
+            baseline = dist.log_prob(batch["actions"]).unsqueeze(dim=-1) if\
+                self._num_batch_steps < self.bc_start_steps else pred_qs
+            policy_loss = (entropy_weight * log_prob - baseline).mean()
 
         # Add info
         info["entropy_weight"] = entropy_weight.item()
@@ -317,10 +332,10 @@ class CQL(PolicyAlgo, ValueAlgo):
                 self.optimizers["entropy"].zero_grad()
                 entropy_weight_loss.backward()
                 self.optimizers["entropy"].step()
-                info["entropy_grad_norms"] = self.log_entropy_weight.grad.data.norm(2).pow(2).item()
+                info["entropy_grad_norms"] = TorchUtils.grad_norm_squared(self.nets["log_entropy_weight"].parameters())
 
             # Policy
-            actor_grad_norms = TorchUtils.backprop_for_loss(
+            actor_grad_norms = self.backprop_for_loss(
                 net=self.nets["actor"],
                 optim=self.optimizers["actor"],
                 loss=policy_loss,
@@ -386,75 +401,73 @@ class CQL(PolicyAlgo, ValueAlgo):
         B, A = batch["actions"].shape
         N = self.algo_config.critic.num_random_actions
 
-        # Get predicted Q-values from taken actions
-        q_preds = [critic(obs_dict=batch["obs"], acts=batch["actions"], goal_dict=batch["goal_obs"])
-                   for critic in self.nets["critic"]]
-
-        # Sample actions at the current and next step
-        curr_dist = self.nets["actor"].forward_train(obs_dict=batch["obs"], goal_dict=batch["goal_obs"])
-        next_dist = self.nets["actor"].forward_train(obs_dict=batch["next_obs"], goal_dict=batch["goal_obs"])
-        next_actions, next_log_prob = self._get_actions_and_log_prob(dist=next_dist)
-
-        # Don't capture gradients here, since the critic target network doesn't get trained (only soft updated)
-        with torch.no_grad():
-            # We take the max over all samples if the number of action samples is > 1
-            if self.algo_config.critic.num_action_samples > 1:
-                # Generate the target q values, using the backup from the next state
-                temp_actions = next_dist.rsample(sample_shape=(self.algo_config.critic.num_action_samples,)).permute(1, 0, 2)
-                target_qs = [self._get_qs_from_actions(
-                    obs_dict=batch["next_obs"], actions=temp_actions, goal_dict=batch["goal_obs"], q_net=critic)
-                                 .max(dim=1, keepdim=True)[0] for critic in self.nets["critic_target"]]
-            else:
-                target_qs = [critic(obs_dict=batch["next_obs"], acts=next_actions, goal_dict=batch["goal_obs"])
-                             for critic in self.nets["critic_target"]]
-            # Take the minimum over all critics
-            target_qs, _ = torch.cat(target_qs, dim=1).min(dim=1, keepdim=True)
-            # If only sampled once from each critic and not using a deterministic backup, subtract the logprob as well
-            if self.algo_config.critic.num_action_samples == 1 and not self.deterministic_backup:
-                target_qs = target_qs - self.log_entropy_weight.exp() * next_log_prob
-
-            # Calculate the q target values
-            done_mask_batch = 1. - batch["dones"]
-            info["done_masks"] = done_mask_batch
-            q_target = batch["rewards"] + done_mask_batch * self.discount * target_qs
-
-        # Calculate CQL stuff
-        cql_random_actions = torch.FloatTensor(N, B, A).uniform_(-1., 1.).to(self.device)                           # shape (N, B, A)
-        cql_random_log_prob = np.log(0.5 ** A)
-        cql_curr_actions, cql_curr_log_prob = self._get_actions_and_log_prob(dist=curr_dist, sample_shape=(N,))     # shape (N, B, A) and (N, B, 1)
-        cql_next_actions, cql_next_log_prob = self._get_actions_and_log_prob(dist=next_dist, sample_shape=(N,))     # shape (N, B, A) and (N, B, 1)
-        cql_curr_log_prob = cql_curr_log_prob.squeeze(dim=-1).permute(1, 0).detach()                                # shape (B, N)
-        cql_next_log_prob = cql_next_log_prob.squeeze(dim=-1).permute(1, 0).detach()                                # shape (B, N)
-        q_cats = []     # Each entry shape will be (B, N)
-
-        for critic, q_pred in zip(self.nets["critic"], q_preds):
-            # Compose Q values over all sampled actions (importance sampled)
-            q_rand = self._get_qs_from_actions(obs_dict=batch["obs"], actions=cql_random_actions.permute(1, 0, 2), goal_dict=batch["goal_obs"], q_net=critic)
-            q_curr = self._get_qs_from_actions(obs_dict=batch["obs"], actions=cql_curr_actions.permute(1, 0, 2), goal_dict=batch["goal_obs"], q_net=critic)
-            q_next = self._get_qs_from_actions(obs_dict=batch["obs"], actions=cql_next_actions.permute(1, 0, 2), goal_dict=batch["goal_obs"], q_net=critic)
-            q_cat = torch.cat([
+        with self.autocast():
+            # Get predicted Q-values from taken actions
+            q_preds = self._get_critic_qs(
+                obs_dict=batch["obs"], actions=batch["actions"].unsqueeze(1), goal_dict=batch["goal_obs"])   # shape (E, B, 1)
+
+            # Sample actions at the current and next step
+            curr_dist = self.nets["actor"].forward_train(obs_dict=batch["obs"], goal_dict=batch["goal_obs"])
+            next_dist = self.nets["actor"].forward_train(obs_dict=batch["next_obs"], goal_dict=batch["goal_obs"])
+            next_actions, next_log_prob = self._get_actions_and_log_prob(dist=next_dist)
+
+            # Don't capture gradients here, since the critic target network doesn't get trained (only soft updated)
+            with torch.no_grad():
+                # We take the max over all samples if the number of action samples is > 1
+                if self.algo_config.critic.num_action_samples > 1:
+                    # Generate the target q values, using the backup from the next state
+                    temp_actions = next_dist.rsample(sample_shape=(self.algo_config.critic.num_action_samples,)).permute(1, 0, 2)
+                    target_qs = self._get_critic_qs(
+                        obs_dict=batch["next_obs"], actions=temp_actions, goal_dict=batch["goal_obs"], target=True,
+                    ).max(dim=2, keepdim=True)[0]
+                else:
+                    target_qs = self._get_critic_qs(
+                        obs_dict=batch["next_obs"], actions=next_actions.unsqueeze(1), goal_dict=batch["goal_obs"], target=True)
+                # Take the minimum over all critics
+                target_qs, _ = target_qs.min(dim=0)
+                # If only sampled once from each critic and not using a deterministic backup, subtract the logprob as well
+                if self.algo_config.critic.num_action_samples == 1 and not self.deterministic_backup:
+                    target_qs = target_qs - self.log_entropy_weight.exp() * next_log_prob
+
+                # Calculate the q target values
+                done_mask_batch = 1. - batch["dones"]
+                info["done_masks"] = done_mask_batch
+                q_target = batch["rewards"] + done_mask_batch * self.discount * target_qs
+
+            # Calculate CQL stuff
+            cql_random_actions = torch.FloatTensor(N, B, A).uniform_(-1., 1.).to(self.device)                           # shape (N, B, A)
+            cql_random_log_prob = np.log(0.5 ** A)
+            cql_curr_actions, cql_curr_log_prob = self._get_actions_and_log_prob(dist=curr_dist, sample_shape=(N,))     # shape (N, B, A) and (N, B, 1)
+            cql_next_actions, cql_next_log_prob = self._get_actions_and_log_prob(dist=next_dist, sample_shape=(N,))     # shape (N, B, A) and (N, B, 1)
+            cql_curr_log_prob = cql_curr_log_prob.squeeze(dim=-1).permute(1, 0).detach()                                # shape (B, N)
+            cql_next_log_prob = cql_next_log_prob.squeeze(dim=-1).permute(1, 0).detach()                                # shape (B, N)
+
+            # Compose Q values over all sampled actions (importance sampled), evaluating all sampled actions together
+            cql_actions = torch.cat([cql_random_actions, cql_curr_actions, cql_next_actions], dim=0).permute(1, 0, 2)  # shape (B, 3 * N, A)
+            q_rand, q_curr, q_next = self._get_critic_qs(
+                obs_dict=batch["obs"], actions=cql_actions, goal_dict=batch["goal_obs"]).split(N, dim=2)               # shape (E, B, N) each
+            q_cats = torch.cat([
                 q_rand - cql_random_log_prob,
                 q_next - cql_next_log_prob,
                 q_curr - cql_curr_log_prob,
-            ], dim=1)           # shape (B, 3 * N)
-            q_cats.append(q_cat)
-
-        # Calculate the losses for all critics
-        cql_losses = []
-        critic_losses = []
-        cql_weight = torch.clamp(self.log_cql_weight.exp(), min=0.0, max=1000000.0)
-        info["critic/cql_weight"] = cql_weight.item()
-        for i, (q_pred, q_cat) in enumerate(zip(q_preds, q_cats)):
-            # Calculate td error loss
-            td_loss = self.td_loss_fcn(q_pred, q_target)
-            # Calculate cql loss
-            cql_loss = cql_weight * (self.min_q_weight * (torch.logsumexp(q_cat, dim=1).mean() - q_pred.mean()) -
-                                     self.target_q_gap)
-            cql_losses.append(cql_loss)
-            # Calculate total loss
-            loss = td_loss + cql_loss
-            critic_losses.append(loss)
-            info[f"critic/critic{i+1}_loss"] = loss
+            ], dim=2)               # shape (E, B, 3 * N)
+
+            # Calculate the losses for all critics
+            cql_losses = []
+            critic_losses = []
+            cql_weight = torch.clamp(self.log_cql_weight.exp(), min=0.0, max=1000000.0)
+            info["critic/cql_weight"] = cql_weight.item()
+            for i, (q_pred, q_cat) in enumerate(zip(q_preds, q_cats)):
+                # Calculate td error loss
+                td_loss = self.td_loss_fcn(q_pred, q_target)
+                # Calculate cql loss
+                cql_loss = cql_weight * (self.min_q_weight * (torch.logsumexp(q_cat, dim=1).mean() - q_pred.mean()) -
+                                         self.target_q_gap)
+                cql_losses.append(cql_loss)
+                # Calculate total loss
+                loss = td_loss + cql_loss
+                critic_losses.append(loss)
+                info[f"critic/critic{i+1}_loss"] = loss
 
         # Run gradient descent if we're not validating
         if not validate:
@@ -466,14 +479,27 @@ class CQL(PolicyAlgo, ValueAlgo):
                 self.optimizers["cql"].zero_grad()
                 cql_weight_loss.backward(retain_graph=True)
                 self.optimizers["cql"].step()
-                info["critic/cql_grad_norms"] = self.log_cql_weight.grad.data.norm(2).pow(2).item()
+                info["critic/cql_grad_norms"] = TorchUtils.grad_norm_squared(self.nets["log_cql_weight"].parameters())
 
             # Train critics
-            for i, (critic_loss, critic, critic_target, optimizer) in enumerate(zip(
-                    critic_losses, self.nets["critic"], self.nets["critic_target"], self.optimizers["critic"]
+            if not isinstance(self.nets["critic"], nn.ModuleList):
+                # all ensemble members share one module and one optimizer
+                critic_grad_norms = self.backprop_for_loss(
+                    net=self.nets["critic"],
+                    optim=self.optimizers["critic"],
+                    loss=torch.stack(critic_losses).sum(),
+                    max_grad_norm=self.algo_config.critic.max_gradient_norm,
+                )
+                info["critic/grad_norms"] = critic_grad_norms
+                with torch.no_grad():
+                    TorchUtils.soft_update(source=self.nets["critic"], target=self.nets["critic_target"], tau=self.algo_config.target_tau)
+                return info
+
+            for i, (critic_loss, critic, optimizer) in enumerate(zip(
+                    critic_losses, self.nets["critic"], self.optimizers["critic"]
             )):
                 retain_graph = (i < (len(critic_losses) - 1))
-                critic_grad_norms = TorchUtils.backprop_for_loss(
+                critic_grad_norms = self.backprop_for_loss(
                     net=critic,
                     optim=optimizer,
                     loss=critic_loss,
@@ -481,8 +507,10 @@ class CQL(PolicyAlgo, ValueAlgo):
                     retain_graph=retain_graph,
                 )
                 info[f"critic/critic{i+1}_grad_norms"] = critic_grad_norms
-                with torch.no_grad():
-                    TorchUtils.soft_update(source=critic, target=critic_target, tau=self.algo_config.target_tau)
+
+            # update target networks (whole ensemble at once)
+            with torch.no_grad():
+                TorchUtils.soft_update(source=self.nets["critic"], target=self.nets["critic_target"], tau=self.algo_config.target_tau)
 
         # Return stats
         return info
@@ -510,6 +538,28 @@ class CQL(PolicyAlgo, ValueAlgo):
 
         return actions, log_prob
 
+    def _get_critic_qs(self, obs_dict, actions, goal_dict, target=False):
+        """
+        Helper function for evaluating all critics in the ensemble on multiple (N) sampled actions per state.
+
+        Args:
+            obs_dict (dict): Observation dict from batch
+            actions (tensor): Torch tensor of shape (B, N, A), with dim1 assumed to be the extra sampled dimension
+            goal_dict (dict): Goal dict from batch
+            target (bool): if True, evaluate the target critics instead
+
+        Returns:
+            tensor: (E, B, N) corresponding Q values for each of the E critics
+        """
+        critic = self.nets["critic_target" if target else "critic"]
+        if not isinstance(critic, nn.ModuleList):
+            # observations are encoded once and shared by all members and all sampled actions
+            return critic(obs_dict=obs_dict, acts=actions, goal_dict=goal_dict)
+        return torch.stack([
+            self._get_qs_from_actions(obs_dict=obs_dict, actions=actions, goal_dict=goal_dict, q_net=q_net)
+            for q_net in critic
+        ], dim=0)
+
     @staticmethod
     def _get_qs_from_actions(obs_dict, actions, goal_dict, q_net):
         """
@@ -556,7 +606,7 @@ class CQL(PolicyAlgo, ValueAlgo):
         for k in self.optimizers:
             keys = [k]
             optims = [self.optimizers[k]]
-            if k == "critic":
+            if isinstance(self.optimizers[k], list):
                 # account for critic having one optimizer per ensemble member
                 keys = ["{}{}".format(k, critic_ind) for critic_ind in range(len(self.nets["critic"]))]
                 optims = self.optimizers[k]
@@ -586,7 +636,9 @@ class CQL(PolicyAlgo, ValueAlgo):
         if "critic/q_targets" in info:
             loss_log["Critic/Q_Targets"] = info["critic/q_targets"].mean().item()
         loss_log["Loss"] = 0.
-        for critic_ind in range(len(self.nets["critic"])):
+        if "critic/grad_norms" in info:
+            loss_log["Critic/Grad_Norms"] = info["critic/grad_norms"]
+        for critic_ind in range(self.algo_config.critic.ensemble.n):
             loss_log["Critic/Critic{}_Loss".format(critic_ind + 1)] = info["critic/critic{}_loss".format(critic_ind + 1)].item()
             if "critic/critic{}_grad_norms".format(critic_ind + 1) in info:
                 loss_log["Critic/Critic{}_Grad_Norms".format(critic_ind + 1)] = info["critic/critic{}_grad_norms".format(critic_ind + 1)]
@@ -620,8 +672,7 @@ class CQL(PolicyAlgo, ValueAlgo):
         self.nets.train()
 
         # target networks always in eval
-        for critic in self.nets["critic_target"]:
-            critic.eval()
+        self.nets["critic_target"].eval()
 
     def on_epoch_end(self, epoch):
         """
@@ -629,7 +680,10 @@ class CQL(PolicyAlgo, ValueAlgo):
         """
 
         # LR scheduling updates
-        for lr_sc in self.lr_schedulers["critic"]:
+        critic_lr_schedulers = self.lr_schedulers["critic"]
+        if not isinstance(critic_lr_schedulers, list):
+            critic_lr_schedulers = [critic_lr_schedulers]
+        for lr_sc in critic_lr_schedulers:
             if lr_sc is not None:
                 lr_sc.step()
 
@@ -665,4 +719,6 @@ class CQL(PolicyAlgo, ValueAlgo):
         """
         assert not self.nets.training
 
+        if not isinstance(self.nets["critic"], nn.ModuleList):
+            return self.nets["critic"](obs_dict, actions, goal_dict)[0]
         return self.nets["critic"][0](obs_dict, actions, goal_dict)
@@ -14,7 +14,7 @@ import robomimic.utils.tensor_utils as TensorUtils
 import robomimic.utils.torch_utils as TorchUtils
 import robomimic.utils.obs_utils as ObsUtils
 
-from robomimic.algo import register_algo_factory_func, PlannerAlgo, ValueAlgo
+from robomimic.algo import register_algo_factory_func, merge_seq_fetch_indices, PlannerAlgo, ValueAlgo
 
 
 @register_algo_factory_func("gl")
@@ -95,6 +95,14 @@ class GL(PlannerAlgo):
 
         self.nets = self.nets.float().to(self.device)
 
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices). Only the first observation and the subgoal at
+        @self._subgoal_horizon are used.
+        """
+        return OrderedDict(obs=[0], next_obs=[self._subgoal_horizon - 1], actions=[])
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -111,9 +119,10 @@ class GL(PlannerAlgo):
         input_batch = dict()
 
         # remove temporal batches for all except scalar signals (to be compatible with model outputs)
-        input_batch["obs"] = { k: batch["obs"][k][:, 0, :] for k in batch["obs"] }
+        input_batch["obs"] = { k: batch["obs"][k][:, self._seq_index("obs", 0), :] for k in batch["obs"] }
         # extract multi-horizon subgoal target
-        input_batch["subgoals"] = {k: batch["next_obs"][k][:, self._subgoal_horizon - 1, :] for k in batch["next_obs"]}
+        subgoal_index = self._seq_index("next_obs", self._subgoal_horizon - 1)
+        input_batch["subgoals"] = {k: batch["next_obs"][k][:, subgoal_index, :] for k in batch["next_obs"]}
         input_batch["target_subgoals"] = input_batch["subgoals"]
         input_batch["goal_obs"] = batch.get("goal_obs", None) # goals may not be present
 
@@ -154,29 +163,31 @@ class GL(PlannerAlgo):
         with TorchUtils.maybe_no_grad(no_grad=validate):
             info = super(GL, self).train_on_batch(batch, epoch, validate=validate)
 
-            # predict subgoal observations with goal network
-            pred_subgoals = self.nets["goal_network"](obs=batch["obs"], goal=batch["goal_obs"])
-
-            # compute loss as L2 error for each observation key
-            losses = OrderedDict()
-            target_subgoals = batch["target_subgoals"]  # targets for network prediction
-            goal_loss = 0.
-            for k in pred_subgoals:
-                assert pred_subgoals[k].shape == target_subgoals[k].shape, "mismatch in predicted and target subgoals!"
-                mode_loss = nn.MSELoss()(pred_subgoals[k], target_subgoals[k])
-                goal_loss += mode_loss
-                losses["goal_{}_loss".format(k)] = mode_loss
-            losses["goal_loss"] = goal_loss
+            with self.autocast():
+                # predict subgoal observations with goal network
+                pred_subgoals = self.nets["goal_network"](obs=batch["obs"], goal=batch["goal_obs"])
+
+                # compute loss as L2 error for each observation key
+                losses = OrderedDict()
+                target_subgoals = batch["target_subgoals"]  # targets for network prediction
+                goal_loss = 0.
+                for k in pred_subgoals:
+                    assert pred_subgoals[k].shape == target_subgoals[k].shape, "mismatch in predicted and target subgoals!"
+                    mode_loss = nn.MSELoss()(pred_subgoals[k], target_subgoals[k])
+                    goal_loss += mode_loss
+                    losses["goal_{}_loss".format(k)] = mode_loss
+                losses["goal_loss"] = goal_loss
             info.update(TensorUtils.detach(losses))
 
             if not validate:
                 # gradient step
-                goal_grad_norms = TorchUtils.backprop_for_loss(
+                goal_grad_norms = self.backprop_for_loss(
                     net=self.nets["goal_network"],
                     optim=self.optimizers["goal_network"],
                     loss=losses["goal_loss"],
                 )
                 info["goal_grad_norms"] = goal_grad_norms
+                self.on_train_batch_end()
 
         return info
 
@@ -397,15 +408,16 @@ class GL_VAE(GL):
             target_subgoals = batch["target_subgoals"]  # targets for network prediction
             goal_obs = batch["goal_obs"]
 
-            vae_outputs = self.nets["goal_network"](
-                inputs=subgoals, # encoder takes full subgoals
-                outputs=target_subgoals, # reconstruct target subgoals
-                goals=goal_obs,
-                conditions=obs, # condition on observations
-            )
-            recons_loss = vae_outputs["reconstruction_loss"]
-            kl_loss = vae_outputs["kl_loss"]
-            goal_loss = recons_loss + self.algo_config.vae.kl_weight * kl_loss
+            with self.autocast():
+                vae_outputs = self.nets["goal_network"](
+                    inputs=subgoals, # encoder takes full subgoals
+                    outputs=target_subgoals, # reconstruct target subgoals
+                    goals=goal_obs,
+                    conditions=obs, # condition on observations
+                )
+                recons_loss = vae_outputs["reconstruction_loss"]
+                kl_loss = vae_outputs["kl_loss"]
+                goal_loss = recons_loss + self.algo_config.vae.kl_weight * kl_loss
             info["recons_loss"] = recons_loss
             info["kl_loss"] = kl_loss
             info["goal_loss"] = goal_loss
@@ -416,12 +428,13 @@ class GL_VAE(GL):
 
             # VAE gradient step
             if not validate:
-                goal_grad_norms = TorchUtils.backprop_for_loss(
+                goal_grad_norms = self.backprop_for_loss(
                     net=self.nets["goal_network"],
                     optim=self.optimizers["goal_network"],
                     loss=goal_loss,
                 )
                 info["goal_grad_norms"] = goal_grad_norms
+                self.on_train_batch_end()
 
         return info
 
@@ -482,17 +495,16 @@ class GL_VAE(GL):
             subgoals (dict): name -> Tensor [batch_size, num_samples, ...]
         """
 
-        # stack observations to get all samples in one forward pass
-        obs_tiled = ObsUtils.repeat_and_stack_observation(obs_dict, n=num_samples)
-        goal_tiled = None
-        if goal_dict is not None:
-            goal_tiled = ObsUtils.repeat_and_stack_observation(goal_dict, n=num_samples)
+        # encode observations once and tile the flat features to get all samples in one forward pass, 
+        # instead of encoding @num_samples copies of each observation
+        feats = self.nets["goal_network"].encode_condition_features(conditions=obs_dict, goals=goal_dict)
+        feats = TensorUtils.repeat_by_expand_at(feats, repeats=num_samples, dim=0)
 
         # VAE decode expects number of samples explicitly
-        mod = list(obs_tiled.keys())[0]
-        n = obs_tiled[mod].shape[0]
+        mod = list(obs_dict.keys())[0]
+        n = obs_dict[mod].shape[0] * num_samples
         # [batch_size * num_samples, ...]
-        goals = self.nets["goal_network"].decode(n=n, conditions=obs_tiled, goals=goal_tiled)
+        goals = self.nets["goal_network"].decode(n=n, feats=feats)
         # reshape to [batch_size, num_samples, ...]
         return TensorUtils.reshape_dimensions(goals, begin_axis=0, end_axis=0, target_dims=(-1, num_samples))
 
@@ -562,6 +574,25 @@ class ValuePlanner(PlannerAlgo, ValueAlgo):
 
         self.subgoal_shapes = self.planner.subgoal_shapes
 
+        # both components train on the same batches, so they need to agree on the fetched timesteps
+        self.set_seq_fetch_indices(self.get_seq_fetch_indices() if global_config.train.sparse_fetch else None)
+
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices), which are the timesteps used by either component.
+        """
+        return merge_seq_fetch_indices(self.planner.get_seq_fetch_indices(), self.value_net.get_seq_fetch_indices())
+
+    def set_seq_fetch_indices(self, fetch_indices):
+        """
+        Sets the timesteps that the dataset fetches for each key (see @Algo.set_seq_fetch_indices),
+        for this algorithm and both of its components.
+        """
+        super(ValuePlanner, self).set_seq_fetch_indices(fetch_indices)
+        self.planner.set_seq_fetch_indices(fetch_indices)
+        self.value_net.set_seq_fetch_indices(fetch_indices)
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -721,13 +752,15 @@ class ValuePlanner(PlannerAlgo, ValueAlgo):
         bsize = obs_dict[k].shape[0]
         subgoals_tiled = TensorUtils.reshape_dimensions(subgoals, begin_axis=0, end_axis=1, target_dims=(bsize * num_samples,))
 
-        # also repeat goals if necessary
-        goal_tiled = None
-        if len(self.planner.goal_shapes) > 0:
-            goal_tiled = ObsUtils.repeat_and_stack_observation(goal_dict, n=num_samples)
-
-        # evaluate the value of each subgoal
-        subgoal_values = self.value_net.get_state_value(obs_dict=subgoals_tiled, goal_dict=goal_tiled).reshape(-1, num_samples)
+        # evaluate the value of each subgoal - the value network encodes each goal once and
+        # tiles the goal features across the @num_samples subgoals for that goal
+        if len(self.planner.goal_shapes) == 0:
+            goal_dict = None
+        subgoal_values = self.value_net.get_state_value(
+            obs_dict=subgoals_tiled,
+            goal_dict=goal_dict,
+            goal_repeats=num_samples,
+        ).reshape(-1, num_samples)
 
         # pick the best subgoal
         best_index = torch.argmax(subgoal_values, dim=1)
@@ -15,7 +15,7 @@ import torch
 import robomimic.utils.tensor_utils as TensorUtils
 import robomimic.utils.obs_utils as ObsUtils
 from robomimic.config.config import Config
-from robomimic.algo import register_algo_factory_func, algo_name_to_factory_func, HierarchicalAlgo, GL_VAE
+from robomimic.algo import register_algo_factory_func, algo_name_to_factory_func, merge_seq_fetch_indices, HierarchicalAlgo, GL_VAE
 
 
 @register_algo_factory_func("hbc")
@@ -126,6 +126,29 @@ class HBC(HierarchicalAlgo):
             device=device,
         )
 
+        # planner and actor train on the same batches, so they need to agree on the fetched timesteps
+        self.set_seq_fetch_indices(self.get_seq_fetch_indices() if global_config.train.sparse_fetch else None)
+
+    def get_seq_fetch_indices(self):
+        """
+        Declares the timesteps of each dataset sequence that @process_batch_for_training consumes
+        (see @Algo.get_seq_fetch_indices), which are the timesteps used by either the planner or the actor.
+        """
+        fetch_indices = merge_seq_fetch_indices(self.planner.get_seq_fetch_indices(), self.actor.get_seq_fetch_indices())
+        if self.algo_config.actor_use_random_subgoals and (fetch_indices is not None):
+            # random subgoals can be any next observation in the sequence
+            fetch_indices.pop("next_obs", None)
+        return fetch_indices
+
+    def set_seq_fetch_indices(self, fetch_indices):
+        """
+        Sets the timesteps that the dataset fetches for each key (see @Algo.set_seq_fetch_indices),
+        for this algorithm, the planner, and the actor.
+        """
+        super(HBC, self).set_seq_fetch_indices(fetch_indices)
+        self.planner.set_seq_fetch_indices(fetch_indices)
+        self.actor.set_seq_fetch_indices(fetch_indices)
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
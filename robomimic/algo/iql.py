@@ -152,10 +152,11 @@ class IQL(PolicyAlgo, ValueAlgo):
             # Always run super call first
             info = super().train_on_batch(batch, epoch, validate=validate)
 
-            # Compute loss for critic(s)
-            critic_losses, vf_loss, critic_info = self._compute_critic_loss(batch)
-            # Compute loss for actor
-            actor_loss, actor_info = self._compute_actor_loss(batch, critic_info)
+            with self.autocast():
+                # Compute loss for critic(s)
+                critic_losses, vf_loss, critic_info = self._compute_critic_loss(batch)
+                # Compute loss for actor
+                actor_loss, actor_info = self._compute_actor_loss(batch, critic_info)
 
             if not validate:
                 # Critic update
@@ -164,6 +165,8 @@ class IQL(PolicyAlgo, ValueAlgo):
                 # Actor update
                 self._update_actor(actor_loss)
 
+                self.on_train_batch_end()
+
             # Update info
             info.update(actor_info)
             info.update(critic_info)
@@ -245,10 +248,10 @@ class IQL(PolicyAlgo, ValueAlgo):
         """
 
         # update ensemble of critics
-        for (critic_loss, critic, critic_target, optimizer) in zip(
-                critic_losses, self.nets["critic"], self.nets["critic_target"], self.optimizers["critic"]
+        for (critic_loss, critic, optimizer) in zip(
+                critic_losses, self.nets["critic"], self.optimizers["critic"]
         ):
-            TorchUtils.backprop_for_loss(
+            self.backprop_for_loss(
                 net=critic,
                 optim=optimizer,
                 loss=critic_loss,
@@ -256,12 +259,12 @@ class IQL(PolicyAlgo, ValueAlgo):
                 retain_graph=False,
             )
 
-            # update target network
-            with torch.no_grad():
-                TorchUtils.soft_update(source=critic, target=critic_target, tau=self.algo_config.target_tau)
+        # update target networks (whole ensemble at once)
+        with torch.no_grad():
+            TorchUtils.soft_update(source=self.nets["critic"], target=self.nets["critic_target"], tau=self.algo_config.target_tau)
 
         # update V function network
-        TorchUtils.backprop_for_loss(
+        self.backprop_for_loss(
             net=self.nets["vf"],
             optim=self.optimizers["vf"],
             loss=vf_loss,
@@ -320,7 +323,7 @@ class IQL(PolicyAlgo, ValueAlgo):
             actor_loss (torch.Tensor): actor loss
         """
 
-        TorchUtils.backprop_for_loss(
+        self.backprop_for_loss(
             net=self.nets["actor"],
             optim=self.optimizers["actor"],
             loss=actor_loss,
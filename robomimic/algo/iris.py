@@ -122,6 +122,9 @@ class IRIS(HBC, ValueAlgo):
             device=device
         )
 
+        # planner and actor train on the same batches, so they need to agree on the fetched timesteps
+        self.set_seq_fetch_indices(self.get_seq_fetch_indices() if global_config.train.sparse_fetch else None)
+
     def process_batch_for_training(self, batch):
         """
         Processes input batch from a data loader to filter out
@@ -227,28 +227,30 @@ class TD3_BC(PolicyAlgo, ValueAlgo):
         done_mask_batch = 1. - batch["dones"]
         info["done_masks"] = done_mask_batch
 
-        # Bellman backup for Q-targets
-        q_targets = self._get_target_values(
-            next_states=ns_batch, 
-            goal_states=goal_s_batch, 
-            rewards=r_batch, 
-            dones=done_mask_batch,
-        )
+        with self.autocast():
+            # Bellman backup for Q-targets
+            q_targets = self._get_target_values(
+                next_states=ns_batch, 
+                goal_states=goal_s_batch, 
+                rewards=r_batch, 
+                dones=done_mask_batch,
+            )
         info["critic/q_targets"] = q_targets
 
         # Train all critics using this set of targets for regression
         for critic_ind, critic in enumerate(self.nets["critic"]):
-            critic_loss = self._compute_critic_loss(
-                critic=critic, 
-                states=s_batch, 
-                actions=a_batch, 
-                goal_states=goal_s_batch, 
-                q_targets=q_targets,
-            )
+            with self.autocast():
+                critic_loss = self._compute_critic_loss(
+                    critic=critic, 
+                    states=s_batch, 
+                    actions=a_batch, 
+                    goal_states=goal_s_batch, 
+                    q_targets=q_targets,
+                )
             info["critic/critic{}_loss".format(critic_ind + 1)] = critic_loss
 
             if not no_backprop:
-                critic_grad_norms = TorchUtils.backprop_for_loss(
+                critic_grad_norms = self.backprop_for_loss(
                     net=self.nets["critic"][critic_ind],
                     optim=self.optimizers["critic"][critic_ind],
                     loss=critic_loss, 
@@ -284,15 +286,16 @@ class TD3_BC(PolicyAlgo, ValueAlgo):
         a_batch = batch["actions"]
         goal_s_batch = batch["goal_obs"]
 
-        # lambda mixture weight is combination of hyperparameter (alpha) and Q-value normalization
-        actor_actions = self.nets["actor"](s_batch, goal_s_batch)
-        Q_values = self.nets["critic"][0](s_batch, actor_actions, goal_s_batch)
-        lam = self.algo_config.alpha / Q_values.abs().mean().detach()
-        actor_loss = -lam * Q_values.mean() + nn.MSELoss()(actor_actions, a_batch)
+        with self.autocast():
+            # lambda mixture weight is combination of hyperparameter (alpha) and Q-value normalization
+            actor_actions = self.nets["actor"](s_batch, goal_s_batch)
+            Q_values = self.nets["critic"][0](s_batch, actor_actions, goal_s_batch)
+            lam = self.algo_config.alpha / Q_values.abs().mean().detach()
+            actor_loss = -lam * Q_values.mean() + nn.MSELoss()(actor_actions, a_batch)
         info["actor/loss"] = actor_loss
 
         if not no_backprop:
-            actor_grad_norms = TorchUtils.backprop_for_loss(
+            actor_grad_norms = self.backprop_for_loss(
                 net=self.nets["actor"],
                 optim=self.optimizers["actor"],
                 loss=actor_loss,
@@ -407,17 +410,19 @@ class TD3_BC(PolicyAlgo, ValueAlgo):
                 )
             info.update(actor_info)
 
+            if not validate:
+                self.on_train_batch_end()
+
             if not no_actor_backprop:
                 # to match original implementation, only update target networks on 
                 # actor gradient steps
                 with torch.no_grad():
-                    # update the target critic networks
-                    for critic_ind in range(len(self.nets["critic"])):
-                        TorchUtils.soft_update(
-                            source=self.nets["critic"][critic_ind], 
-                            target=self.nets["critic_target"][critic_ind], 
-                            tau=self.algo_config.target_tau,
-                        )
+                    # update the target critic networks (whole ensemble at once)
+                    TorchUtils.soft_update(
+                        source=self.nets["critic"], 
+                        target=self.nets["critic_target"], 
+                        tau=self.algo_config.target_tau,
+                    )
 
                     # update target actor network
                     TorchUtils.soft_update(
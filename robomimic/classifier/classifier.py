@@ -59,6 +59,11 @@ class TrajectoryClassifier(nn.Module):
         self.checkpoint = True
 
 class MultiTrajectoryDataset(Dataset):
+    """
+    Windows of (state, action) pairs from a set of trajectories, labeled with the result of the
+    trajectory they come from. States and zero-padded actions of all trajectories are stored once
+    in contiguous tensors, and windows are served as strided views of them (see @get_batch).
+    """
     def __init__(self, all_states, all_actions, all_results, trajectory_lengths, num_past=5, num_future=5, mode='train'):
         self.all_states = all_states
         self.all_actions = all_actions
@@ -67,69 +72,113 @@ class MultiTrajectoryDataset(Dataset):
         self.num_past = num_past
         self.num_future = num_future
         self.mode = mode
+
+        # Adjust number of past and future pairs based on the mode
+        if self.mode == 'inference':
+            self._window_past = self.num_past + self.num_future
+            self._window_future = 0
+        else:
+            self._window_past = self.num_past
+            self._window_future = self.num_future
+
+        self._build_flat_tensors()
         self.indices = self._generate_indices()
 
-    def _generate_indices(self):
-        indices = []
-        start_idx = 0
-        
-        for traj_idx, traj_length in enumerate(self.trajectory_lengths):
-            for i in range(self.num_past, traj_length - self.num_future):
-                indices.append((traj_idx, start_idx + i))
-            start_idx += traj_length
+        # [num_windows, state_dim, window] views over the flat tensors, indexed by window start. The
+        # tensors are left-padded with @_window_past rows of zeros, so that windows that start before
+        # the first timestep (only possible in inference mode) can be batched as well.
+        self._state_windows = self._unfold(self._left_pad(self._states), self._window_past + 1)
+        self._action_windows = self._unfold(self._left_pad(self._actions), self._window_past + self._window_future + 1)
+
+    def _left_pad(self, x):
+        """
+        Prepend @_window_past rows of zeros to @x.
+        """
+        return torch.cat((x.new_zeros((self._window_past, x.shape[1])), x), dim=0)
+
+    @staticmethod
+    def _unfold(x, size):
+        """
+        Strided view of all windows of @size consecutive rows of @x, of shape [num_windows, dim, size].
+        """
+        if x.shape[0] < size:
+            return x.new_zeros((0, x.shape[1], size))
+        return x.unfold(0, size, 1)
+
+    def _build_flat_tensors(self):
+        """
+        Concatenate states, actions zero-padded to the state dimension, and per-trajectory results into tensors.
+        """
+        if len(self.all_states) == 0:
+            self._states = torch.zeros(0, 0)
+            self._actions = torch.zeros(0, 0)
+        else:
+            self._states = torch.from_numpy(np.asarray(self.all_states, dtype=np.float32))
+            actions = np.asarray(self.all_actions, dtype=np.float32)
+            self._actions = F.pad(torch.from_numpy(actions), (0, self._states.shape[1] - actions.shape[1]))
+        self._results = torch.tensor(np.asarray(self.all_results, dtype=np.float32).reshape(-1))
 
-        return indices
+    def _generate_indices(self):
+        """
+        Returns an array of shape [num_windows, 2] with the trajectory index and the flat index of
+        the current timestep of every window that fits in its trajectory.
+        """
+        lengths = np.asarray(self.trajectory_lengths, dtype=np.int64).reshape(-1)
+        traj_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        counts = np.maximum(lengths - self.num_past - self.num_future, 0)
+
+        traj_inds = np.repeat(np.arange(len(lengths)), counts)
+        # position of each window within its trajectory's windows
+        window_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        current_inds = traj_starts[traj_inds] + self.num_past + window_offsets
+        return np.stack([traj_inds, current_inds], axis=1)
+
+    def get_batch_sampler(self, batch_size, shuffle=True, drop_last=False):
+        """
+        Return a torch.utils.data.BatchSampler that yields lists of indices. Pass it as the sampler of a
+        DataLoader with batch_size=None, so that each batch is built by a single call to @get_batch.
+        """
+        sampler = torch.utils.data.RandomSampler(self) if shuffle else torch.utils.data.SequentialSampler(self)
+        return torch.utils.data.BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
 
     def __len__(self):
         return len(self.indices)
 
+    def get_batch(self, indices):
+        """
+        Fetch a batch of windows at once. Windows that start before the first timestep are
+        left-padded with zeros, so all windows have the same length.
+
+        Args:
+            indices (list or np.array): dataset indices
+
+        Returns:
+            state_action_seq (torch.Tensor): tensor of shape [B, state_dim, window], where the window
+                holds the past and current states followed by the past, current, and future actions
+
+            result_tensor (torch.Tensor): trajectory results of shape [B]
+        """
+        rows = self.indices[np.asarray(indices, dtype=np.int64)]
+        # window start in the left-padded tensors
+        window_starts = torch.from_numpy(rows[:, 1])
+        state_action_seq = torch.cat((self._state_windows[window_starts], self._action_windows[window_starts]), dim=-1)
+        return state_action_seq, self._results[torch.from_numpy(rows[:, 0])]
+
     def __getitem__(self, idx):
+        if isinstance(idx, (list, tuple, np.ndarray)):
+            # a whole batch of indices (see @get_batch_sampler)
+            return self.get_batch(idx)
+
         traj_idx, current_idx = self.indices[idx]
-        
-        # Adjust number of past and future pairs based on the mode
-        if self.mode == 'inference':
-            num_past = self.num_past + self.num_future
-            num_future = 0
-        else:
-            num_past = self.num_past
-            num_future = self.num_future
 
         # Calculate the start and end indices for the window
-        window_start_idx = max(0, current_idx - num_past)
+        window_start_idx = max(0, current_idx - self._window_past)
         window_end_idx = current_idx + 1  # Include current observation
+        action_end_idx = current_idx + self._window_future + 1
 
-        # Get past observations + current observation
-        states_window = self.all_states[window_start_idx:window_end_idx]
-        current_state = torch.tensor(self.all_states[current_idx], dtype=torch.float32)  
-
-        # Get actions: past actions + current action + future actions
-        action_start_idx = max(0, current_idx - num_past)
-        action_end_idx = current_idx + num_future + 1
-        actions_window = self.all_actions[action_start_idx:action_end_idx]
-
-        # Padding actions to match the observation dimensions
-        padded_actions = []
-        for action in actions_window:
-            action_pad = torch.zeros_like(current_state)  # Match observation dimension
-            action_pad[:len(action)] = torch.tensor(action, dtype=torch.float32)
-            padded_actions.append(action_pad)
-        
-        # Convert windows to tensors
-        states_array = np.array(states_window, dtype=np.float32)
-        # Convert to tensor
-        states_tensor = torch.tensor(states_array, dtype=torch.float32)
-
-        padded_actions_np = [np.array(action, dtype=np.float32) for action in padded_actions]
-        actions_tensor = torch.tensor(np.stack(padded_actions_np, axis=0))
-
-        states_tensor = states_tensor.transpose(0, 1)
-        actions_tensor = actions_tensor.transpose(0, 1)
-
-        # Concatenate states and padded actions
+        # Concatenate past and current states with past, current, and future padded actions
+        states_tensor = self._states[window_start_idx:window_end_idx].transpose(0, 1)
+        actions_tensor = self._actions[window_start_idx:action_end_idx].transpose(0, 1)
         state_action_seq = torch.cat((states_tensor, actions_tensor), dim=-1)
 
-        # Get the result associated with the trajectory
-        result = self.all_results[traj_idx]
-        result_tensor = torch.tensor(result, dtype=torch.float32)  # Assuming result is a scalar
-
-        return state_action_seq, result_tensor
+        return state_action_seq, self._results[traj_idx]
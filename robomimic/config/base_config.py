@@ -96,6 +96,7 @@ class BaseConfig(Config):
         self.experiment.logging.log_tb = True                       # enable tensorboard logging
         self.experiment.logging.log_wandb = False                   # enable wandb logging
         self.experiment.logging.wandb_proj_name = "debug"           # project name if using wandb
+        self.experiment.logging.log_every_n_steps = 1               # summarize training info for logging every n gradient steps (fewer device syncs)
 
 
         ## save config - if and when to save model checkpoints ##
@@ -130,6 +131,7 @@ class BaseConfig(Config):
         self.experiment.rollout.rate = 50                           # do rollouts every @rate epochs
         self.experiment.rollout.warmstart = 0                       # number of epochs to wait before starting rollouts
         self.experiment.rollout.terminate_on_success = True         # end rollout early after task success
+        self.experiment.rollout.num_envs = 1                        # if > 1, step this many env copies in subprocesses and batch policy calls
 
     def train_config(self):
         """
@@ -155,15 +157,26 @@ class BaseConfig(Config):
         # num workers for loading data - generally set to 0 for low-dim datasets, and 2 for image datasets
         self.train.num_data_workers = 0  
 
-        # One of ["all", "low_dim", or None]. Set to "all" to cache entire hdf5 in memory - this is 
-        # by far the fastest for data loading. Set to "low_dim" to cache all non-image data. Set
-        # to None to use no caching - in this case, every batch sample is retrieved via file i/o.
-        # You should almost never set this to None, even for large image datasets.
+        # One of ["all", "low_dim", "mmap", or None]. Set to "all" to cache entire hdf5 in memory - this is 
+        # by far the fastest for data loading. Set to "low_dim" to cache all non-image data. Set to "mmap"
+        # to pack each key into one contiguous memory-mapped array on disk that is shared by all data loader
+        # workers through the OS page cache (useful for large image datasets). Set to None to use no 
+        # caching - in this case, every batch sample is retrieved via file i/o. You should almost never 
+        # set this to None, even for large image datasets.
         self.train.hdf5_cache_mode = "all"
 
+        # directory for the memory-mapped arrays used by the "mmap" cache mode. If None, a sidecar
+        # directory is created next to the hdf5 file.
+        self.train.hdf5_mmap_cache_dir = None
+
         # used for parallel data loading
         self.train.hdf5_use_swmr = True
 
+        # if true, cache demo lengths, observation shapes, and observation normalization statistics on disk
+        # (keyed by dataset path, size, and modification time), so that repeated runs on the same dataset
+        # don't need to re-scan the whole file. See utils/cache_utils.py and scripts/dataset_metadata_cache.py
+        self.train.hdf5_use_metadata_cache = False
+
         # whether to load "next_obs" group from hdf5 - only needed for batch / offline RL algorithms
         self.train.hdf5_load_next_obs = True
 
@@ -172,6 +185,33 @@ class BaseConfig(Config):
         # in utils/dataset.py for more information.
         self.train.hdf5_normalize_obs = False
 
+        # if true, read precomputed features of frozen pretrained visual backbones (written into the hdf5 by
+        # scripts/extract_visual_features.py) in place of rgb observations. Observation encoders detect these
+        # features and only run the layers after the backbone, while rollouts still encode raw images.
+        self.train.hdf5_use_visual_features = False
+
+        # number of worker processes used to compute the observation normalization statistics above. Each
+        # worker processes a shard of the demonstrations with its own file handle. Set to 0 to compute them
+        # in the main process.
+        self.train.hdf5_normalize_obs_num_workers = 0
+
+        # if true, the data loader fetches a whole batch of indices from the dataset at once (see
+        # SequenceDataset.get_items and SequenceDataset.get_batch_sampler) instead of fetching samples
+        # one at a time and collating them, and in-memory caches are packed into one contiguous array per key
+        self.train.batched_fetch = False
+
+        # if true, the dataset only fetches the timesteps of each sequence that the algorithm consumes (for
+        # example, only the first observation and the last next observation for GL), instead of the full
+        # sequence for every key. Each algorithm declares these timesteps in Algo.get_seq_fetch_indices, and
+        # fetched sequences only contain the declared timesteps (see SequenceDataset)
+        self.train.sparse_fetch = False
+
+        # if true, batches are pinned and copied to the training device on a separate stream one step ahead,
+        # so that host-to-device transfers overlap with training compute (see TrainUtils.DevicePrefetcher).
+        # If @prefetch_uint8_to_float is also true, uint8 data (such as images) is converted to float on the device.
+        self.train.prefetch_to_device = False
+        self.train.prefetch_uint8_to_float = True
+
         # if provided, use the list of demo keys under the hdf5 group "mask/@hdf5_filter_key" for training, instead 
         # of the full dataset. This provides a convenient way to train on only a subset of the trajectories in a dataset.
         self.train.hdf5_filter_key = None
@@ -205,6 +245,17 @@ class BaseConfig(Config):
         self.train.num_epochs = 2000    # number of training epochs
         self.train.seed = 1             # seed for training (for reproducibility)
 
+        # mixed precision - if enabled, forward passes and losses in each algo's train_on_batch run under
+        # torch.autocast, and float16 losses are scaled to avoid gradient underflow (the scaler state is
+        # saved in checkpoints). dtype is one of ["auto", "float16", "bfloat16"] - "auto" uses float16 on
+        # GPU and bfloat16 on CPU.
+        self.train.amp.enabled = False
+        self.train.amp.dtype = "auto"
+
+        # if true, convolution weights (such as those of ResNet18Conv in visual encoders) use the channels-last
+        # memory format, which lets convolutions use faster kernels on GPU, especially with mixed precision
+        self.train.channels_last = False
+
     def algo_config(self):
         """
         This function populates the `config.algo` attribute of the config, and is given to the 
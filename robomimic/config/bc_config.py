@@ -105,3 +105,5 @@ class BCConfig(BaseConfig):
         self.algo.transformer.activation = "gelu"                   # activation function for MLP in Transformer Block
         self.algo.transformer.supervise_all_steps = False           # if true, supervise all intermediate actions, otherwise only final one
         self.algo.transformer.nn_parameter_for_timesteps = True     # if true, use nn.Parameter otherwise use nn.Embedding
+        self.algo.transformer.attention_backend = "auto"            # self-attention implementation - "sdpa" (fused kernel), "math" (explicit mask and softmax), or "auto"
+        self.algo.transformer.incremental_inference = False         # if true, cache per-timestep encoder features across rollout steps and only decode the final timestep
@@ -78,5 +78,6 @@ class CQLConfig(BaseConfig):
 
         # critic ensemble parameters (TD3 trick)
         self.algo.critic.ensemble.n = 2                                     # number of Q networks in the ensemble
+        self.algo.critic.ensemble.shared_encoder = False                    # if True, ensemble members share one observation encoder and are evaluated together
 
         self.algo.critic.layer_dims = (300, 400)                            # critic MLP layer dimensions
@@ -0,0 +1,145 @@
+"""
+Vectorized environment that steps several copies of an environment in subprocess workers,
+so that rollouts can batch observations from all copies into a single policy forward pass
+(see @TrainUtils.run_vectorized_rollouts).
+"""
+import traceback
+import multiprocessing
+
+
+def _worker(remote, parent_remote, env_fn):
+    """
+    Worker process loop. Creates an environment with @env_fn and serves method calls on it
+    until asked to close.
+    """
+    parent_remote.close()
+    env = env_fn()
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "close":
+                break
+            try:
+                if cmd == "getattr":
+                    result = getattr(env, data)
+                else:
+                    args, kwargs = data
+                    result = getattr(env, cmd)(*args, **kwargs)
+                remote.send(("ok", result))
+            except Exception as e:
+                try:
+                    is_rollout_exception = isinstance(e, env.rollout_exceptions)
+                except Exception:
+                    is_rollout_exception = False
+                if is_rollout_exception:
+                    # unstable simulation - the caller ends this episode
+                    remote.send(("rollout_exception", e))
+                else:
+                    remote.send(("error", traceback.format_exc()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class SubprocVectorEnv(object):
+    """
+    Steps several environment copies in subprocess workers. Each method takes an optional
+    list of environment indices, so that copies whose episode already ended can be skipped.
+    Commands are sent to all requested workers before any reply is read, so the workers
+    run in parallel.
+    """
+    def __init__(self, env_fns, start_method="spawn"):
+        """
+        Args:
+            env_fns (list): list of picklable callables that each create an environment
+                (EnvBase or EnvWrapper instance) inside a worker process
+
+            start_method (str): multiprocessing start method. Defaults to spawn, so that
+                workers do not inherit renderer contexts from this process.
+        """
+        ctx = multiprocessing.get_context(start_method)
+        self.num_envs = len(env_fns)
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(self.num_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(work_remotes, self.remotes, env_fns):
+            p = ctx.Process(target=_worker, args=(work_remote, remote, env_fn), daemon=True)
+            p.start()
+            self.processes.append(p)
+            work_remote.close()
+        self.closed = False
+        self.name = self.getattr("name", env_inds=[0])[0]
+
+    def _env_inds(self, env_inds):
+        return list(range(self.num_envs)) if env_inds is None else [int(i) for i in env_inds]
+
+    def _recv(self, env_inds, allow_rollout_exceptions=False):
+        results = []
+        for i in env_inds:
+            status, result = self.remotes[i].recv()
+            if status == "error":
+                raise RuntimeError("SubprocVectorEnv: error in worker {}:\n{}".format(i, result))
+            if (status == "rollout_exception") and (not allow_rollout_exceptions):
+                raise result
+            results.append(result)
+        return results
+
+    def call(self, method, *args, env_inds=None, **kwargs):
+        """
+        Call @method on each requested environment and return the list of results.
+        """
+        env_inds = self._env_inds(env_inds)
+        for i in env_inds:
+            self.remotes[i].send((method, (args, kwargs)))
+        return self._recv(env_inds)
+
+    def getattr(self, attr, env_inds=None):
+        """
+        Get attribute @attr from each requested environment.
+        """
+        env_inds = self._env_inds(env_inds)
+        for i in env_inds:
+            self.remotes[i].send(("getattr", attr))
+        return self._recv(env_inds)
+
+    def reset(self, env_inds=None):
+        return self.call("reset", env_inds=env_inds)
+
+    def get_goal(self, env_inds=None):
+        return self.call("get_goal", env_inds=env_inds)
+
+    def is_success(self, env_inds=None):
+        return self.call("is_success", env_inds=env_inds)
+
+    def render(self, env_inds=None, **kwargs):
+        return self.call("render", env_inds=env_inds, **kwargs)
+
+    def step(self, actions, env_inds=None):
+        """
+        Step each requested environment with its action.
+
+        Args:
+            actions (list or np.array): one action per entry of @env_inds
+            env_inds (list): indices of environments to step. Defaults to all.
+
+        Returns:
+            results (list): one (obs, reward, done, info) tuple per entry of @env_inds, or
+                the exception instance if the environment raised one of its rollout exceptions
+        """
+        env_inds = self._env_inds(env_inds)
+        assert len(actions) == len(env_inds)
+        for i, ac in zip(env_inds, actions):
+            self.remotes[i].send(("step", ((ac,), {})))
+        return self._recv(env_inds, allow_rollout_exceptions=True)
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for p in self.processes:
+            p.join()
+        self.closed = True
+
+    def __repr__(self):
+        return "SubprocVectorEnv(name={}, num_envs={})".format(self.name, self.num_envs)
@@ -8,6 +8,10 @@ DEBUG = False
 # Whether to visualize the before & after of an observation randomizer
 VISUALIZE_RANDOMIZER = False
 
+# Root directory for cached dataset metadata and observation normalization statistics
+# (see utils/cache_utils.py)
+DATASET_METADATA_CACHE_DIR = "~/.cache/robomimic/dataset_metadata"
+
 # wandb entity (eg. username or team name)
 WANDB_ENTITY = "ellina-zhang0827"
 
@@ -60,6 +60,9 @@ def transformer_args_from_config(transformer_config):
     if "num_layers" in transformer_config:
         transformer_args["transformer_num_layers"] = transformer_config.num_layers
 
+    if "attention_backend" in transformer_config:
+        transformer_args["transformer_attention_backend"] = transformer_config.attention_backend
+
     return transformer_args
 
 
@@ -496,6 +499,7 @@ class ResNet18Conv(ConvBase):
         input_channel=3,
         pretrained=False,
         input_coord_conv=False,
+        freeze=False,
     ):
         """
         Args:
@@ -505,6 +509,7 @@ class ResNet18Conv(ConvBase):
             pretrained (bool): if True, load pretrained weights for all ResNet layers.
             input_coord_conv (bool): if True, use a coordinate convolution for the first layer
                 (a convolution where input channels are modified to encode spatial pixel location)
+            freeze (bool): if True, freeze all ResNet layers (including batch norm statistics) during training.
         """
         super(ResNet18Conv, self).__init__()
         net = vision_models.resnet18(pretrained=pretrained)
@@ -517,7 +522,13 @@ class ResNet18Conv(ConvBase):
         # cut the last fc layer
         self._input_coord_conv = input_coord_conv
         self._input_channel = input_channel
-        self.nets = torch.nn.Sequential(*(list(net.children())[:-2]))
+        self._pretrained = pretrained
+        self._freeze = freeze
+        self.nets = Sequential(*(list(net.children())[:-2]), has_output_shape=False)
+        if freeze:
+            self.nets.freeze()
+            for param in self.nets.parameters():
+                param.requires_grad = False
 
     def output_shape(self, input_shape):
         """
@@ -539,7 +550,8 @@ class ResNet18Conv(ConvBase):
     def __repr__(self):
         """Pretty print network."""
         header = '{}'.format(str(self.__class__.__name__))
-        return header + '(input_channel={}, input_coord_conv={})'.format(self._input_channel, self._input_coord_conv)
+        return header + '(input_channel={}, input_coord_conv={}, pretrained={}, freeze={})'.format(
+            self._input_channel, self._input_coord_conv, self._pretrained, self._freeze)
 
 
 class R3MConv(ConvBase):
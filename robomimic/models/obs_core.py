@@ -106,6 +106,7 @@ class VisualCore(EncoderCore, BaseNets.ConvBase):
         assert isinstance(self.backbone, BaseNets.ConvBase)
 
         feat_shape = self.backbone.output_shape(input_shape)
+        self.backbone_feature_shape = list(feat_shape)
         net_list = [self.backbone]
 
         # maybe make pool net
@@ -171,6 +172,32 @@ class VisualCore(EncoderCore, BaseNets.ConvBase):
         assert tuple(inputs.shape)[-ndim:] == tuple(self.input_shape)
         return super(VisualCore, self).forward(inputs)
 
+    @property
+    def has_frozen_backbone(self):
+        """
+        Whether the backbone is a frozen pretrained network, so that its features for each
+        image never change and can be precomputed (see @forward_backbone_features).
+        """
+        frozen = getattr(self.backbone, "_freeze", False) and getattr(self.backbone, "_pretrained", False)
+        # a replaced first layer (for coordinate convolutions or other input channels) is not pretrained
+        return frozen and (not getattr(self.backbone, "_input_coord_conv", False)) and (self.input_shape[0] == 3)
+
+    def forward_backbone_features(self, feats):
+        """
+        Forward pass from precomputed backbone features (see scripts/extract_visual_features.py)
+        through the pooling and linear layers only, which skips the backbone.
+
+        Args:
+            feats (torch.Tensor): backbone features of shape [B, ...] where ... is @self.backbone_feature_shape
+
+        Returns:
+            outputs (torch.Tensor): same as the output of @forward for the images that @feats were computed from
+        """
+        assert self.has_frozen_backbone, "VisualCore: precomputed features require a frozen pretrained backbone"
+        ndim = len(self.backbone_feature_shape)
+        assert tuple(feats.shape)[-ndim:] == tuple(self.backbone_feature_shape)
+        return self.nets[1:](feats)
+
     def __repr__(self):
         """Pretty print network."""
         header = '{}'.format(str(self.__class__.__name__))
@@ -578,6 +605,88 @@ class CropRandomizer(Randomizer):
         return msg
 
 
+def _rgb_to_grayscale(img):
+    """
+    Batched version of torchvision's rgb_to_grayscale for float images of shape [..., C, H, W].
+    Single-channel images are returned as they are.
+    """
+    if img.shape[-3] == 1:
+        return img
+    r, g, b = img.unbind(dim=-3)
+    return (0.2989 * r + 0.587 * g + 0.114 * b).unsqueeze(dim=-3)
+
+
+def _rgb_to_hsv(img):
+    """
+    Batched version of torchvision's RGB to HSV conversion for float images of shape [..., 3, H, W].
+    """
+    r, g, b = img.unbind(dim=-3)
+    maxc = torch.max(img, dim=-3).values
+    minc = torch.min(img, dim=-3).values
+    eqc = maxc == minc
+    cr = maxc - minc
+    ones = torch.ones_like(maxc)
+    s = cr / torch.where(eqc, ones, maxc)
+    cr_divisor = torch.where(eqc, ones, cr)
+    rc = (maxc - r) / cr_divisor
+    gc = (maxc - g) / cr_divisor
+    bc = (maxc - b) / cr_divisor
+    hr = (maxc == r) * (bc - gc)
+    hg = ((maxc == g) & (maxc != r)) * (2.0 + rc - bc)
+    hb = ((maxc != g) & (maxc != r)) * (4.0 + gc - rc)
+    h = torch.fmod(((hr + hg + hb) / 6.0 + 1.0), 1.0)
+    return torch.stack((h, s, maxc), dim=-3)
+
+
+def _hsv_to_rgb(img):
+    """
+    Batched version of torchvision's HSV to RGB conversion for float images of shape [..., 3, H, W].
+    """
+    h, s, v = img.unbind(dim=-3)
+    i = torch.floor(h * 6.0)
+    f = (h * 6.0) - i
+    i = i.to(dtype=torch.int32) % 6
+    p = torch.clamp((v * (1.0 - s)), 0.0, 1.0)
+    q = torch.clamp((v * (1.0 - s * f)), 0.0, 1.0)
+    t = torch.clamp((v * (1.0 - s * (1.0 - f))), 0.0, 1.0)
+    mask = (i.unsqueeze(dim=-3) == torch.arange(6, device=i.device).view(-1, 1, 1)).to(dtype=img.dtype)
+    a1 = torch.stack((v, q, p, p, t, v), dim=-3)
+    a2 = torch.stack((t, v, v, q, p, p), dim=-3)
+    a3 = torch.stack((p, p, t, v, v, q), dim=-3)
+    a4 = torch.stack((a1, a2, a3), dim=-4)
+    return torch.einsum("...ijk, ...xijk -> ...xjk", mask, a4)
+
+
+def _blend(img1, img2, ratio):
+    """
+    Blend float images with per-image @ratio, clamping to [0, 1] like torchvision does.
+    """
+    return (ratio * img1 + (1.0 - ratio) * img2).clamp(0.0, 1.0)
+
+
+def _adjust_brightness(img, factor):
+    return _blend(img, torch.zeros_like(img), factor)
+
+
+def _adjust_contrast(img, factor):
+    mean = torch.mean(_rgb_to_grayscale(img), dim=(-3, -2, -1), keepdim=True)
+    return _blend(img, mean, factor)
+
+
+def _adjust_saturation(img, factor):
+    if img.shape[-3] == 1:
+        return img
+    return _blend(img, _rgb_to_grayscale(img), factor)
+
+
+def _adjust_hue(img, factor):
+    if img.shape[-3] == 1:
+        return img
+    h, s, v = _rgb_to_hsv(img).unbind(dim=-3)
+    h = torch.remainder(h + factor.squeeze(dim=-3), 1.0)
+    return _hsv_to_rgb(torch.stack((h, s, v), dim=-3))
+
+
 class ColorRandomizer(Randomizer):
     """
     Randomly sample color jitter at input, and then average across color jtters at output.
@@ -667,7 +776,54 @@ class ColorRandomizer(Randomizer):
                 each sub-set of samples along batch dimension, assumed to be the FIRST dimension in the inputted tensor
                 Note: This function will MULTIPLY the first dimension by N
         """
-        return Lambda(lambda x: torch.stack([self.get_transform()(x_) for x_ in x for _ in range(N)]))
+        return Lambda(lambda x: self._batch_color_jitter(TensorUtils.repeat_by_expand_at(x, repeats=N, dim=0)))
+
+    def _batch_color_jitter(self, x, factors=None, order=None):
+        """
+        Vectorized equivalent of applying a separately sampled @get_transform to each image along
+        the first dimension of float images @x, with pixel values in [0, 1]. Factors are sampled
+        as tensors on the device of @x, and each image gets its own random order of adjustments.
+        Each step applies every adjustment to the whole batch and keeps the result only for the
+        images that have that adjustment at that position in their order, which avoids host
+        syncs and indexed copies.
+
+        Args:
+            x (torch.Tensor): batch of float images of shape [M, C, H, W]
+            factors (list): if provided, per-image factors of shape [M] for each enabled adjustment
+                (in brightness, contrast, saturation, hue order), instead of sampling them
+            order (torch.Tensor): if provided, per-image order of the enabled adjustments of
+                shape [M, num_adjustments], instead of sampling it
+
+        Returns:
+            out (torch.Tensor): color-jittered images
+        """
+        M = x.shape[0]
+        factor_shape = (M,) + (1,) * (x.ndim - 1)
+        adjustments = []
+        for bounds, adjust in (
+            (self.brightness, _adjust_brightness),
+            (self.contrast, _adjust_contrast),
+            (self.saturation, _adjust_saturation),
+            (self.hue, _adjust_hue),
+        ):
+            if bounds is not None:
+                if factors is None:
+                    adjust_factors = torch.empty(factor_shape, device=x.device, dtype=x.dtype).uniform_(bounds[0], bounds[1])
+                else:
+                    adjust_factors = factors[len(adjustments)].to(device=x.device, dtype=x.dtype).view(factor_shape)
+                adjustments.append((adjust, adjust_factors))
+        if len(adjustments) == 0:
+            return x
+
+        # random order of adjustments for each image
+        if order is None:
+            order = torch.rand(M, len(adjustments), device=x.device).argsort(dim=1)
+        order = order.to(device=x.device).view((M, len(adjustments)) + (1,) * (x.ndim - 1))
+        out = x
+        for step in range(len(adjustments)):
+            for j, (adjust, adjust_factors) in enumerate(adjustments):
+                out = torch.where(order[:, step] == j, adjust(out, adjust_factors), out)
+        return out
 
     def output_shape_in(self, input_shape=None):
         # outputs are same shape as inputs
@@ -200,7 +200,7 @@ class ObservationEncoder(Module):
         if self.feature_activation is not None:
             self.activation = self.feature_activation()
 
-    def forward(self, obs_dict):
+    def forward(self, obs_dict, feats=None):
         """
         Processes modalities according to the ordering in @self.obs_shapes. For each
         modality, it is processed with a randomizer (if present), an encoder
@@ -213,38 +213,97 @@ class ObservationEncoder(Module):
                 @self.obs_shapes must be present, but additional modalities
                 can also be present.
 
+            feats (dict): if provided, maps modalities to precomputed flat features of
+                shape [B, D] (see @encode_features). These modalities are not processed
+                again, and do not need to be present in @obs_dict.
+
         Returns:
             feats (torch.Tensor): flat features of shape [B, D]
         """
         assert self._locked, "ObservationEncoder: @make has not been called yet"
+        obs_dict = dict() if obs_dict is None else obs_dict
+        precomputed_feats = dict() if feats is None else feats
 
         # ensure all modalities that the encoder handles are present
-        assert set(self.obs_shapes.keys()).issubset(obs_dict), "ObservationEncoder: {} does not contain all modalities {}".format(
-            list(obs_dict.keys()), list(self.obs_shapes.keys())
-        )
+        assert all(self._has_obs_key(k, obs_dict) for k in self.obs_shapes if k not in precomputed_feats), \
+            "ObservationEncoder: {} does not contain all modalities {}".format(
+                list(obs_dict.keys()) + list(precomputed_feats.keys()), list(self.obs_shapes.keys())
+            )
 
         # process modalities by order given by @self.obs_shapes
         feats = []
         for k in self.obs_shapes:
-            x = obs_dict[k]
-            # maybe process encoder input with randomizer
-            if self.obs_randomizers[k] is not None:
-                x = self.obs_randomizers[k].forward_in(x)
-            # maybe process with obs net
-            if self.obs_nets[k] is not None:
-                x = self.obs_nets[k](x)
-                if self.activation is not None:
-                    x = self.activation(x)
-            # maybe process encoder output with randomizer
-            if self.obs_randomizers[k] is not None:
-                x = self.obs_randomizers[k].forward_out(x)
-            # flatten to [B, D]
-            x = TensorUtils.flatten(x, begin_axis=1)
-            feats.append(x)
+            if k in precomputed_feats:
+                feats.append(precomputed_feats[k])
+            else:
+                feats.append(self._encode_obs_key_from_dict(k, obs_dict))
 
         # concatenate all features together
         return torch.cat(feats, dim=-1)
 
+    def encode_features(self, obs_dict):
+        """
+        Processes each modality in @obs_dict that this encoder handles (see @forward), without
+        concatenating the features. Modalities that are missing from @obs_dict (for example,
+        actions that are only known later) are skipped - they can be passed to @forward in
+        its @obs_dict together with these features.
+
+        Args:
+            obs_dict (dict): dictionary that maps modalities to torch.Tensor batches
+
+        Returns:
+            feats (OrderedDict): maps modalities to flat features of shape [B, D]
+        """
+        assert self._locked, "ObservationEncoder: @make has not been called yet"
+        return OrderedDict(
+            (k, self._encode_obs_key_from_dict(k, obs_dict)) for k in self.obs_shapes if self._has_obs_key(k, obs_dict)
+        )
+
+    def _has_obs_key(self, k, obs_dict):
+        """
+        Whether @obs_dict contains modality @k, or precomputed backbone features for it
+        (see @ObsUtils.visual_feature_key).
+        """
+        return (k in obs_dict) or (ObsUtils.visual_feature_key(k) in obs_dict)
+
+    def _encode_obs_key_from_dict(self, k, obs_dict):
+        """
+        Process modality @k in @obs_dict into flat features of shape [B, D]. If @obs_dict
+        contains precomputed backbone features for @k instead of @k itself (for example,
+        from scripts/extract_visual_features.py), the backbone is skipped.
+        """
+        if k in obs_dict:
+            return self._encode_obs_key(k, obs_dict[k])
+        return self._encode_obs_key(k, obs_dict[ObsUtils.visual_feature_key(k)], backbone_features=True)
+
+    def _encode_obs_key(self, k, x, backbone_features=False):
+        """
+        Process batch @x of modality @k into flat features of shape [B, D]. If @backbone_features
+        is True, @x holds precomputed features of the visual backbone for modality @k.
+        """
+        if backbone_features:
+            # randomizers operate on the inputs of the backbone, which were never seen
+            assert self.obs_randomizers[k] is None, \
+                "ObservationEncoder: precomputed features for {} do not support randomizers".format(k)
+            x = self.obs_nets[k].forward_backbone_features(x)
+            if self.activation is not None:
+                x = self.activation(x)
+            return TensorUtils.flatten(x, begin_axis=1)
+
+        # maybe process encoder input with randomizer
+        if self.obs_randomizers[k] is not None:
+            x = self.obs_randomizers[k].forward_in(x)
+        # maybe process with obs net
+        if self.obs_nets[k] is not None:
+            x = self.obs_nets[k](x)
+            if self.activation is not None:
+                x = self.activation(x)
+        # maybe process encoder output with randomizer
+        if self.obs_randomizers[k] is not None:
+            x = self.obs_randomizers[k].forward_out(x)
+        # flatten to [B, D]
+        return TensorUtils.flatten(x, begin_axis=1)
+
     def output_shape(self, input_shape=None):
         """
         Compute the output shape of the encoder.
@@ -415,11 +474,15 @@ class ObservationGroupEncoder(Module):
                 encoder_kwargs=encoder_kwargs,
             )
 
-    def forward(self, **inputs):
+    def forward(self, feats=None, **inputs):
         """
         Process each set of inputs in its own observation group.
 
         Args:
+            feats (dict): if provided, maps observation groups to dictionaries of precomputed
+                per-modality features (see @encode_features). Modalities with features are
+                not encoded again, and do not need to be present in @inputs.
+
             inputs (dict): dictionary that maps observation groups to observation
                 dictionaries of torch.Tensor batches that agree with 
                 @self.observation_group_shapes. All observation groups in
@@ -431,22 +494,43 @@ class ObservationGroupEncoder(Module):
         Returns:
             outputs (torch.Tensor): flat outputs of shape [B, D]
         """
+        feats = dict() if feats is None else feats
 
         # ensure all observation groups we need are present
-        assert set(self.observation_group_shapes.keys()).issubset(inputs), "{} does not contain all observation groups {}".format(
-            list(inputs.keys()), list(self.observation_group_shapes.keys())
-        )
+        assert set(k for k in self.observation_group_shapes if k not in feats).issubset(inputs), \
+            "{} does not contain all observation groups {}".format(
+                list(inputs.keys()) + list(feats.keys()), list(self.observation_group_shapes.keys())
+            )
 
         outputs = []
         # Deterministic order since self.observation_group_shapes is OrderedDict
         for obs_group in self.observation_group_shapes:
             # pass through encoder
             outputs.append(
-                self.nets[obs_group].forward(inputs[obs_group])
+                self.nets[obs_group].forward(inputs.get(obs_group, None), feats=feats.get(obs_group, None))
             )
 
         return torch.cat(outputs, dim=-1)
 
+    def encode_features(self, **inputs):
+        """
+        Encode each modality of each observation group in @inputs separately, without
+        concatenating the features. Groups that are missing or None are skipped.
+
+        Args:
+            inputs (dict): dictionary that maps observation groups to observation
+                dictionaries of torch.Tensor batches
+
+        Returns:
+            feats (OrderedDict): maps observation groups to dictionaries of flat
+                per-modality features of shape [B, D], that can be passed to @forward
+        """
+        feats = OrderedDict()
+        for obs_group in self.observation_group_shapes:
+            if inputs.get(obs_group, None) is not None:
+                feats[obs_group] = self.nets[obs_group].encode_features(inputs[obs_group])
+        return feats
+
     def output_shape(self):
         """
         Compute the output shape of this encoder.
@@ -567,11 +651,16 @@ class MIMO_MLP(Module):
         """
         return { k : list(self.output_shapes[k]) for k in self.output_shapes }
 
-    def forward(self, **inputs):
+    def forward(self, feats=None, **inputs):
         """
         Process each set of inputs in its own observation group.
 
         Args:
+            feats (dict): if provided, precomputed features from @encode_features. These
+                inputs are not encoded again, which makes it cheap to evaluate the network
+                on several candidates (such as action proposals) per observation by tiling
+                the flat features instead of the raw observations.
+
             inputs (dict): a dictionary of dictionaries with one dictionary per
                 observation group. Each observation group's dictionary should map
                 modality to torch.Tensor batches. Should be consistent with
@@ -581,10 +670,26 @@ class MIMO_MLP(Module):
             outputs (dict): dictionary of output torch.Tensors, that corresponds
                 to @self.output_shapes
         """
-        enc_outputs = self.nets["encoder"](**inputs)
+        enc_outputs = self.nets["encoder"](feats=feats, **inputs)
         mlp_out = self.nets["mlp"](enc_outputs)
         return self.nets["decoder"](mlp_out)
 
+    def encode_features(self, **inputs):
+        """
+        Encode inputs without running the MLP, so that the features can be re-used
+        through the @feats argument of @forward.
+
+        Args:
+            inputs (dict): a dictionary of dictionaries with one dictionary per
+                observation group. Groups that are missing or None are skipped, as are
+                modalities missing from a group's dictionary.
+
+        Returns:
+            feats (OrderedDict): maps observation groups to dictionaries of flat
+                per-modality features of shape [B, D]
+        """
+        return self.nets["encoder"].encode_features(**inputs)
+
     def _to_string(self):
         """
         Subclasses should override this method to print out info about network / policy.
@@ -782,6 +887,9 @@ class RNN_MIMO_MLP(Module):
         """
         for obs_group in self.input_obs_group_shapes:
             for k in self.input_obs_group_shapes[obs_group]:
+                if k not in inputs[obs_group]:
+                    # precomputed backbone features (see ObservationEncoder._has_obs_key)
+                    continue
                 # first two dimensions should be [B, T] for inputs
                 assert inputs[obs_group][k].ndim - 2 == len(self.input_obs_group_shapes[obs_group][k])
 
@@ -881,6 +989,7 @@ class MIMO_Transformer(Module):
         transformer_sinusoidal_embedding=False,
         transformer_activation="gelu",
         transformer_nn_parameter_for_timesteps=False,
+        transformer_attention_backend="auto",
         encoder_kwargs=None,
     ):
         """
@@ -901,6 +1010,8 @@ class MIMO_Transformer(Module):
             transformer_emb_dropout (float): dropout probability for embedding inputs in transformer
             transformer_attn_dropout (float): dropout probability for attention outputs for each transformer block
             transformer_block_output_dropout (float): dropout probability for final outputs for each transformer block
+            transformer_attention_backend (str): how to compute self-attention - one of "auto", "sdpa", "math"
+                (see @CausalSelfAttention)
             encoder_kwargs (dict): observation encoder config
         """
         super(MIMO_Transformer, self).__init__()
@@ -958,6 +1069,7 @@ class MIMO_Transformer(Module):
             attn_dropout=transformer_attn_dropout,
             block_output_dropout=transformer_block_output_dropout,
             activation=transformer_activation,
+            attention_backend=transformer_attention_backend,
         )
 
         # decoder for output modalities
@@ -971,6 +1083,50 @@ class MIMO_Transformer(Module):
         self.transformer_sinusoidal_embedding = transformer_sinusoidal_embedding
         self.transformer_nn_parameter_for_timesteps = transformer_nn_parameter_for_timesteps
 
+        # cached encoder features for incremental inference (see @forward)
+        self._inference_cache = None
+
+    def reset_inference_cache(self):
+        """
+        Clear cached encoder features used for incremental inference.
+        """
+        self._inference_cache = None
+
+    @staticmethod
+    def _window_advanced_by_one(prev_inputs, inputs):
+        """
+        Returns True if the [B, T, ...] tensors in @inputs are the tensors in @prev_inputs shifted
+        by one timestep, so that only the final timestep of @inputs is new.
+        """
+        prev_inputs = TensorUtils.flatten_nested_dict_list(prev_inputs)
+        inputs = TensorUtils.flatten_nested_dict_list(inputs)
+        if [k for k, _ in prev_inputs] != [k for k, _ in inputs]:
+            return False
+        for (_, prev), (_, cur) in zip(prev_inputs, inputs):
+            if (prev is None) or (cur is None):
+                if (prev is None) != (cur is None):
+                    return False
+                continue
+            if (prev.shape != cur.shape) or (not torch.equal(prev[:, 1:], cur[:, :-1])):
+                return False
+        return True
+
+    def _encode_incremental(self, inputs):
+        """
+        Encode [B, T, ...] @inputs with the observation encoder, re-using the cached features of the
+        previous call for the T - 1 timesteps that were already seen if the window advanced by one
+        timestep, and encoding everything otherwise.
+        """
+        cache = self._inference_cache
+        if (cache is not None) and self._window_advanced_by_one(cache["inputs"], inputs):
+            new_inputs = TensorUtils.map_tensor(inputs, lambda x: x[:, -1:])
+            new_features = TensorUtils.time_distributed(new_inputs, self.nets["encoder"], inputs_as_kwargs=True)
+            features = torch.cat([cache["features"][:, 1:], new_features], dim=1)
+        else:
+            features = TensorUtils.time_distributed(inputs, self.nets["encoder"], inputs_as_kwargs=True)
+        self._inference_cache = dict(inputs=inputs, features=features)
+        return features
+
     def output_shape(self, input_shape=None):
         """
         Returns output shape for this module, which is a dictionary instead
@@ -1037,10 +1193,15 @@ class MIMO_Transformer(Module):
         return embeddings
 
     
-    def forward(self, **inputs):
+    def forward(self, incremental=False, **inputs):
         """
         Process each set of inputs in its own observation group.
         Args:
+            incremental (bool): if True, assume that consecutive calls see a sliding window of
+                observations (such as frame-stacked observations during rollouts). Per-timestep
+                encoder features are cached across calls so that only the newest timestep is encoded
+                when the window advanced by one timestep, and only the final timestep is decoded.
+                Call @reset_inference_cache at the start of each episode. Only meant for inference.
             inputs (dict): a dictionary of dictionaries with one dictionary per
                 observation group. Each observation group's dictionary should map
                 modality to torch.Tensor batches. Should be consistent with
@@ -1049,27 +1210,32 @@ class MIMO_Transformer(Module):
         Returns:
             outputs (dict): dictionary of output torch.Tensors, that corresponds
                 to @self.output_shapes. Leading dimensions will be batch and time [B, T, ...]
-                for each tensor.
+                for each tensor, or [B, 1, ...] if @incremental is True.
         """
         for obs_group in self.input_obs_group_shapes:
             for k in self.input_obs_group_shapes[obs_group]:
                 # first two dimensions should be [B, T] for inputs
-                if inputs[obs_group][k] is None:
+                if inputs[obs_group].get(k, None) is None:
+                    # inputs may be None, or missing for precomputed backbone features (see ObservationEncoder._has_obs_key)
                     continue
                 assert inputs[obs_group][k].ndim - 2 == len(self.input_obs_group_shapes[obs_group][k])
 
         inputs = inputs.copy()
 
         transformer_encoder_outputs = None
-        transformer_inputs = TensorUtils.time_distributed(
-            inputs, self.nets["encoder"], inputs_as_kwargs=True
-        )
+        if incremental:
+            transformer_inputs = self._encode_incremental(inputs)
+        else:
+            transformer_inputs = TensorUtils.time_distributed(
+                inputs, self.nets["encoder"], inputs_as_kwargs=True
+            )
         assert transformer_inputs.ndim == 3  # [B, T, D]
 
         if transformer_encoder_outputs is None:
             transformer_embeddings = self.input_embedding(transformer_inputs)
             # pass encoded sequences through transformer
-            transformer_encoder_outputs = self.nets["transformer"].forward(transformer_embeddings)
+            transformer_encoder_outputs = self.nets["transformer"].forward(
+                transformer_embeddings, last_step_only=incremental)
 
         transformer_outputs = transformer_encoder_outputs
         # apply decoder to each timestep of sequence to get a dictionary of outputs
@@ -101,11 +101,19 @@ class ActorNetwork(MIMO_MLP):
     def output_shape(self, input_shape=None):
         return [self.ac_dim]
 
-    def forward(self, obs_dict, goal_dict=None):
-        actions = super(ActorNetwork, self).forward(obs=obs_dict, goal=goal_dict)["action"]
+    def forward(self, obs_dict, goal_dict=None, feats=None):
+        actions = super(ActorNetwork, self).forward(obs=obs_dict, goal=goal_dict, feats=feats)["action"]
         # apply tanh squashing to ensure actions are in [-1, 1]
         return torch.tanh(actions)
 
+    def encode_features(self, obs_dict, goal_dict=None):
+        """
+        Encode observations (and goals) once, so that the features can be re-used (for
+        example, tiled to sample several actions per observation) through the @feats
+        argument of @forward. See @MIMO_MLP.encode_features.
+        """
+        return super(ActorNetwork, self).encode_features(obs=obs_dict, goal=goal_dict)
+
     def _to_string(self):
         """Info to pretty print."""
         return "action_dim={}".format(self.ac_dim)
@@ -173,12 +181,15 @@ class PerturbationActorNetwork(ActorNetwork):
             encoder_kwargs=encoder_kwargs,
         )
 
-    def forward(self, obs_dict, acts, goal_dict=None):
-        """Forward pass through perturbation actor."""
+    def forward(self, obs_dict, acts, goal_dict=None, feats=None):
+        """
+        Forward pass through perturbation actor. If @feats from @encode_features are
+        provided, @obs_dict and @goal_dict can be None.
+        """
         # add in actions
-        inputs = dict(obs_dict)
+        inputs = dict(obs_dict) if obs_dict is not None else dict()
         inputs["action"] = acts
-        perturbations = super(PerturbationActorNetwork, self).forward(inputs, goal_dict)
+        perturbations = super(PerturbationActorNetwork, self).forward(inputs, goal_dict, feats=feats)
 
         # add perturbations from network to original actions, and ensure the new actions lie in [-1, 1]
         output_actions = acts + self.perturbation_scale * perturbations
@@ -319,7 +330,7 @@ class GaussianActorNetwork(ActorNetwork):
             scale=(self.ac_dim,),
         )
 
-    def forward_train(self, obs_dict, goal_dict=None):
+    def forward_train(self, obs_dict, goal_dict=None, feats=None):
         """
         Return full Gaussian distribution, which is useful for computing
         quantities necessary at train-time, like log-likelihood, KL 
@@ -328,11 +339,12 @@ class GaussianActorNetwork(ActorNetwork):
         Args:
             obs_dict (dict): batch of observations
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             dist (Distribution): Gaussian distribution
         """
-        out = MIMO_MLP.forward(self, obs=obs_dict, goal=goal_dict)
+        out = MIMO_MLP.forward(self, obs=obs_dict, goal=goal_dict, feats=feats)
         mean = out["mean"]
         # Use either constant std or learned std depending on setting
         scale = out["scale"] if not self.fixed_std else torch.ones_like(mean) * self.init_std
@@ -367,18 +379,19 @@ class GaussianActorNetwork(ActorNetwork):
 
         return dist
 
-    def forward(self, obs_dict, goal_dict=None):
+    def forward(self, obs_dict, goal_dict=None, feats=None):
         """
         Samples actions from the policy distribution.
 
         Args:
             obs_dict (dict): batch of observations
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             action (torch.Tensor): batch of actions from policy distribution
         """
-        dist = self.forward_train(obs_dict, goal_dict)
+        dist = self.forward_train(obs_dict, goal_dict, feats=feats)
         if self.low_noise_eval and (not self.training):
             if self.use_tanh:
                 # # scaling factor lets us output actions like [-1. 1.] and is consistent with the distribution transform
@@ -491,7 +504,7 @@ class GMMActorNetwork(ActorNetwork):
             logits=(self.num_modes,),
         )
 
-    def forward_train(self, obs_dict, goal_dict=None):
+    def forward_train(self, obs_dict, goal_dict=None, feats=None):
         """
         Return full GMM distribution, which is useful for computing
         quantities necessary at train-time, like log-likelihood, KL 
@@ -500,11 +513,12 @@ class GMMActorNetwork(ActorNetwork):
         Args:
             obs_dict (dict): batch of observations
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             dist (Distribution): GMM distribution
         """
-        out = MIMO_MLP.forward(self, obs=obs_dict, goal=goal_dict)
+        out = MIMO_MLP.forward(self, obs=obs_dict, goal=goal_dict, feats=feats)
         means = out["mean"]
         scales = out["scale"]
         logits = out["logits"]
@@ -540,18 +554,19 @@ class GMMActorNetwork(ActorNetwork):
 
         return dist
 
-    def forward(self, obs_dict, goal_dict=None):
+    def forward(self, obs_dict, goal_dict=None, feats=None):
         """
         Samples actions from the policy distribution.
 
         Args:
             obs_dict (dict): batch of observations
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             action (torch.Tensor): batch of actions from policy distribution
         """
-        dist = self.forward_train(obs_dict, goal_dict)
+        dist = self.forward_train(obs_dict, goal_dict, feats=feats)
         return dist.sample()
 
     def _to_string(self):
@@ -994,6 +1009,7 @@ class TransformerActorNetwork(MIMO_Transformer):
         transformer_sinusoidal_embedding=False,
         transformer_activation="gelu",
         transformer_nn_parameter_for_timesteps=False,
+        transformer_attention_backend="auto",
         goal_shapes=None,
         encoder_kwargs=None,
     ):
@@ -1020,6 +1036,9 @@ class TransformerActorNetwork(MIMO_Transformer):
             transformer_attn_dropout (float): dropout probability for attention outputs for each transformer block
 
             transformer_block_output_dropout (float): dropout probability for final outputs for each transformer block
+
+            transformer_attention_backend (str): how to compute self-attention - one of "auto", "sdpa", "math"
+                (see @CausalSelfAttention)
             
             goal_shapes (OrderedDict): a dictionary that maps modality to
                 expected shapes for goal observations.
@@ -1075,6 +1094,7 @@ class TransformerActorNetwork(MIMO_Transformer):
             transformer_sinusoidal_embedding=transformer_sinusoidal_embedding,
             transformer_activation=transformer_activation,
             transformer_nn_parameter_for_timesteps=transformer_nn_parameter_for_timesteps,
+            transformer_attention_backend=transformer_attention_backend,
 
             encoder_kwargs=encoder_kwargs,
         )
@@ -1097,7 +1117,7 @@ class TransformerActorNetwork(MIMO_Transformer):
                 msg="TransformerActorNetwork: input_shape inconsistent in temporal dimension")
         return [T, self.ac_dim]
 
-    def forward(self, obs_dict, actions=None, goal_dict=None):
+    def forward(self, obs_dict, actions=None, goal_dict=None, incremental=False):
         """
         Forward a sequence of inputs through the Transformer.
         Args:
@@ -1105,6 +1125,8 @@ class TransformerActorNetwork(MIMO_Transformer):
                 should have leading dimensions batch and time [B, T, ...]
             actions (torch.Tensor): batch of actions of shape [B, T, D]
             goal_dict (dict): if not None, batch of goal observations
+            incremental (bool): if True, use incremental inference over a sliding window of
+                observations and only predict the final timestep (see @MIMO_Transformer.forward)
         Returns:
             outputs (torch.Tensor or dict): contains predicted action sequence, or dictionary
                 with predicted action sequence and predicted observation sequences
@@ -1116,7 +1138,7 @@ class TransformerActorNetwork(MIMO_Transformer):
             goal_dict = TensorUtils.unsqueeze_expand_at(goal_dict, size=obs_dict[mod].shape[1], dim=1)
 
         forward_kwargs = dict(obs=obs_dict, goal=goal_dict)
-        outputs = super(TransformerActorNetwork, self).forward(**forward_kwargs)
+        outputs = super(TransformerActorNetwork, self).forward(incremental=incremental, **forward_kwargs)
 
         # apply tanh squashing to ensure actions are in [-1, 1]
         outputs["action"] = torch.tanh(outputs["action"])
@@ -1147,6 +1169,7 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
         transformer_sinusoidal_embedding=False,
         transformer_activation="gelu",
         transformer_nn_parameter_for_timesteps=False,
+        transformer_attention_backend="auto",
         num_modes=5,
         min_std=0.01,
         std_activation="softplus",
@@ -1179,6 +1202,9 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
 
             transformer_block_output_dropout (float): dropout probability for final outputs for each transformer block
 
+            transformer_attention_backend (str): how to compute self-attention - one of "auto", "sdpa", "math"
+                (see @CausalSelfAttention)
+
             num_modes (int): number of GMM modes
 
             min_std (float): minimum std output from network
@@ -1239,7 +1265,8 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
             transformer_block_output_dropout=transformer_block_output_dropout,
             transformer_sinusoidal_embedding=transformer_sinusoidal_embedding,
             transformer_activation=transformer_activation,
-            transformer_nn_parameter_for_timesteps=transformer_nn_parameter_for_timesteps,            
+            transformer_nn_parameter_for_timesteps=transformer_nn_parameter_for_timesteps,
+            transformer_attention_backend=transformer_attention_backend,
             encoder_kwargs=encoder_kwargs,
             goal_shapes=goal_shapes,
         )
@@ -1255,7 +1282,7 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
             logits=(self.num_modes,),
         )
 
-    def forward_train(self, obs_dict, actions=None, goal_dict=None, low_noise_eval=None):
+    def forward_train(self, obs_dict, actions=None, goal_dict=None, low_noise_eval=None, incremental=False):
         """
         Return full GMM distribution, which is useful for computing
         quantities necessary at train-time, like log-likelihood, KL 
@@ -1264,6 +1291,9 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
             obs_dict (dict): batch of observations
             actions (torch.Tensor): batch of actions
             goal_dict (dict): if not None, batch of goal observations
+            low_noise_eval (bool): if provided, overrides whether to use low-noise GMM modes at eval time
+            incremental (bool): if True, use incremental inference over a sliding window of
+                observations and only predict the final timestep (see @MIMO_Transformer.forward)
         Returns:
             dists (Distribution): sequence of GMM distributions over the timesteps
         """
@@ -1275,7 +1305,7 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
 
         forward_kwargs = dict(obs=obs_dict, goal=goal_dict)
 
-        outputs = MIMO_Transformer.forward(self, **forward_kwargs)
+        outputs = MIMO_Transformer.forward(self, incremental=incremental, **forward_kwargs)
         
         means = outputs["mean"]
         scales = outputs["scale"]
@@ -1313,17 +1343,19 @@ class TransformerGMMActorNetwork(TransformerActorNetwork):
 
         return dists
 
-    def forward(self, obs_dict, actions=None, goal_dict=None):
+    def forward(self, obs_dict, actions=None, goal_dict=None, incremental=False):
         """
         Samples actions from the policy distribution.
         Args:
             obs_dict (dict): batch of observations
             actions (torch.Tensor): batch of actions
             goal_dict (dict): if not None, batch of goal observations
+            incremental (bool): if True, use incremental inference over a sliding window of
+                observations and only predict the final timestep (see @MIMO_Transformer.forward)
         Returns:
             action (torch.Tensor): batch of actions from policy distribution
         """
-        out = self.forward_train(obs_dict=obs_dict, actions=actions, goal_dict=goal_dict)
+        out = self.forward_train(obs_dict=obs_dict, actions=actions, goal_dict=goal_dict, incremental=incremental)
         return out.sample()
 
     def _to_string(self):
@@ -1446,7 +1478,22 @@ class VAEActor(Module):
         inputs = OrderedDict(action=actions)
         return self._vae.encode(inputs=inputs, conditions=obs_dict, goals=goal_dict)
 
-    def decode(self, obs_dict=None, goal_dict=None, z=None, n=None):
+    def encode_features(self, obs_dict, goal_dict=None):
+        """
+        Encode observations (and goals) once with the observation encoders of the VAE decoder
+        and prior, so that the features can be re-used (for example, tiled to sample several
+        actions per observation) through the @feats argument of @forward.
+
+        Args:
+            obs_dict (dict): batch of observations
+            goal_dict (dict): if not None, batch of goal observations
+
+        Returns:
+            feats (dict): observation features
+        """
+        return self._vae.encode_condition_features(conditions=obs_dict, goals=goal_dict)
+
+    def decode(self, obs_dict=None, goal_dict=None, z=None, n=None, feats=None):
         """
         Thin wrapper around @VaeNets.VAE implementation.
 
@@ -1465,11 +1512,14 @@ class VAEActor(Module):
                 generate from the prior. Only required if @z is None - i.e.
                 sampling takes place
 
+            feats (dict): if provided, precomputed observation features from @encode_features,
+                used instead of @obs_dict and @goal_dict
+
         Returns:
             recons (dict): dictionary of reconstructed inputs (this will be a dictionary
                 with a single "action" key)
         """
-        return self._vae.decode(conditions=obs_dict, goals=goal_dict, z=z, n=n)
+        return self._vae.decode(conditions=obs_dict, goals=goal_dict, z=z, n=n, feats=feats)
 
     def sample_prior(self, obs_dict=None, goal_dict=None, n=None):
         """
@@ -1549,7 +1599,7 @@ class VAEActor(Module):
             goals=goal_dict,
             freeze_encoder=freeze_encoder)
 
-    def forward(self, obs_dict, goal_dict=None, z=None):
+    def forward(self, obs_dict, goal_dict=None, z=None, feats=None):
         """
         Samples actions from the policy distribution.
 
@@ -1558,6 +1608,8 @@ class VAEActor(Module):
             goal_dict (dict): if not None, batch of goal observations
             z (torch.Tensor): if not None, use the provided batch of latents instead
                 of sampling from the prior
+            feats (dict): if not None, precomputed observation features from @encode_features,
+                used instead of @obs_dict and @goal_dict (which can be None)
 
         Returns:
             action (torch.Tensor): batch of actions from policy distribution
@@ -1565,6 +1617,12 @@ class VAEActor(Module):
         n = None
         if z is None:
             # prior will be sampled - so we must provide number of samples explicitly
-            mod = list(obs_dict.keys())[0]
-            n = obs_dict[mod].shape[0]
-        return self.decode(obs_dict=obs_dict, goal_dict=goal_dict, z=z, n=n)["action"]
+            if obs_dict is not None:
+                mod = list(obs_dict.keys())[0]
+                n = obs_dict[mod].shape[0]
+            else:
+                # number of samples is the batch size of the (possibly tiled) features
+                feat_tensors = [v for _, v in TensorUtils.flatten_nested_dict_list(feats) if v is not None]
+                assert len(feat_tensors) > 0, "VAEActor: need @obs_dict or non-empty @feats to sample from the prior"
+                n = feat_tensors[0].shape[0]
+        return self.decode(obs_dict=obs_dict, goal_dict=goal_dict, z=z, n=n, feats=feats)["action"]
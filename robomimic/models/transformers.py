@@ -85,6 +85,7 @@ class CausalSelfAttention(Module):
         context_length,
         attn_dropout=0.1,
         output_dropout=0.1,
+        attention_backend="auto",
     ):
         """
         Multi-head masked self-attention layer + projection (MLP layer).
@@ -115,9 +116,22 @@ class CausalSelfAttention(Module):
             attn_dropout (float): dropout probability for attention outputs
 
             output_dropout (float): dropout probability for final outputs
+
+            attention_backend (str): "sdpa" computes attention with the fused
+                torch.nn.functional.scaled_dot_product_attention kernel, which avoids materializing
+                the attention matrix. "math" computes it explicitly with a mask. "auto" uses "sdpa"
+                if this version of torch supports it, and "math" otherwise.
         """
         super(CausalSelfAttention, self).__init__()
 
+        assert attention_backend in ("auto", "sdpa", "math"), \
+            "unknown attention backend: {}".format(attention_backend)
+        has_sdpa = hasattr(F, "scaled_dot_product_attention")
+        if attention_backend == "sdpa":
+            assert has_sdpa, "attention backend sdpa requires torch >= 2.0"
+        self.attention_backend = attention_backend
+        self.use_sdpa = has_sdpa and (attention_backend != "math")
+
         assert (
             embed_dim % num_heads == 0
         ), "num_heads: {} does not divide embed_dim: {} exactly".format(num_heads, embed_dim)
@@ -145,11 +159,12 @@ class CausalSelfAttention(Module):
         )
         self.register_buffer("mask", mask)
 
-    def forward(self, x):
+    def forward(self, x, last_step_only=False):
         """
         Forward pass through Self-Attention block.
         Input should be shape (B, T, D) where B is batch size, T is seq length (@self.context_length), and
-        D is input dimension (@self.embed_dim).
+        D is input dimension (@self.embed_dim). If @last_step_only is True, only the output for the
+        final timestep is computed, and the output has shape (B, 1, D).
         """
 
         # enforce shape consistency
@@ -171,6 +186,30 @@ class CausalSelfAttention(Module):
         q = q.view(B, T, NH, DH).transpose(1, 2)  # [B, NH, T, DH]
         v = v.view(B, T, NH, DH).transpose(1, 2)  # [B, NH, T, DH]
 
+        if last_step_only:
+            # the final timestep attends to the whole sequence, so no causal mask is needed
+            q = q[:, :, -1:]  # [B, NH, 1, DH]
+            if self.use_sdpa:
+                y = F.scaled_dot_product_attention(
+                    q, k, v, dropout_p=(self.attn_dropout if self.training else 0.0))
+            else:
+                att = (q @ k.transpose(-2, -1)) * (1.0 / math.sqrt(k.size(-1)))
+                att = self.nets["attn_dropout"](F.softmax(att, dim=-1))
+                y = att @ v
+            y = y.transpose(1, 2).contiguous().view(B, 1, D)
+            y = self.nets["output"](y)
+            y = self.nets["output_dropout"](y)
+            return y
+
+        if self.use_sdpa:
+            # fused causal attention (with dropout on attention weights) - [B, NH, T, DH]
+            y = F.scaled_dot_product_attention(
+                q, k, v, dropout_p=(self.attn_dropout if self.training else 0.0), is_causal=True)
+            y = y.transpose(1, 2).contiguous().view(B, T, D)
+            y = self.nets["output"](y)
+            y = self.nets["output_dropout"](y)
+            return y
+
         # causal self-attention mechanism
 
         # batched matrix multiplication between queries and keys to get all pair-wise dot-products.
@@ -232,6 +271,7 @@ class SelfAttentionBlock(Module):
         attn_dropout=0.1,
         output_dropout=0.1,
         activation=nn.GELU(),
+        attention_backend="auto",
     ):
         """
         Args:
@@ -248,6 +288,9 @@ class SelfAttentionBlock(Module):
             output_dropout (float): dropout probability for final outputs
 
             activation (str): string denoting the activation function to use in each transformer block
+
+            attention_backend (str): how to compute self-attention - one of "auto", "sdpa", "math"
+                (see @CausalSelfAttention)
         """
         super(SelfAttentionBlock, self).__init__()
 
@@ -265,6 +308,7 @@ class SelfAttentionBlock(Module):
             context_length=context_length,
             attn_dropout=attn_dropout,
             output_dropout=output_dropout,
+            attention_backend=attention_backend,
         )
 
         if type(activation) == GEGLU:
@@ -284,11 +328,15 @@ class SelfAttentionBlock(Module):
         self.nets["ln1"] = nn.LayerNorm(embed_dim)
         self.nets["ln2"] = nn.LayerNorm(embed_dim)
 
-    def forward(self, x):
+    def forward(self, x, last_step_only=False):
         """
         Forward pass - chain self-attention + MLP blocks, with residual connections and layer norms.
+        If @last_step_only is True, only the output for the final timestep is computed.
         """
-        x = x + self.nets["attention"](self.nets["ln1"](x))
+        y = self.nets["attention"](self.nets["ln1"](x), last_step_only=last_step_only)
+        if last_step_only:
+            x = x[:, -1:]
+        x = x + y
         x = x + self.nets["mlp"](self.nets["ln2"](x))
         return x
 
@@ -321,6 +369,7 @@ class GPT_Backbone(Module):
         num_layers=6,
         num_heads=8,
         activation="gelu",
+        attention_backend="auto",
     ):
         """
         Args:
@@ -340,6 +389,8 @@ class GPT_Backbone(Module):
 
             activation (str): string denoting the activation function to use in each transformer block
 
+            attention_backend (str): how to compute self-attention - one of "auto", "sdpa", "math"
+                (see @CausalSelfAttention)
         """
         super(GPT_Backbone, self).__init__()
 
@@ -349,6 +400,7 @@ class GPT_Backbone(Module):
         self.context_length = context_length
         self.attn_dropout = attn_dropout
         self.block_output_dropout = block_output_dropout
+        self.attention_backend = attention_backend
 
         if activation == "gelu":
             self.activation = nn.GELU()
@@ -383,6 +435,7 @@ class GPT_Backbone(Module):
                     attn_dropout=self.attn_dropout,
                     output_dropout=self.block_output_dropout,
                     activation=self.activation,
+                    attention_backend=self.attention_backend,
                 )
                 for _ in range(self.num_layers)
             ]
@@ -419,8 +472,18 @@ class GPT_Backbone(Module):
         # this module takes inputs (B, T, @self.input_dim) and produces outputs (B, T, @self.output_dim)
         return input_shape[:-1] + [self.output_dim]
 
-    def forward(self, inputs):
+    def forward(self, inputs, last_step_only=False):
+        """
+        Forward pass through the transformer blocks. If @last_step_only is True, the final block only
+        computes the output for the final timestep, and outputs have shape (B, 1, D) instead of (B, T, D).
+        """
         assert inputs.shape[1:] == (self.context_length, self.embed_dim), inputs.shape
-        x = self.nets["transformer"](inputs)
+        if last_step_only:
+            x = inputs
+            for block in self.nets["transformer"][:-1]:
+                x = block(x)
+            x = self.nets["transformer"][-1](x, last_step_only=True)
+        else:
+            x = self.nets["transformer"](inputs)
         transformer_output = self.nets["output_ln"](x)
         return transformer_output
\ No newline at end of file
@@ -148,7 +148,7 @@ class Prior(Module):
                 encoder_kwargs=net_kwargs["encoder_kwargs"],
             )
 
-    def sample(self, n, obs_dict=None, goal_dict=None):
+    def sample(self, n, obs_dict=None, goal_dict=None, feats=None):
         """
         Returns a batch of samples from the prior distribution.
 
@@ -162,6 +162,9 @@ class Prior(Module):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             z (torch.Tensor): batch of sampled latent vectors.
         """
@@ -190,6 +193,20 @@ class Prior(Module):
         """
         raise NotImplementedError
 
+    def encode_features(self, obs_dict=None, goal_dict=None):
+        """
+        Encode observations (and goals) with the prior network once, so that the features
+        can be re-used (for example, tiled to draw several samples per observation) through
+        the @feats argument of @sample and @forward.
+
+        Returns:
+            feats (dict or None): features of @obs_dict and @goal_dict, or None if no prior
+                parameters are obs-dependent
+        """
+        if self.prior_module is None:
+            return None
+        return self.prior_module.encode_features(obs=obs_dict, goal=goal_dict)
+
     def output_shape(self, input_shape=None):
         """
         Returns output shape for this module, which is a dictionary instead
@@ -199,7 +216,7 @@ class Prior(Module):
             return self.prior_module.output_shape(input_shape)
         return { k : list(self.param_shapes[k]) for k in self.param_shapes }
 
-    def forward(self, batch_size, obs_dict=None, goal_dict=None):
+    def forward(self, batch_size, obs_dict=None, goal_dict=None, feats=None):
         """
         Computes prior parameters.
 
@@ -213,13 +230,16 @@ class Prior(Module):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             prior_params (dict): dictionary containing prior parameters
         """
         prior_params = dict()
         if self._is_obs_dependent:
             # forward through network for obs-dependent params
-            prior_params = self.prior_module.forward(obs=obs_dict, goal=goal_dict)
+            prior_params = self.prior_module.forward(obs=obs_dict, goal=goal_dict, feats=feats)
 
         # return params that do not depend on obs as well
         for pp in self.param_shapes:
@@ -363,7 +383,7 @@ class GaussianPrior(Prior):
         if self.learnable:
             super(GaussianPrior, self)._create_layers(net_kwargs)
 
-    def sample(self, n, obs_dict=None, goal_dict=None):
+    def sample(self, n, obs_dict=None, goal_dict=None, feats=None):
         """
         Returns a batch of samples from the prior distribution.
 
@@ -377,19 +397,22 @@ class GaussianPrior(Prior):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             z (torch.Tensor): batch of sampled latent vectors.
         """
 
         # check consistency between n and obs_dict
         if self._input_dependent:
-            TensorUtils.assert_size_at_dim(obs_dict, size=n, dim=0, 
+            TensorUtils.assert_size_at_dim(obs_dict if feats is None else feats, size=n, dim=0, 
                 msg="obs dict and n mismatch in @sample")
 
         if self.learnable:
 
             # forward to get parameters
-            out = self.forward(batch_size=n, obs_dict=obs_dict, goal_dict=goal_dict)
+            out = self.forward(batch_size=n, obs_dict=obs_dict, goal_dict=goal_dict, feats=feats)
             prior_means, prior_logvars, prior_logweights = out["means"], out["logvars"], out["logweights"]
 
             if prior_logweights is not None:
@@ -473,7 +496,7 @@ class GaussianPrior(Prior):
             - LossUtils.log_normal_mixture(x=z, m=prior_means, v=prior_vars, log_w=prior_logweights)
         return kl_loss.mean()
 
-    def forward(self, batch_size, obs_dict=None, goal_dict=None):
+    def forward(self, batch_size, obs_dict=None, goal_dict=None, feats=None):
         """
         Computes means, logvars, and GMM weights (if using GMM and learning weights).
 
@@ -487,12 +510,15 @@ class GaussianPrior(Prior):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             prior_params (dict): dictionary containing prior parameters
         """
         assert self.learnable
         prior_params = super(GaussianPrior, self).forward(
-            batch_size=batch_size, obs_dict=obs_dict, goal_dict=goal_dict)
+            batch_size=batch_size, obs_dict=obs_dict, goal_dict=goal_dict, feats=feats)
 
         if self.use_gmm and self.gmm_learn_weights:
             # normalize learned weight outputs to sum to 1
@@ -621,7 +647,7 @@ class CategoricalPrior(Prior):
         if self.learnable:
             super(CategoricalPrior, self)._create_layers(net_kwargs)
 
-    def sample(self, n, obs_dict=None, goal_dict=None):
+    def sample(self, n, obs_dict=None, goal_dict=None, feats=None):
         """
         Returns a batch of samples from the prior distribution.
 
@@ -635,19 +661,22 @@ class CategoricalPrior(Prior):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             z (torch.Tensor): batch of sampled latent vectors.
         """
 
         # check consistency between n and obs_dict
         if self._input_dependent:
-            TensorUtils.assert_size_at_dim(obs_dict, size=n, dim=0, 
+            TensorUtils.assert_size_at_dim(obs_dict if feats is None else feats, size=n, dim=0, 
                 msg="obs dict and n mismatch in @sample")
 
         if self.learnable:
 
             # forward to get parameters
-            out = self.forward(batch_size=n, obs_dict=obs_dict, goal_dict=goal_dict)
+            out = self.forward(batch_size=n, obs_dict=obs_dict, goal_dict=goal_dict, feats=feats)
             prior_logits = out["logit"]
 
             # sample one-hot latents from categorical distribution
@@ -706,7 +735,7 @@ class CategoricalPrior(Prior):
         assert len(kl_loss.shape) == 2
         return kl_loss.sum(-1).mean()
 
-    def forward(self, batch_size, obs_dict=None, goal_dict=None):
+    def forward(self, batch_size, obs_dict=None, goal_dict=None, feats=None):
         """
         Computes prior logits (unnormalized log-probs).
 
@@ -720,12 +749,15 @@ class CategoricalPrior(Prior):
 
             goal_dict (dict): inputs according to @goal_shapes (only if using goal observations)
 
+            feats (dict): if provided, precomputed features of @obs_dict and @goal_dict
+                from the prior network (see @encode_features), used instead of them
+
         Returns:
             prior_params (dict): dictionary containing prior parameters
         """
         assert self.learnable
         return super(CategoricalPrior, self).forward(
-            batch_size=batch_size, obs_dict=obs_dict, goal_dict=goal_dict)
+            batch_size=batch_size, obs_dict=obs_dict, goal_dict=goal_dict, feats=feats)
 
     def __repr__(self):
         """Pretty print network"""
@@ -1145,7 +1177,30 @@ class VAE(torch.nn.Module):
             logvar=posterior_params["logvar"],
         )
 
-    def decode(self, conditions=None, goals=None, z=None, n=None):
+    def encode_condition_features(self, conditions=None, goals=None):
+        """
+        Encode condition and goal variables once with the observation encoders of the decoder
+        and the prior, so that the features can be re-used (for example, tiled to decode several
+        samples per observation) through the @feats argument of @decode and @sample_prior.
+        Only for cVAEs.
+
+        Args:
+            conditions (dict): a dictionary that maps modalities to torch.Tensor
+                batches. These should correspond to the modalities used for conditioning
+                in either the decoder or the prior (or both).
+
+            goals (dict): a dictionary that maps modalities to torch.Tensor
+                batches. These should correspond to goal modalities.
+
+        Returns:
+            feats (dict): dictionary with "decoder" and "prior" features
+        """
+        return dict(
+            decoder=self.nets["decoder"].encode_features(condition=conditions, goal=goals),
+            prior=self.nets["prior"].encode_features(obs_dict=conditions, goal_dict=goals),
+        )
+
+    def decode(self, conditions=None, goals=None, z=None, n=None, feats=None):
         """
         Pass latents through decoder. Latents should be passed in to
         this function at train-time for backpropagation, but they
@@ -1167,6 +1222,9 @@ class VAE(torch.nn.Module):
                 generate from the prior. Only required if @z is None - i.e.
                 sampling takes place
 
+            feats (dict): if provided, precomputed features from @encode_condition_features,
+                used instead of @conditions and @goals
+
         Returns:
             recons (dict): dictionary of reconstructed inputs
         """
@@ -1174,7 +1232,7 @@ class VAE(torch.nn.Module):
         if z is None:
             # sample latents from prior distribution
             assert n is not None
-            z = self.sample_prior(n=n, conditions=conditions, goals=goals)
+            z = self.sample_prior(n=n, conditions=conditions, goals=goals, feats=feats)
 
         # decoder takes latents as input, and maybe condition variables 
         # and goal variables
@@ -1185,7 +1243,7 @@ class VAE(torch.nn.Module):
         )
 
         # pass through decoder to reconstruct variables in @self.output_shapes
-        recons = self.nets["decoder"](**inputs)
+        recons = self.nets["decoder"](feats=(None if feats is None else feats["decoder"]), **inputs)
 
         # apply tanh squashing to output modalities
         for k in self.output_squash:
@@ -1196,7 +1254,7 @@ class VAE(torch.nn.Module):
             recons[k] = torch.sigmoid(recons[k]) * (v_range[1] - v_range[0]) + v_range[0]
         return recons
 
-    def sample_prior(self, n, conditions=None, goals=None):
+    def sample_prior(self, n, conditions=None, goals=None, feats=None):
         """
         Samples from the prior using the prior parameters.
 
@@ -1211,10 +1269,14 @@ class VAE(torch.nn.Module):
             goals (dict): a dictionary that maps modalities to torch.Tensor
                 batches. These should correspond to goal modalities. Only for cVAEs.
 
+            feats (dict): if provided, precomputed features from @encode_condition_features,
+                used instead of @conditions and @goals
+
         Returns:
             z (torch.Tensor): sampled latents from the prior
         """
-        return self.nets["prior"].sample(n=n, obs_dict=conditions, goal_dict=goals)
+        prior_feats = None if feats is None else feats["prior"]
+        return self.nets["prior"].sample(n=n, obs_dict=conditions, goal_dict=goals, feats=prior_feats)
 
     def kl_loss(self, posterior_params, encoder_z=None, conditions=None, goals=None):
         """
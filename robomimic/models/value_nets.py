@@ -4,6 +4,7 @@ observation dictionary as input (and possibly additional conditioning,
 such as subgoal or goal dictionaries) and produce value or 
 action-value estimates or distributions.
 """
+import textwrap
 import numpy as np
 from collections import OrderedDict
 
@@ -13,7 +14,8 @@ import torch.nn.functional as F
 import torch.distributions as D
 
 import robomimic.utils.tensor_utils as TensorUtils
-from robomimic.models.obs_nets import MIMO_MLP
+from robomimic.models.base_nets import Module
+from robomimic.models.obs_nets import MIMO_MLP, ObservationGroupEncoder
 from robomimic.models.distributions import DiscreteValueDistribution
 
 
@@ -113,15 +115,24 @@ class ValueNetwork(MIMO_MLP):
         """
         return [1]
 
-    def forward(self, obs_dict, goal_dict=None):
+    def forward(self, obs_dict, goal_dict=None, feats=None):
         """
-        Forward through value network, and then optionally use tanh scaling.
+        Forward through value network, and then optionally use tanh scaling. Precomputed
+        observation features from @encode_features can be passed through @feats.
         """
-        values = super(ValueNetwork, self).forward(obs=obs_dict, goal=goal_dict)["value"]
+        values = super(ValueNetwork, self).forward(obs=obs_dict, goal=goal_dict, feats=feats)["value"]
         if self.value_bounds is not None:
             values = self._value_offset + self._value_scale * torch.tanh(values)
         return values
 
+    def encode_features(self, obs_dict, goal_dict=None):
+        """
+        Encode observations (and goals) once, so that the features can be re-used (for
+        example, tiled across several action proposals per observation) through the
+        @feats argument of @forward. See @MIMO_MLP.encode_features.
+        """
+        return super(ValueNetwork, self).encode_features(obs=obs_dict, goal=goal_dict)
+
     def _to_string(self):
         return "value_bounds={}".format(self.value_bounds)
 
@@ -188,18 +199,160 @@ class ActionValueNetwork(ValueNetwork):
             encoder_kwargs=encoder_kwargs,
         )
 
-    def forward(self, obs_dict, acts, goal_dict=None):
+    def forward(self, obs_dict, acts, goal_dict=None, feats=None):
         """
-        Modify forward from super class to include actions in inputs.
+        Modify forward from super class to include actions in inputs. If @feats from
+        @encode_features are provided, @obs_dict and @goal_dict can be None.
         """
-        inputs = dict(obs_dict)
+        inputs = dict(obs_dict) if obs_dict is not None else dict()
         inputs["action"] = acts
-        return super(ActionValueNetwork, self).forward(inputs, goal_dict)
+        return super(ActionValueNetwork, self).forward(inputs, goal_dict, feats=feats)
 
     def _to_string(self):
         return "action_dim={}\nvalue_bounds={}".format(self.ac_dim, self.value_bounds)
 
 
+class ActionValueEnsembleNetwork(Module):
+    """
+    An ensemble of Q (action-value) networks that share a single observation encoder.
+    Observations are encoded once per batch and broadcast across any number of actions
+    per observation, and the MLPs of all ensemble members are evaluated together with
+    batched matrix multiplies over stacked weights. Each member has the same MLP structure
+    as an @ActionValueNetwork.
+    """
+    def __init__(
+        self,
+        obs_shapes,
+        ac_dim,
+        mlp_layer_dims,
+        ensemble_size,
+        value_bounds=None,
+        goal_shapes=None,
+        encoder_kwargs=None,
+    ):
+        """
+        Args:
+            obs_shapes (OrderedDict): a dictionary that maps observation keys to
+                expected shapes for observations.
+
+            ac_dim (int): dimension of action space.
+
+            mlp_layer_dims ([int]): sequence of integers for the MLP hidden layers sizes. 
+
+            ensemble_size (int): number of Q networks in the ensemble
+
+            value_bounds (tuple): a 2-tuple corresponding to the lowest and highest possible return
+                that the network should be possible of generating. The network will rescale outputs
+                using a tanh layer to lie within these bounds. If None, no tanh re-scaling is done.
+
+            goal_shapes (OrderedDict): a dictionary that maps observation keys to
+                expected shapes for goal observations.
+
+            encoder_kwargs (dict or None): If None, results in default encoder_kwargs being applied. Otherwise, should
+                be nested dictionary containing relevant per-observation key information for encoder networks
+                (see @ValueNetwork).
+        """
+        super(ActionValueEnsembleNetwork, self).__init__()
+
+        self.ac_dim = ac_dim
+        self.ensemble_size = ensemble_size
+        self.value_bounds = value_bounds
+        if self.value_bounds is not None:
+            # convert [lb, ub] to a scale and offset for the tanh output, which is in [-1, 1]
+            self._value_scale = (float(self.value_bounds[1]) - float(self.value_bounds[0])) / 2.
+            self._value_offset = (float(self.value_bounds[1]) + float(self.value_bounds[0])) / 2.
+
+        assert isinstance(obs_shapes, OrderedDict)
+        self.obs_shapes = obs_shapes
+
+        # set up different observation groups for the shared encoder
+        observation_group_shapes = OrderedDict()
+        observation_group_shapes["obs"] = OrderedDict(self.obs_shapes)
+        if goal_shapes is not None and len(goal_shapes) > 0:
+            assert isinstance(goal_shapes, OrderedDict)
+            observation_group_shapes["goal"] = OrderedDict(goal_shapes)
+
+        self.nets = nn.ModuleDict()
+        self.nets["encoder"] = ObservationGroupEncoder(
+            observation_group_shapes=observation_group_shapes,
+            encoder_kwargs=encoder_kwargs,
+        )
+        self._feat_dim = self.nets["encoder"].output_shape()[0]
+
+        # stacked per-member weights of shape [ensemble_size, in_dim, out_dim], with the
+        # same initialization as nn.Linear. The first layer takes [obs features, action].
+        dims = [self._feat_dim + ac_dim] + list(mlp_layer_dims) + [1]
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for in_dim, out_dim in zip(dims[:-1], dims[1:]):
+            bound = 1. / np.sqrt(in_dim)
+            self.weights.append(nn.Parameter(torch.empty(ensemble_size, in_dim, out_dim).uniform_(-bound, bound)))
+            self.biases.append(nn.Parameter(torch.empty(ensemble_size, 1, out_dim).uniform_(-bound, bound)))
+
+    def output_shape(self, input_shape=None):
+        """
+        Function to compute output shape from inputs to this module. 
+
+        Args:
+            input_shape (iterable of int): shape of input. Does not include batch dimension.
+                Some modules may not need this argument, if their output does not depend 
+                on the size of the input, or if they assume fixed size input.
+
+        Returns:
+            out_shape ([int]): list of integers corresponding to output shape
+        """
+        return [self.ensemble_size, 1]
+
+    def forward(self, obs_dict, acts, goal_dict=None):
+        """
+        Evaluate all ensemble members.
+
+        Args:
+            obs_dict (dict): batch of observations
+            acts (torch.Tensor): actions of shape [B, A], or [B, M, A] for M actions per observation
+            goal_dict (dict): (optional) batch of goal observations
+
+        Returns:
+            values (torch.Tensor): values of shape [ensemble_size, B, 1] for actions of shape [B, A],
+                or [ensemble_size, B, M] for actions of shape [B, M, A]
+        """
+        if acts.dim() == 2:
+            acts = acts.unsqueeze(1)
+        B, M, _ = acts.shape
+        E = self.ensemble_size
+
+        # encode observations once, and project them with the first layer once per observation
+        feats = self.nets["encoder"](obs=obs_dict, goal=goal_dict)
+        w, b = self.weights[0], self.biases[0]
+        H = w.shape[-1]
+        w_feat = w[:, :self._feat_dim].permute(1, 0, 2).reshape(self._feat_dim, E * H)
+        w_act = w[:, self._feat_dim:].permute(1, 0, 2).reshape(self.ac_dim, E * H)
+        x = (feats @ w_feat).unsqueeze(1) + acts @ w_act                    # [B, M, E * H]
+        x = x.reshape(B * M, E, H).transpose(0, 1) + b                      # [E, B * M, H]
+
+        # remaining layers for all members in one batched matmul each
+        for w, b in zip(self.weights[1:], self.biases[1:]):
+            x = torch.baddbmm(b, torch.relu(x), w)
+
+        values = x.reshape(E, B, M)
+        if self.value_bounds is not None:
+            values = self._value_offset + self._value_scale * torch.tanh(values)
+        return values
+
+    def _to_string(self):
+        return "action_dim={}\nensemble_size={}\nvalue_bounds={}".format(self.ac_dim, self.ensemble_size, self.value_bounds)
+
+    def __repr__(self):
+        """Pretty print network."""
+        header = '{}'.format(str(self.__class__.__name__))
+        indent = ' ' * 4
+        msg = textwrap.indent("\n" + self._to_string() + "\n", indent)
+        msg += textwrap.indent("\nencoder={}".format(self.nets["encoder"]), indent)
+        msg += textwrap.indent("\n\nmlp_layer_dims={}".format([w.shape[-1] for w in self.weights[:-1]]), indent)
+        msg = header + '(' + msg + '\n)'
+        return msg
+
+
 class DistributionalActionValueNetwork(ActionValueNetwork):
     """
     Distributional Q (action-value) network that outputs a categorical distribution over
@@ -273,7 +426,7 @@ class DistributionalActionValueNetwork(ActionValueNetwork):
         """
         return OrderedDict(log_probs=(self.num_atoms,))
 
-    def forward_train(self, obs_dict, acts, goal_dict=None):
+    def forward_train(self, obs_dict, acts, goal_dict=None, feats=None):
         """
         Return full critic categorical distribution.
 
@@ -281,24 +434,25 @@ class DistributionalActionValueNetwork(ActionValueNetwork):
             obs_dict (dict): batch of observations
             acts (torch.Tensor): batch of actions
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             value_distribution (DiscreteValueDistribution instance)
         """
 
         # add in actions
-        inputs = dict(obs_dict)
+        inputs = dict(obs_dict) if obs_dict is not None else dict()
         inputs["action"] = acts
 
         # network returns unnormalized log probabilities (logits) for each of the value atoms
-        logits = MIMO_MLP.forward(self, obs=inputs, goal=goal_dict)["log_probs"]
+        logits = MIMO_MLP.forward(self, obs=inputs, goal=goal_dict, feats=feats)["log_probs"]
 
         # turn these logits into a categorical distribution over the value atoms.
         # (unsqueeze to make sure atoms are compatible with batch operations)
         value_atoms = torch.Tensor(self._atoms).unsqueeze(0).to(logits.device)
         return DiscreteValueDistribution(values=value_atoms, logits=logits)
 
-    def forward(self, obs_dict, acts, goal_dict=None):
+    def forward(self, obs_dict, acts, goal_dict=None, feats=None):
         """
         Return mean of critic categorical distribution. Useful for obtaining
         point estimates of critic values.
@@ -307,11 +461,12 @@ class DistributionalActionValueNetwork(ActionValueNetwork):
             obs_dict (dict): batch of observations
             acts (torch.Tensor): batch of actions
             goal_dict (dict): if not None, batch of goal observations
+            feats (dict): if not None, precomputed observation features from @encode_features
 
         Returns:
             mean_value (torch.Tensor): expectation of value distribution
         """
-        vd = self.forward_train(obs_dict=obs_dict, acts=acts, goal_dict=goal_dict)
+        vd = self.forward_train(obs_dict=obs_dict, acts=acts, goal_dict=goal_dict, feats=feats)
         return vd.mean()
 
     def _to_string(self):
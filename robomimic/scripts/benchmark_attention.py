@@ -0,0 +1,138 @@
+"""
+Memory / throughput benchmark for the self-attention backends of @CausalSelfAttention.
+For each context length, times a training step (forward and backward) of a single
+attention layer with the "math" backend (explicit attention matrix, mask, and softmax)
+and the "sdpa" backend (fused torch.nn.functional.scaled_dot_product_attention), and
+reports peak memory on GPU.
+
+Args:
+    device (str): torch device to run on (defaults to cuda if available)
+
+    batch_size (int): batch size
+
+    embed_dim (int): embedding dimension
+
+    num_heads (int): number of attention heads
+
+    context_lengths (int): context lengths to benchmark
+
+    iters (int): number of timed training steps per setting
+
+Example usage:
+    python benchmark_attention.py --batch_size 16 --context_lengths 10 50 200 1000
+"""
+import time
+import argparse
+
+import torch
+
+from robomimic.models.transformers import CausalSelfAttention
+
+
+def run_step(attention, x):
+    attention(x).sum().backward()
+
+
+def benchmark_backend(backend, args, context_length, device):
+    """
+    Returns the average time per training step (in milliseconds) and peak memory (in MB,
+    None if not on GPU) for attention @backend at @context_length.
+    """
+    torch.manual_seed(0)
+    attention = CausalSelfAttention(
+        embed_dim=args.embed_dim,
+        num_heads=args.num_heads,
+        context_length=context_length,
+        attn_dropout=0.1,
+        output_dropout=0.1,
+        attention_backend=backend,
+    ).to(device)
+    x = torch.randn(args.batch_size, context_length, args.embed_dim, device=device, requires_grad=True)
+
+    for _ in range(5):
+        run_step(attention, x)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    t = time.time()
+    for _ in range(args.iters):
+        run_step(attention, x)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    step_time = 1000. * (time.time() - t) / args.iters
+    peak_mem = (torch.cuda.max_memory_allocated() / (1024. ** 2)) if device.type == "cuda" else None
+    return step_time, peak_mem
+
+
+def check_outputs_match(args, context_length, device):
+    """
+    Returns the maximum absolute difference between eval-mode outputs of the two backends.
+    """
+    math_attention = CausalSelfAttention(
+        embed_dim=args.embed_dim, num_heads=args.num_heads, context_length=context_length, attention_backend="math",
+    ).to(device).eval()
+    sdpa_attention = CausalSelfAttention(
+        embed_dim=args.embed_dim, num_heads=args.num_heads, context_length=context_length, attention_backend="sdpa",
+    ).to(device).eval()
+    sdpa_attention.load_state_dict(math_attention.state_dict())
+    x = torch.randn(2, context_length, args.embed_dim, device=device)
+    with torch.no_grad():
+        return (math_attention(x) - sdpa_attention(x)).abs().max().item()
+
+
+def benchmark(args):
+    device = torch.device(args.device)
+    print("device: {}, batch size: {}, embed dim: {}, heads: {}".format(
+        device, args.batch_size, args.embed_dim, args.num_heads))
+    print("{:>8} {:>14} {:>14} {:>9} {:>12} {:>12} {:>10}".format(
+        "T", "math ms/step", "sdpa ms/step", "speedup", "math MB", "sdpa MB", "max diff"))
+    for context_length in args.context_lengths:
+        math_time, math_mem = benchmark_backend("math", args, context_length, device)
+        sdpa_time, sdpa_mem = benchmark_backend("sdpa", args, context_length, device)
+        max_diff = check_outputs_match(args, context_length, device)
+        fmt_mem = lambda m: "n/a" if m is None else "{:.1f}".format(m)
+        print("{:>8} {:>14.3f} {:>14.3f} {:>8.2f}x {:>12} {:>12} {:>10.2e}".format(
+            context_length, math_time, sdpa_time, math_time / sdpa_time, fmt_mem(math_mem), fmt_mem(sdpa_mem), max_diff))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="torch device to run on",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=16,
+        help="batch size",
+    )
+    parser.add_argument(
+        "--embed_dim",
+        type=int,
+        default=512,
+        help="embedding dimension",
+    )
+    parser.add_argument(
+        "--num_heads",
+        type=int,
+        default=8,
+        help="number of attention heads",
+    )
+    parser.add_argument(
+        "--context_lengths",
+        type=int,
+        nargs="+",
+        default=[10, 50, 200, 500, 1000],
+        help="context lengths to benchmark",
+    )
+    parser.add_argument(
+        "--iters",
+        type=int,
+        default=20,
+        help="number of timed training steps per setting",
+    )
+    args = parser.parse_args()
+    benchmark(args)
@@ -0,0 +1,139 @@
+"""
+Benchmark for random image crops used by @CropRandomizer. Compares the previous
+gather-based implementation of @ObsUtils.crop_image_from_indices (which expands the
+source images once per crop and gathers from flattened pixels) with the current
+implementation (which indexes a strided view of all crop windows), for 84x84 and
+120x160 images.
+
+Args:
+    device (str): torch device to run on (defaults to cuda if available)
+
+    batch_size (int): number of images per batch
+
+    num_crops (int): number of crops per image
+
+    iters (int): number of timed calls per setting
+
+Example usage:
+    python benchmark_crop.py --batch_size 256 --num_crops 1
+"""
+import time
+import argparse
+
+import torch
+
+import robomimic.utils.tensor_utils as TU
+import robomimic.utils.obs_utils as ObsUtils
+
+
+# (image height, image width, crop height, crop width)
+SETTINGS = [
+    (84, 84, 76, 76),
+    (120, 160, 108, 144),
+]
+
+
+def gather_crop_image_from_indices(images, crop_indices, crop_height, crop_width):
+    """
+    Reference implementation - previous version of @ObsUtils.crop_image_from_indices, for images
+    of shape [..., C, H, W] and crop indices of shape [..., N, 2].
+    """
+    device = images.device
+    image_c, image_h, image_w = images.shape[-3:]
+    num_crops = crop_indices.shape[-2]
+
+    assert (crop_indices[..., 0] >= 0).all().item()
+    assert (crop_indices[..., 0] < (image_h - crop_height)).all().item()
+    assert (crop_indices[..., 1] >= 0).all().item()
+    assert (crop_indices[..., 1] < (image_w - crop_width)).all().item()
+
+    crop_ind_grid_h = TU.unsqueeze_expand_at(torch.arange(crop_height).to(device), size=crop_width, dim=-1)
+    crop_ind_grid_w = TU.unsqueeze_expand_at(torch.arange(crop_width).to(device), size=crop_height, dim=0)
+    crop_in_grid = torch.cat((crop_ind_grid_h.unsqueeze(-1), crop_ind_grid_w.unsqueeze(-1)), dim=-1)
+
+    grid_reshape = [1] * len(crop_indices.shape[:-1]) + [crop_height, crop_width, 2]
+    all_crop_inds = crop_indices.unsqueeze(-2).unsqueeze(-2) + crop_in_grid.reshape(grid_reshape)
+    all_crop_inds = all_crop_inds[..., 0] * image_w + all_crop_inds[..., 1]
+    all_crop_inds = TU.unsqueeze_expand_at(all_crop_inds, size=image_c, dim=-3)
+    all_crop_inds = TU.flatten(all_crop_inds, begin_axis=-2)
+
+    images_to_crop = TU.unsqueeze_expand_at(images, size=num_crops, dim=-4)
+    images_to_crop = TU.flatten(images_to_crop, begin_axis=-2)
+    crops = torch.gather(images_to_crop, dim=-1, index=all_crop_inds)
+    reshape_axis = len(crops.shape) - 1
+    return TU.reshape_dimensions(crops, begin_axis=reshape_axis, end_axis=reshape_axis,
+                                 target_dims=(crop_height, crop_width))
+
+
+def time_crop(crop_fn, images, crop_inds, crop_height, crop_width, iters, device):
+    """
+    Returns the average time per call (in milliseconds) and peak memory (in MB, None if not on GPU).
+    """
+    for _ in range(5):
+        crop_fn(images, crop_inds, crop_height, crop_width)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    t = time.time()
+    for _ in range(iters):
+        crop_fn(images, crop_inds, crop_height, crop_width)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    call_time = 1000. * (time.time() - t) / iters
+    peak_mem = (torch.cuda.max_memory_allocated() / (1024. ** 2)) if device.type == "cuda" else None
+    return call_time, peak_mem
+
+
+def benchmark(args):
+    device = torch.device(args.device)
+    print("device: {}, batch size: {}, crops per image: {}".format(device, args.batch_size, args.num_crops))
+    print("{:>12} {:>10} {:>15} {:>15} {:>9} {:>12} {:>12} {:>7}".format(
+        "image", "crop", "gather ms/call", "strided ms/call", "speedup", "gather MB", "strided MB", "match"))
+    fmt_mem = lambda m: "n/a" if m is None else "{:.1f}".format(m)
+    for image_h, image_w, crop_height, crop_width in SETTINGS:
+        images = torch.rand(args.batch_size, 3, image_h, image_w, device=device)
+        crop_inds_h = ((image_h - crop_height) * torch.rand(args.batch_size, args.num_crops, device=device)).long()
+        crop_inds_w = ((image_w - crop_width) * torch.rand(args.batch_size, args.num_crops, device=device)).long()
+        crop_inds = torch.stack((crop_inds_h, crop_inds_w), dim=-1)
+
+        match = torch.equal(
+            gather_crop_image_from_indices(images, crop_inds, crop_height, crop_width),
+            ObsUtils.crop_image_from_indices(images, crop_inds, crop_height, crop_width),
+        )
+        gather_time, gather_mem = time_crop(
+            gather_crop_image_from_indices, images, crop_inds, crop_height, crop_width, args.iters, device)
+        strided_time, strided_mem = time_crop(
+            ObsUtils.crop_image_from_indices, images, crop_inds, crop_height, crop_width, args.iters, device)
+        print("{:>12} {:>10} {:>15.3f} {:>15.3f} {:>8.2f}x {:>12} {:>12} {:>7}".format(
+            "{}x{}".format(image_h, image_w), "{}x{}".format(crop_height, crop_width), gather_time, strided_time,
+            gather_time / strided_time, fmt_mem(gather_mem), fmt_mem(strided_mem), str(match)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="torch device to run on",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=256,
+        help="number of images per batch",
+    )
+    parser.add_argument(
+        "--num_crops",
+        type=int,
+        default=1,
+        help="number of crops per image",
+    )
+    parser.add_argument(
+        "--iters",
+        type=int,
+        default=50,
+        help="number of timed calls per setting",
+    )
+    args = parser.parse_args()
+    benchmark(args)
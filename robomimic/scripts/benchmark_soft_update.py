@@ -0,0 +1,146 @@
+"""
+Micro-benchmark for target network soft updates. Compares the previous per-parameter
+Python loop (target.copy_(target * (1 - tau) + source * tau)) with the fused in-place
+update in @TorchUtils.soft_update, on an ensemble of critic-sized MLPs.
+
+Args:
+    device (str): torch device to run on (defaults to cuda if available)
+
+    ensemble_size (int): number of critics in the ensemble
+
+    in_dim (int): input dimension of each critic MLP
+
+    layer_dims (int): hidden layer sizes of each critic MLP
+
+    num_layers (int): number of hidden layers of each critic MLP
+
+    iters (int): number of timed updates per method
+
+Example usage:
+    python benchmark_soft_update.py --ensemble_size 2 --layer_dims 300 --num_layers 2
+"""
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+
+import robomimic.utils.torch_utils as TorchUtils
+
+
+def loop_soft_update(source, target, tau):
+    """
+    Reference implementation - one temporary per parameter and a Python loop over parameters.
+    """
+    for target_param, param in zip(target.parameters(), source.parameters()):
+        target_param.copy_(
+            target_param * (1.0 - tau) + param * tau
+        )
+
+
+def make_ensemble(ensemble_size, in_dim, layer_dims, num_layers, device):
+    ensemble = nn.ModuleList()
+    for _ in range(ensemble_size):
+        layers = []
+        dims = [in_dim] + [layer_dims] * num_layers
+        for d_in, d_out in zip(dims[:-1], dims[1:]):
+            layers += [nn.Linear(d_in, d_out), nn.ReLU()]
+        layers.append(nn.Linear(dims[-1], 1))
+        ensemble.append(nn.Sequential(*layers))
+    return ensemble.to(device)
+
+
+def time_update(update_fn, iters, device):
+    """
+    Returns the average time (in milliseconds) per call of @update_fn.
+    """
+    for _ in range(10):
+        update_fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    t = time.time()
+    for _ in range(iters):
+        update_fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return 1000. * (time.time() - t) / iters
+
+
+def benchmark(args):
+    device = torch.device(args.device)
+    source = make_ensemble(args.ensemble_size, args.in_dim, args.layer_dims, args.num_layers, device)
+    target = make_ensemble(args.ensemble_size, args.in_dim, args.layer_dims, args.num_layers, device)
+    tau = 0.005
+
+    # check that both methods agree
+    with torch.no_grad():
+        TorchUtils.hard_update(source=source, target=target)
+        for p in source.parameters():
+            p.add_(torch.randn_like(p))
+        ref = [p.clone() for p in target.parameters()]
+        for t, s in zip(ref, source.parameters()):
+            t.copy_(t * (1.0 - tau) + s * tau)
+        TorchUtils.soft_update(source=source, target=target, tau=tau)
+        max_err = max((t - r).abs().max().item() for t, r in zip(target.parameters(), ref))
+
+    updater = TorchUtils.EMAUpdater(source=source, target=target, tau=tau)
+    with torch.no_grad():
+        results = [
+            ("loop (per critic)", time_update(
+                lambda: [loop_soft_update(s, t, tau) for s, t in zip(source, target)], args.iters, device)),
+            ("soft_update (per critic)", time_update(
+                lambda: [TorchUtils.soft_update(source=s, target=t, tau=tau) for s, t in zip(source, target)], args.iters, device)),
+            ("soft_update (ensemble)", time_update(
+                lambda: TorchUtils.soft_update(source=source, target=target, tau=tau), args.iters, device)),
+            ("EMAUpdater", time_update(updater.update, args.iters, device)),
+        ]
+
+    num_params = sum(p.numel() for p in source.parameters())
+    print("device: {}, ensemble size: {}, parameter tensors: {}, parameters: {}".format(
+        device, args.ensemble_size, len(list(source.parameters())), num_params))
+    print("max abs difference from reference: {}".format(max_err))
+    base = results[0][1]
+    for name, ms in results:
+        print("{:<28} {:8.4f} ms / update  ({:.2f}x)".format(name, ms, base / ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="torch device to run on",
+    )
+    parser.add_argument(
+        "--ensemble_size",
+        type=int,
+        default=2,
+        help="number of critics in the ensemble",
+    )
+    parser.add_argument(
+        "--in_dim",
+        type=int,
+        default=64,
+        help="input dimension of each critic MLP",
+    )
+    parser.add_argument(
+        "--layer_dims",
+        type=int,
+        default=300,
+        help="hidden layer sizes of each critic MLP",
+    )
+    parser.add_argument(
+        "--num_layers",
+        type=int,
+        default=2,
+        help="number of hidden layers of each critic MLP",
+    )
+    parser.add_argument(
+        "--iters",
+        type=int,
+        default=1000,
+        help="number of timed updates per method",
+    )
+    args = parser.parse_args()
+    benchmark(args)
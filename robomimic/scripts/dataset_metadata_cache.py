@@ -0,0 +1,115 @@
+"""
+Helper script to build or clear the on-disk metadata cache for a dataset (see utils/cache_utils.py).
+The cache stores demo lengths, observation shapes and dtypes, and observation normalization statistics,
+keyed by the dataset path, size, and modification time. Building it ahead of time means that training
+runs and hyperparameter sweeps on the dataset start without re-scanning the whole file.
+
+Args:
+    dataset (str): path to hdf5 dataset
+
+    config (str): (optional) path to a training config json. If provided, observation normalization
+        statistics are also computed for the observation keys (and filter key) in the config, if the
+        config uses observation normalization.
+
+    filter_key (str): (optional) filter key to compute normalization statistics over. Overrides the
+        filter key in the config.
+
+    num_workers (int): number of worker processes used to compute normalization statistics
+
+    clear (bool): if flag is provided, remove all cache entries for the dataset instead of building them
+
+Example usage:
+
+    # cache demo lengths and observation shapes
+    python dataset_metadata_cache.py --dataset /path/to/dataset.hdf5
+
+    # additionally cache normalization statistics for a training config
+    python dataset_metadata_cache.py --dataset /path/to/dataset.hdf5 --config /path/to/config.json
+
+    # invalidate the cache
+    python dataset_metadata_cache.py --dataset /path/to/dataset.hdf5 --clear
+"""
+import os
+import json
+import argparse
+
+import robomimic.utils.obs_utils as ObsUtils
+import robomimic.utils.cache_utils as CacheUtils
+from robomimic.config import config_factory
+from robomimic.utils.dataset import SequenceDataset
+
+
+def dataset_metadata_cache(args):
+    dataset_path = os.path.expanduser(args.dataset)
+    cache_dir = CacheUtils.get_cache_dir_for_dataset(dataset_path)
+
+    if args.clear:
+        CacheUtils.clear_cache(dataset_path)
+        print("cleared metadata cache at {}".format(cache_dir))
+        return
+
+    metadata = CacheUtils.get_demo_metadata(dataset_path)
+    print("cached metadata for {} demos at {}".format(len(metadata["demo_lengths"]), cache_dir))
+
+    if args.config is None:
+        return
+
+    ext_cfg = json.load(open(args.config, 'r'))
+    config = config_factory(ext_cfg["algo_name"])
+    with config.values_unlocked():
+        config.update(ext_cfg)
+    if not config.train.hdf5_normalize_obs:
+        print("config does not use observation normalization - skipping normalization statistics")
+        return
+
+    # observation processing (and therefore the statistics) depends on the observation modalities
+    ObsUtils.initialize_obs_utils_with_config(config)
+    filter_key = args.filter_key if args.filter_key is not None else config.train.hdf5_filter_key
+
+    # constructing the dataset computes the statistics and writes them to the cache
+    SequenceDataset(
+        hdf5_path=dataset_path,
+        obs_keys=config.all_obs_keys,
+        dataset_keys=config.train.dataset_keys,
+        hdf5_cache_mode=None,
+        hdf5_normalize_obs=True,
+        hdf5_use_metadata_cache=True,
+        hdf5_normalize_obs_num_workers=args.num_workers,
+        filter_by_attribute=filter_key,
+    )
+    print("cached observation normalization statistics for filter key {}".format(filter_key))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        required=True,
+        help="path to hdf5 dataset",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="(optional) path to a training config json - used to also cache observation normalization statistics",
+    )
+    parser.add_argument(
+        "--filter_key",
+        type=str,
+        default=None,
+        help="(optional) filter key to compute normalization statistics over (overrides the config)",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of worker processes used to compute normalization statistics (0 to use this process)",
+    )
+    parser.add_argument(
+        "--clear",
+        action='store_true',
+        help="remove all cache entries for the dataset instead of building them",
+    )
+    args = parser.parse_args()
+    dataset_metadata_cache(args)
@@ -24,6 +24,20 @@ Args:
 
     copy_dones (bool): if provided, copy dones from source file instead of inferring them
 
+    num_workers (int): number of worker processes (each with its own environment) used to replay
+        demonstrations. Trajectories are streamed back to this process, which writes them in order.
+        If 0, demonstrations are replayed in this process.
+
+    seq_length (int): observations are written in chunks that span a multiple of this many timesteps,
+        so that a training sequence of this length touches at most two chunks. Set it to the
+        seq_length (or frame_stack) used for training.
+
+    image_compression (str): if provided, compress image observations with this filter ("gzip" or "lz4").
+        lz4 requires the hdf5plugin package, both for writing and for reading the dataset.
+
+    share_next_obs (bool): if flag is set, next_obs is stored as a virtual view of obs shifted by one
+        timestep (plus the final next observation), instead of a second copy of every observation
+
 Example usage:
     
     # extract low-dimensional observations
@@ -43,6 +57,12 @@ Example usage:
         --done_mode 2 --camera_names agentview robot0_eye_in_hand --camera_height 84 --camera_width 84 \
         --compress --exclude-next-obs
 
+    # (faster option) replay demos in 8 worker processes, compress images with lz4, chunk for
+    # training sequences of length 10, and share storage between obs and next_obs
+    python dataset_states_to_obs.py --dataset /path/to/demo.hdf5 --output_name image.hdf5 \
+        --done_mode 2 --camera_names agentview robot0_eye_in_hand --camera_height 84 --camera_width 84 \
+        --num_workers 8 --image_compression lz4 --seq_length 10 --share_next_obs
+
     # use dense rewards, and only annotate the end of trajectories with done signal
     python dataset_states_to_obs.py --dataset /path/to/demo.hdf5 --output_name image_dense_done_1.hdf5 \
         --done_mode 1 --dense --camera_names agentview robot0_eye_in_hand --camera_height 84 --camera_width 84
@@ -51,8 +71,8 @@ import os
 import json
 import h5py
 import argparse
+import multiprocessing
 import numpy as np
-from copy import deepcopy
 from tqdm import tqdm
 
 import robomimic.utils.tensor_utils as TensorUtils
@@ -103,8 +123,6 @@ def extract_trajectory(
         )
 
     traj = dict(
-        obs=[], 
-        next_obs=[], 
         rewards=[], 
         dones=[], 
         actions=np.array(actions), 
@@ -112,6 +130,8 @@ def extract_trajectory(
         initial_state_dict=initial_state,
     )
     traj_len = states.shape[0]
+    # next_obs is obs shifted by one timestep, so collect each observation once
+    obs_frames = [obs]
     # iteration variable @t is over "next obs" indices
     for t in range(1, traj_len + 1):
 
@@ -139,31 +159,32 @@ def extract_trajectory(
         done = int(done)
 
         # collect transition
-        traj["obs"].append(obs)
-        traj["next_obs"].append(next_obs)
+        obs_frames.append(next_obs)
         traj["rewards"].append(r)
         traj["dones"].append(done)
 
-        # update for next iter
-        obs = deepcopy(next_obs)
-
-    # convert list of dict to dict of list for obs dictionaries (for convenient writes to hdf5 dataset)
-    traj["obs"] = TensorUtils.list_of_flat_dict_to_dict_of_list(traj["obs"])
-    traj["next_obs"] = TensorUtils.list_of_flat_dict_to_dict_of_list(traj["next_obs"])
-
     # list to numpy array
-    for k in traj:
-        if k == "initial_state_dict":
-            continue
-        if isinstance(traj[k], dict):
-            for kp in traj[k]:
-                traj[k][kp] = np.array(traj[k][kp])
-        else:
-            traj[k] = np.array(traj[k])
+    traj["rewards"] = np.array(traj["rewards"])
+    traj["dones"] = np.array(traj["dones"])
+
+    # convert list of dict to dict of arrays, of length traj_len + 1 - obs and next_obs are views into it
+    obs_frames = TensorUtils.list_of_flat_dict_to_dict_of_list(obs_frames)
+    traj["obs_frames"] = { k : np.array(obs_frames[k]) for k in obs_frames }
+    split_obs_frames(traj)
 
     return traj, camera_info
 
 
+def split_obs_frames(traj):
+    """
+    Set the "obs" and "next_obs" entries of a trajectory from @extract_trajectory as views of
+    its "obs_frames" entry (observations at timesteps 0 to T, inclusive). Views are dropped
+    before sending a trajectory between processes so that each observation is only sent once.
+    """
+    traj["obs"] = { k : traj["obs_frames"][k][:-1] for k in traj["obs_frames"] }
+    traj["next_obs"] = { k : traj["obs_frames"][k][1:] for k in traj["obs_frames"] }
+
+
 def get_camera_info(
     env,
     camera_names=None, 
@@ -206,13 +227,123 @@ def get_camera_info(
     return camera_info
 
 
-def dataset_states_to_obs(args):
-    if args.depth:
-        assert len(args.camera_names) > 0, "must specify camera names if using depth"
+def load_and_extract_trajectory(env, f, ep, args, is_robosuite_env):
+    """
+    Replay demonstration @ep from source hdf5 file @f in @env to extract observations, rewards,
+    and dones (see @extract_trajectory), optionally copying rewards and dones from the source file.
+    """
+    # prepare initial state to reload from
+    states = f["data/{}/states".format(ep)][()]
+    initial_state = dict(states=states[0])
+    if is_robosuite_env:
+        initial_state["model"] = f["data/{}".format(ep)].attrs["model_file"]
+
+    # extract obs, rewards, dones
+    actions = f["data/{}/actions".format(ep)][()]
+    traj, camera_info = extract_trajectory(
+        env=env, 
+        initial_state=initial_state, 
+        states=states, 
+        actions=actions,
+        done_mode=args.done_mode,
+        camera_names=args.camera_names, 
+        camera_height=args.camera_height, 
+        camera_width=args.camera_width,
+    )
 
-    # create environment to use for data processing
-    env_meta = FileUtils.get_env_metadata_from_dataset(dataset_path=args.dataset)
-    env = EnvUtils.create_env_for_data_processing(
+    # maybe copy reward or done signal from source file
+    if args.copy_rewards:
+        traj["rewards"] = f["data/{}/rewards".format(ep)][()]
+    if args.copy_dones:
+        traj["dones"] = f["data/{}/dones".format(ep)][()]
+
+    return traj, camera_info
+
+
+def get_chunk_shape(shape, dtype, seq_length, target_chunk_bytes=(1 << 20)):
+    """
+    Chunk shape for a per-timestep dataset with shape @shape. Chunks span a multiple of @seq_length
+    timesteps, so that a sequence of @seq_length timesteps touches at most two chunks, and are grown
+    up to @target_chunk_bytes (the default hdf5 chunk cache size). Returns None for empty datasets,
+    which cannot be chunked.
+    """
+    if shape[0] == 0:
+        return None
+    frame_bytes = max(int(np.prod(shape[1:])) * np.dtype(dtype).itemsize, 1)
+    num_seqs = max(1, target_chunk_bytes // (seq_length * frame_bytes))
+    return (min(shape[0], seq_length * num_seqs),) + tuple(shape[1:])
+
+
+def get_compression_kwargs(compression):
+    """
+    Keyword arguments for h5py's create_dataset to compress with @compression (None, "gzip", or "lz4").
+    """
+    if compression is None:
+        return dict()
+    if compression == "gzip":
+        return dict(compression="gzip")
+    assert compression == "lz4", "unknown compression {}".format(compression)
+    try:
+        import hdf5plugin
+    except ImportError:
+        raise Exception("lz4 compression requires the hdf5plugin package (pip install hdf5plugin)")
+    return dict(hdf5plugin.LZ4())
+
+
+def write_trajectory(data_grp, ep, traj, camera_info, args, is_robosuite_env):
+    """
+    Write a trajectory from @load_and_extract_trajectory to group "data/@ep" of the output file.
+    Observations are chunked along time (see @get_chunk_shape) and optionally compressed.
+    """
+    # IMPORTANT: keep name of group the same as source file, to make sure that filter keys are
+    #            consistent as well
+    ep_data_grp = data_grp.create_group(ep)
+    ep_data_grp.create_dataset("actions", data=np.array(traj["actions"]))
+    ep_data_grp.create_dataset("states", data=np.array(traj["states"]))
+    ep_data_grp.create_dataset("rewards", data=np.array(traj["rewards"]))
+    ep_data_grp.create_dataset("dones", data=np.array(traj["dones"]))
+
+    for k in traj["obs"]:
+        obs = traj["obs"][k]
+        kwargs = dict(chunks=get_chunk_shape(obs.shape, obs.dtype, seq_length=args.seq_length))
+        if (args.image_compression is not None) and (obs.ndim == 4):
+            # image observations (T, H, W, C)
+            kwargs.update(get_compression_kwargs(args.image_compression))
+        elif args.compress:
+            kwargs.update(get_compression_kwargs("gzip"))
+        obs_dset = ep_data_grp.create_dataset("obs/{}".format(k), data=obs, **kwargs)
+
+        if args.exclude_next_obs:
+            continue
+        if not args.share_next_obs:
+            ep_data_grp.create_dataset("next_obs/{}".format(k), data=traj["next_obs"][k], **kwargs)
+            continue
+
+        # only store the final next observation - the rest of next_obs is obs shifted by one timestep
+        n = obs.shape[0]
+        last_dset = ep_data_grp.create_dataset("next_obs_last/{}".format(k), data=traj["next_obs"][k][-1:])
+        layout = h5py.VirtualLayout(shape=obs.shape, dtype=obs.dtype)
+        if n > 1:
+            # "." refers to the file containing the virtual dataset, so the output file can be moved
+            layout[:n - 1] = h5py.VirtualSource(".", obs_dset.name, shape=obs.shape)[1:]
+        layout[n - 1:] = h5py.VirtualSource(".", last_dset.name, shape=last_dset.shape)
+        ep_data_grp.create_virtual_dataset("next_obs/{}".format(k), layout)
+
+    # episode metadata
+    if is_robosuite_env:
+        ep_data_grp.attrs["model_file"] = traj["initial_state_dict"]["model"] # model xml for this episode
+    ep_data_grp.attrs["num_samples"] = traj["actions"].shape[0] # number of transitions in this episode
+
+    if camera_info is not None:
+        assert is_robosuite_env
+        ep_data_grp.attrs["camera_info"] = json.dumps(camera_info, indent=4)
+
+
+def create_env(env_meta, args):
+    """
+    Create environment to use for data processing.
+    """
+    return EnvUtils.create_env_for_data_processing(
         env_meta=env_meta,
         camera_names=args.camera_names, 
         camera_height=args.camera_height, 
@@ -221,6 +352,45 @@ def dataset_states_to_obs(args):
         use_depth_obs=args.depth,
     )
 
+
+# environment and source file handle for each worker process (see @_init_worker)
+_WORKER_STATE = dict()
+
+
+def _init_worker(env_meta, args):
+    """
+    Create an environment and open the source file once per worker process.
+    """
+    _WORKER_STATE["env"] = create_env(env_meta=env_meta, args=args)
+    _WORKER_STATE["f"] = h5py.File(args.dataset, "r")
+    _WORKER_STATE["args"] = args
+    _WORKER_STATE["is_robosuite_env"] = EnvUtils.is_robosuite_env(env_meta)
+
+
+def _extract_in_worker(ep):
+    """
+    Extract demonstration @ep in a worker process. Only the observation frames are sent back,
+    since obs and next_obs are views into them (see @split_obs_frames).
+    """
+    traj, camera_info = load_and_extract_trajectory(
+        env=_WORKER_STATE["env"],
+        f=_WORKER_STATE["f"],
+        ep=ep,
+        args=_WORKER_STATE["args"],
+        is_robosuite_env=_WORKER_STATE["is_robosuite_env"],
+    )
+    del traj["obs"], traj["next_obs"]
+    return ep, traj, camera_info
+
+
+def dataset_states_to_obs(args):
+    if args.depth:
+        assert len(args.camera_names) > 0, "must specify camera names if using depth"
+
+    # create environment to use for data processing
+    env_meta = FileUtils.get_env_metadata_from_dataset(dataset_path=args.dataset)
+    env = create_env(env_meta=env_meta, args=args)
+
     print("==== Using environment with the following metadata ====")
     print(json.dumps(env.serialize(), indent=4))
     print("")
@@ -245,66 +415,39 @@ def dataset_states_to_obs(args):
     print("input file: {}".format(args.dataset))
     print("output file: {}".format(output_path))
 
-    total_samples = 0
-    for ind in tqdm(range(len(demos))):
-        ep = demos[ind]
-
-        # prepare initial state to reload from
-        states = f["data/{}/states".format(ep)][()]
-        initial_state = dict(states=states[0])
-        if is_robosuite_env:
-            initial_state["model"] = f["data/{}".format(ep)].attrs["model_file"]
-
-        # extract obs, rewards, dones
-        actions = f["data/{}/actions".format(ep)][()]
-        traj, camera_info = extract_trajectory(
-            env=env, 
-            initial_state=initial_state, 
-            states=states, 
-            actions=actions,
-            done_mode=args.done_mode,
-            camera_names=args.camera_names, 
-            camera_height=args.camera_height, 
-            camera_width=args.camera_width,
+    if args.num_workers > 0:
+        # replay demos in worker processes and stream trajectories back to this process, which writes
+        # them in order. Use spawn so that workers do not inherit this process's renderer or file handles.
+        pool = multiprocessing.get_context("spawn").Pool(
+            processes=args.num_workers,
+            initializer=_init_worker,
+            initargs=(env_meta, args),
+        )
+        results = pool.imap(_extract_in_worker, demos)
+    else:
+        pool = None
+        results = (
+            (ep,) + load_and_extract_trajectory(env=env, f=f, ep=ep, args=args, is_robosuite_env=is_robosuite_env)
+            for ep in demos
         )
 
-        # maybe copy reward or done signal from source file
-        if args.copy_rewards:
-            traj["rewards"] = f["data/{}/rewards".format(ep)][()]
-        if args.copy_dones:
-            traj["dones"] = f["data/{}/dones".format(ep)][()]
-
-        # store transitions
-
-        # IMPORTANT: keep name of group the same as source file, to make sure that filter keys are
-        #            consistent as well
-        ep_data_grp = data_grp.create_group(ep)
-        ep_data_grp.create_dataset("actions", data=np.array(traj["actions"]))
-        ep_data_grp.create_dataset("states", data=np.array(traj["states"]))
-        ep_data_grp.create_dataset("rewards", data=np.array(traj["rewards"]))
-        ep_data_grp.create_dataset("dones", data=np.array(traj["dones"]))
-        for k in traj["obs"]:
-            if args.compress:
-                ep_data_grp.create_dataset("obs/{}".format(k), data=np.array(traj["obs"][k]), compression="gzip")
-            else:
-                ep_data_grp.create_dataset("obs/{}".format(k), data=np.array(traj["obs"][k]))
-            if not args.exclude_next_obs:
-                if args.compress:
-                    ep_data_grp.create_dataset("next_obs/{}".format(k), data=np.array(traj["next_obs"][k]), compression="gzip")
-                else:
-                    ep_data_grp.create_dataset("next_obs/{}".format(k), data=np.array(traj["next_obs"][k]))
-
-        # episode metadata
-        if is_robosuite_env:
-            ep_data_grp.attrs["model_file"] = traj["initial_state_dict"]["model"] # model xml for this episode
-        ep_data_grp.attrs["num_samples"] = traj["actions"].shape[0] # number of transitions in this episode
-
-        if camera_info is not None:
-            assert is_robosuite_env
-            ep_data_grp.attrs["camera_info"] = json.dumps(camera_info, indent=4)
-
+    total_samples = 0
+    for ep, traj, camera_info in tqdm(results, total=len(demos)):
+        if "obs" not in traj:
+            split_obs_frames(traj)
+        write_trajectory(
+            data_grp=data_grp,
+            ep=ep,
+            traj=traj,
+            camera_info=camera_info,
+            args=args,
+            is_robosuite_env=is_robosuite_env,
+        )
         total_samples += traj["actions"].shape[0]
 
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     # copy over all filter keys that exist in the original hdf5
     if "mask" in f:
@@ -421,5 +564,37 @@ if __name__ == "__main__":
         help="(optional) compress observations with gzip option in hdf5",
     )
 
+    # number of worker processes used to replay demonstrations
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="(optional) number of worker processes used to replay demonstrations (0 to use this process)",
+    )
+
+    # chunk observations along time to match training sequence length
+    parser.add_argument(
+        "--seq_length",
+        type=int,
+        default=10,
+        help="(optional) write observations in chunks that span a multiple of this many timesteps",
+    )
+
+    # compression for image observations
+    parser.add_argument(
+        "--image_compression",
+        type=str,
+        default=None,
+        choices=["gzip", "lz4"],
+        help="(optional) compress image observations with gzip or lz4 (lz4 requires hdf5plugin)",
+    )
+
+    # flag to store next obs as a view of obs
+    parser.add_argument(
+        "--share_next_obs", 
+        action='store_true',
+        help="(optional) store next obs as a virtual view of obs shifted by one timestep",
+    )
+
     args = parser.parse_args()
     dataset_states_to_obs(args)
@@ -0,0 +1,165 @@
+"""
+Helper script to precompute the features of frozen pretrained visual backbones for the image observations
+in a dataset. For each rgb observation key in a training config, the backbone of its VisualCore (R3MConv,
+MVPConv, or ResNet18Conv with pretrained=True and freeze=True) is run once over obs/<key> and next_obs/<key>
+of every demo, and the features are written into the same hdf5 under obs/<key>_features and
+next_obs/<key>_features (see ObsUtils.visual_feature_key). Training with config.train.hdf5_use_visual_features
+then reads these features instead of the images, and the observation encoders only run the pooling and
+linear layers that follow the backbone.
+
+Args:
+    dataset (str): path to hdf5 dataset. Features are written into this file.
+
+    config (str): path to the training config json that specifies the rgb observation keys and their encoder
+
+    batch_size (int): number of frames per backbone forward pass
+
+    device (str): torch device to run the backbones on (defaults to cuda if available)
+
+    overwrite (bool): if flag is provided, recompute features that already exist in the dataset
+
+Example usage:
+
+    python extract_visual_features.py --dataset /path/to/image.hdf5 --config /path/to/config.json
+"""
+import os
+import json
+import argparse
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+import torch
+
+import robomimic.utils.obs_utils as ObsUtils
+import robomimic.utils.tensor_utils as TensorUtils
+import robomimic.utils.file_utils as FileUtils
+import robomimic.utils.log_utils as LogUtils
+import robomimic.models.obs_nets as ObsNets
+from robomimic.models.obs_core import VisualCore
+from robomimic.config import config_factory
+
+
+def make_visual_cores(config, dataset_path):
+    """
+    Create the visual cores that a model trained with @config uses for its rgb observations, and make
+    sure that their backbones are frozen and pretrained, so that the features do not depend on the
+    model instance or change over training.
+
+    Returns:
+        cores (OrderedDict): maps rgb observation keys to VisualCore instances
+    """
+    shape_meta = FileUtils.get_shape_metadata_from_dataset(dataset_path=dataset_path, all_obs_keys=config.all_obs_keys)
+    obs_shapes = OrderedDict(
+        (k, shape_meta["all_shapes"][k]) for k in shape_meta["all_obs_keys"] if ObsUtils.key_is_obs_modality(k, "rgb")
+    )
+    assert len(obs_shapes) > 0, "config has no rgb observations"
+
+    # same encoder construction as the networks of the algorithm (see ObsNets.obs_encoder_factory)
+    encoder = ObsNets.obs_encoder_factory(obs_shapes=obs_shapes)
+    cores = OrderedDict()
+    for k in obs_shapes:
+        core = encoder.obs_nets[k]
+        assert encoder.obs_randomizers[k] is None, \
+            "obs key {} uses an obs randomizer, which needs the raw images during training".format(k)
+        assert isinstance(core, VisualCore) and core.has_frozen_backbone, \
+            "obs key {} does not use a VisualCore with a frozen pretrained backbone".format(k)
+        cores[k] = core
+    return cores
+
+
+def extract_features_for_key(backbone, data, obs_key, batch_size, device):
+    """
+    Run @backbone over all frames of image observation @obs_key in hdf5 dataset @data, one
+    batch of frames at a time.
+
+    Returns:
+        feats (np.array): float32 features of shape [T, ...]
+    """
+    feats = None
+    for begin in range(0, data.shape[0], batch_size):
+        frames = ObsUtils.process_obs(obs=data[begin: begin + batch_size], obs_key=obs_key)
+        frames = TensorUtils.to_float(TensorUtils.to_device(TensorUtils.to_tensor(frames), device))
+        batch_feats = TensorUtils.to_numpy(backbone(frames))
+        if feats is None:
+            feats = np.empty((data.shape[0],) + batch_feats.shape[1:], dtype=np.float32)
+        feats[begin: begin + batch_feats.shape[0]] = batch_feats
+    return feats
+
+
+def extract_visual_features(args):
+    dataset_path = os.path.expanduser(args.dataset)
+    device = torch.device(args.device)
+
+    ext_cfg = json.load(open(args.config, 'r'))
+    config = config_factory(ext_cfg["algo_name"])
+    with config.values_unlocked():
+        config.update(ext_cfg)
+
+    # observation processing and encoder kwargs depend on the observation modalities
+    ObsUtils.initialize_obs_utils_with_config(config)
+    cores = make_visual_cores(config, dataset_path=dataset_path)
+    backbones = OrderedDict((k, cores[k].backbone.to(device).eval()) for k in cores)
+    for k in cores:
+        print("obs key {}: {} with features of shape {}".format(k, backbones[k], cores[k].backbone_feature_shape))
+
+    f = h5py.File(dataset_path, "a")
+    demos = sorted(f["data"].keys(), key=lambda x: int(x[5:]))
+    with torch.no_grad():
+        for ep in LogUtils.custom_tqdm(demos):
+            for prefix in ["obs", "next_obs"]:
+                if prefix not in f["data/{}".format(ep)]:
+                    continue
+                grp = f["data/{}/{}".format(ep, prefix)]
+                for k in backbones:
+                    feature_key = ObsUtils.visual_feature_key(k)
+                    if feature_key in grp:
+                        if not args.overwrite:
+                            continue
+                        del grp[feature_key]
+                    feats = extract_features_for_key(
+                        backbone=backbones[k],
+                        data=grp[k],
+                        obs_key=k,
+                        batch_size=args.batch_size,
+                        device=device,
+                    )
+                    grp.create_dataset(feature_key, data=feats)
+                    grp[feature_key].attrs["backbone"] = repr(backbones[k])
+    f.close()
+    print("wrote features for {} demos to {}".format(len(demos), dataset_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        required=True,
+        help="path to hdf5 dataset - features are written into this file",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        required=True,
+        help="path to the training config json that specifies the rgb observation keys and their encoder",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=256,
+        help="number of frames per backbone forward pass",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="torch device to run the backbones on",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action='store_true',
+        help="recompute features that already exist in the dataset",
+    )
+    args = parser.parse_args()
+    extract_visual_features(args)
@@ -24,6 +24,12 @@ Args:
     
     video_path (str): if provided, render trajectories to this video file path
 
+    video_dir (str): if provided, render each trajectory to its own video file <demo>.mp4
+        in this directory
+
+    num_workers (int): if provided together with @video_dir, render trajectories in parallel
+        in this many worker processes
+
     video_skip (int): render frames to a video every @video_skip steps
 
     render_image_names (str or [str]): camera name(s) / image observation(s) to 
@@ -32,6 +38,10 @@ Args:
     first (bool): if flag is provided, use first frame of each episode for playback
         instead of the entire episode. Useful for visualizing task initializations.
 
+    read_block_size (int): if provided, number of timesteps of image observations to read
+        from the dataset at a time when using --use-obs (by default, a multiple of the hdf5
+        chunk length)
+
 Example usage below:
 
     # force simulation states one by one, and render agentview and wrist view cameras to video
@@ -55,6 +65,11 @@ Example usage below:
         --render_depth_names agentview_depth \
         --video_path /tmp/obs_trajectory.mp4
 
+    # render the image observations of each trajectory to its own video, using 4 processes
+    python playback_dataset.py --dataset /path/to/dataset.hdf5 \
+        --use-obs --render_image_names agentview_image \
+        --video_dir /tmp/obs_trajectories --num_workers 4
+
     # visualize initial states in the demonstration data
     python playback_dataset.py --dataset /path/to/dataset.hdf5 \
         --first --render_image_names agentview \
@@ -66,13 +81,14 @@ import json
 import h5py
 import argparse
 import imageio
+import multiprocessing
 import numpy as np
 
 import robomimic
 import robomimic.utils.obs_utils as ObsUtils
 import robomimic.utils.env_utils as EnvUtils
 import robomimic.utils.file_utils as FileUtils
-from robomimic.utils.vis_utils import depth_to_rgb
+from robomimic.utils.vis_utils import depth_to_rgb, ThreadedVideoWriter
 from robomimic.envs.env_base import EnvBase, EnvType
 
 
@@ -83,6 +99,9 @@ DEFAULT_CAMERAS = {
     EnvType.GYM_TYPE: ValueError("No camera names supported for gym type env!"),
 }
 
+# number of timesteps of image observations to read at a time (see @get_read_block_size)
+DEFAULT_READ_BLOCK_SIZE = 64
+
 
 def playback_trajectory_with_env(
     env, 
@@ -157,6 +176,84 @@ def playback_trajectory_with_env(
             break
 
 
+def get_read_block_size(dset, block_size=None):
+    """
+    Number of timesteps to read from hdf5 dataset @dset at a time. Unless @block_size is provided,
+    this is a multiple of the length of the hdf5 chunks of @dset along time, so that every read
+    decompresses whole chunks, and defaults to @DEFAULT_READ_BLOCK_SIZE timesteps for datasets
+    that are not chunked.
+    """
+    if block_size is not None:
+        return block_size
+    if dset.chunks is None:
+        return DEFAULT_READ_BLOCK_SIZE
+    chunk_len = dset.chunks[0]
+    return chunk_len * max(1, DEFAULT_READ_BLOCK_SIZE // chunk_len)
+
+
+def compute_depth_range(dset, block_size):
+    """
+    Minimum and maximum value of depth observation dataset @dset, computed in a single pass
+    over blocks of @block_size timesteps.
+    """
+    depth_min, depth_max = None, None
+    for start in range(0, dset.shape[0], block_size):
+        block = dset[start:start + block_size]
+        depth_min = block.min() if depth_min is None else min(depth_min, block.min())
+        depth_max = block.max() if depth_max is None else max(depth_max, block.max())
+    return depth_min, depth_max
+
+
+def iterate_obs_frames(
+    traj_grp,
+    image_names,
+    depth_names=None,
+    video_skip=5,
+    first=False,
+    block_size=None,
+):
+    """
+    Iterates over the video frames of a dataset trajectory built from its "rgb" (and possibly "depth")
+    observations. Observations are read in blocks of timesteps aligned with the hdf5 chunks (see
+    @get_read_block_size) instead of one frame at a time, and the depth conversion and horizontal
+    concatenation of the views are done for all frames of a block at once.
+
+    Args:
+        traj_grp (hdf5 file group): hdf5 group which corresponds to the dataset trajectory to playback
+        image_names (list): image observations to concatenate horizontally in each frame
+        depth_names (list): depth observations to append to each frame (if any)
+        video_skip (int): every @video_skip-th timestep is used as a frame
+        first (bool): if True, only use the first frame of the episode
+        block_size (int): if provided, number of timesteps to read at a time
+
+    Returns:
+        frames (generator): generator of frames (np.array) of shape [H, W, 3]
+    """
+    depth_names = [] if depth_names is None else depth_names
+    traj_len = traj_grp["actions"].shape[0]
+    if first:
+        traj_len = min(traj_len, 1)
+    block_size = get_read_block_size(traj_grp["obs/{}".format(image_names[0])], block_size=block_size)
+
+    # min and max depth value across trajectory for normalization
+    depth_range = { k : compute_depth_range(traj_grp["obs/{}".format(k)], block_size) for k in depth_names }
+
+    for start in range(0, traj_len, block_size):
+        end = min(start + block_size, traj_len)
+
+        # timesteps of this block that are used as frames
+        offset = (-start) % video_skip
+        if start + offset >= end:
+            continue
+        views = [traj_grp["obs/{}".format(k)][start:end][offset::video_skip] for k in image_names]
+        for k in depth_names:
+            depth = traj_grp["obs/{}".format(k)][start:end][offset::video_skip]
+            views.append(depth_to_rgb(depth, depth_min=depth_range[k][0], depth_max=depth_range[k][1]))
+        frames = np.concatenate(views, axis=2) # concatenate horizontally
+        for frame in frames:
+            yield frame
+
+
 def playback_trajectory_with_obs(
     traj_grp,
     video_writer, 
@@ -164,6 +261,7 @@ def playback_trajectory_with_obs(
     image_names=None,
     depth_names=None,
     first=False,
+    block_size=None,
 ):
     """
     This function reads all "rgb" (and possibly "depth") observations in the dataset trajectory and
@@ -177,33 +275,124 @@ def playback_trajectory_with_obs(
             one to output a video with multiple image observations concatenated horizontally.
         depth_names (list): determines which depth observations are used for rendering (if any).
         first (bool): if True, only use the first frame of each episode.
+        block_size (int): if provided, number of timesteps to read from the dataset at a time (see
+            @iterate_obs_frames)
     """
     assert image_names is not None, "error: must specify at least one image observation to use in @image_names"
-    video_count = 0
+    for frame in iterate_obs_frames(
+        traj_grp=traj_grp,
+        image_names=image_names,
+        depth_names=depth_names,
+        video_skip=video_skip,
+        first=first,
+        block_size=block_size,
+    ):
+        video_writer.append_data(frame)
+
+
+def open_video_writer(video_path):
+    """
+    Video writer for @video_path that encodes frames on a separate thread.
+    """
+    return ThreadedVideoWriter(imageio.get_writer(video_path, fps=20))
 
-    if depth_names is not None:
-        # compute min and max depth value across trajectory for normalization
-        depth_min = { k : traj_grp["obs/{}".format(k)][:].min() for k in depth_names }
-        depth_max = { k : traj_grp["obs/{}".format(k)][:].max() for k in depth_names }
 
-    traj_len = traj_grp["actions"].shape[0]
-    for i in range(traj_len):
-        if video_count % video_skip == 0:
-            # concatenate image obs together
-            im = [traj_grp["obs/{}".format(k)][i] for k in image_names]
-            depth = [depth_to_rgb(traj_grp["obs/{}".format(k)][i], depth_min=depth_min[k], depth_max=depth_max[k]) for k in depth_names] if depth_names is not None else []
-            frame = np.concatenate(im + depth, axis=1)
-            video_writer.append_data(frame)
-        video_count += 1
+def playback_demos(args, demos, video_paths=None):
+    """
+    Playback the demonstrations @demos of the dataset. Each demonstration is written to its own video
+    if @video_paths (one path per demonstration) is provided, and all of them are written to
+    @args.video_path otherwise.
 
-        if first:
-            break
+    Args:
+        args (argparse.Namespace): script arguments
+        demos ([str]): demonstration keys to playback, for example ["demo_0", "demo_1"]
+        video_paths ([str]): if provided, video path for each demonstration
+    """
+    # create environment only if not playing back with observations
+    if not args.use_obs:
+        # need to make sure ObsUtils knows which observations are images, but it doesn't matter 
+        # for playback since observations are unused. Pass a dummy spec here.
+        dummy_spec = dict(
+            obs=dict(
+                    low_dim=["robot0_eef_pos"],
+                    rgb=[],
+                ),
+        )
+        ObsUtils.initialize_obs_utils_with_obs_specs(obs_modality_specs=dummy_spec)
+
+        write_video = (args.video_path is not None) or (video_paths is not None)
+        env_meta = FileUtils.get_env_metadata_from_dataset(dataset_path=args.dataset)
+        env = EnvUtils.create_env_from_metadata(env_meta=env_meta, render=args.render, render_offscreen=write_video)
+
+        # some operations for playback are robosuite-specific, so determine if this environment is a robosuite env
+        is_robosuite_env = EnvUtils.is_robosuite_env(env_meta)
+
+    f = h5py.File(args.dataset, "r")
+
+    # maybe dump all demonstrations to one video
+    video_writer = None
+    if (video_paths is None) and (args.video_path is not None):
+        video_writer = open_video_writer(args.video_path)
+
+    for ind in range(len(demos)):
+        ep = demos[ind]
+        print("Playing back episode: {}".format(ep))
+
+        if video_paths is not None:
+            video_writer = open_video_writer(video_paths[ind])
+
+        if args.use_obs:
+            playback_trajectory_with_obs(
+                traj_grp=f["data/{}".format(ep)], 
+                video_writer=video_writer, 
+                video_skip=args.video_skip,
+                image_names=args.render_image_names,
+                depth_names=args.render_depth_names,
+                first=args.first,
+                block_size=args.read_block_size,
+            )
+        else:
+            # prepare initial state to reload from
+            states = f["data/{}/states".format(ep)][()]
+            initial_state = dict(states=states[0])
+            if is_robosuite_env:
+                initial_state["model"] = f["data/{}".format(ep)].attrs["model_file"]
+
+            # supply actions if using open-loop action playback
+            actions = None
+            if args.use_actions:
+                actions = f["data/{}/actions".format(ep)][()]
+
+            playback_trajectory_with_env(
+                env=env, 
+                initial_state=initial_state, 
+                states=states, actions=actions, 
+                render=args.render, 
+                video_writer=video_writer, 
+                video_skip=args.video_skip,
+                camera_names=args.render_image_names,
+                first=args.first,
+            )
+
+        if video_paths is not None:
+            video_writer.close()
+
+    f.close()
+    if (video_paths is None) and (video_writer is not None):
+        video_writer.close()
+
+
+def _playback_demos_in_worker(job):
+    args, demos, video_paths = job
+    playback_demos(args=args, demos=demos, video_paths=video_paths)
 
 
 def playback_dataset(args):
     # some arg checking
-    write_video = (args.video_path is not None)
+    assert (args.video_path is None) or (args.video_dir is None), "pass either a video path or a video directory"
+    write_video = (args.video_path is not None) or (args.video_dir is not None)
     assert not (args.render and write_video) # either on-screen or video but not both
+    assert (args.num_workers == 0) or (args.video_dir is not None), "parallel playback requires a video directory"
 
     # Auto-fill camera rendering info if not specified
     if args.render_image_names is None:
@@ -223,24 +412,6 @@ def playback_dataset(args):
     if args.render_depth_names is not None:
         assert args.use_obs, "depth observations can only be visualized from observations currently"
 
-    # create environment only if not playing back with observations
-    if not args.use_obs:
-        # need to make sure ObsUtils knows which observations are images, but it doesn't matter 
-        # for playback since observations are unused. Pass a dummy spec here.
-        dummy_spec = dict(
-            obs=dict(
-                    low_dim=["robot0_eef_pos"],
-                    rgb=[],
-                ),
-        )
-        ObsUtils.initialize_obs_utils_with_obs_specs(obs_modality_specs=dummy_spec)
-
-        env_meta = FileUtils.get_env_metadata_from_dataset(dataset_path=args.dataset)
-        env = EnvUtils.create_env_from_metadata(env_meta=env_meta, render=args.render, render_offscreen=write_video)
-
-        # some operations for playback are robosuite-specific, so determine if this environment is a robosuite env
-        is_robosuite_env = EnvUtils.is_robosuite_env(env_meta)
-
     f = h5py.File(args.dataset, "r")
 
     # list of all demonstration episodes (sorted in increasing number order)
@@ -251,56 +422,29 @@ def playback_dataset(args):
         demos = list(f["data"].keys())
     inds = np.argsort([int(elem[5:]) for elem in demos])
     demos = [demos[i] for i in inds]
+    f.close()
 
     # maybe reduce the number of demonstrations to playback
     if args.n is not None:
         demos = demos[:args.n]
 
-    # maybe dump video
-    video_writer = None
-    if write_video:
-        video_writer = imageio.get_writer(args.video_path, fps=20)
-
-    for ind in range(len(demos)):
-        ep = demos[ind]
-        print("Playing back episode: {}".format(ep))
-
-        if args.use_obs:
-            playback_trajectory_with_obs(
-                traj_grp=f["data/{}".format(ep)], 
-                video_writer=video_writer, 
-                video_skip=args.video_skip,
-                image_names=args.render_image_names,
-                depth_names=args.render_depth_names,
-                first=args.first,
-            )
-            continue
-
-        # prepare initial state to reload from
-        states = f["data/{}/states".format(ep)][()]
-        initial_state = dict(states=states[0])
-        if is_robosuite_env:
-            initial_state["model"] = f["data/{}".format(ep)].attrs["model_file"]
-
-        # supply actions if using open-loop action playback
-        actions = None
-        if args.use_actions:
-            actions = f["data/{}/actions".format(ep)][()]
-
-        playback_trajectory_with_env(
-            env=env, 
-            initial_state=initial_state, 
-            states=states, actions=actions, 
-            render=args.render, 
-            video_writer=video_writer, 
-            video_skip=args.video_skip,
-            camera_names=args.render_image_names,
-            first=args.first,
-        )
+    if args.video_dir is None:
+        playback_demos(args=args, demos=demos)
+        return
 
-    f.close()
-    if write_video:
-        video_writer.close()
+    # one video per demonstration
+    os.makedirs(args.video_dir, exist_ok=True)
+    video_paths = [os.path.join(args.video_dir, "{}.mp4".format(ep)) for ep in demos]
+    if args.num_workers == 0:
+        playback_demos(args=args, demos=demos, video_paths=video_paths)
+    else:
+        # split demonstrations across worker processes, which create their own environment and open
+        # the dataset themselves. Use spawn so that workers do not inherit this process's renderer.
+        jobs = [(args, demos[i::args.num_workers], video_paths[i::args.num_workers]) for i in range(args.num_workers)]
+        jobs = [job for job in jobs if len(job[1]) > 0]
+        with multiprocessing.get_context("spawn").Pool(processes=max(1, len(jobs))) as pool:
+            pool.map(_playback_demos_in_worker, jobs)
+    print("Wrote {} videos to {}".format(len(demos), args.video_dir))
 
 
 if __name__ == "__main__":
@@ -354,6 +498,22 @@ if __name__ == "__main__":
         help="(optional) render trajectories to this video file path",
     )
 
+    # Dump a video of each trajectory to the specified directory
+    parser.add_argument(
+        "--video_dir",
+        type=str,
+        default=None,
+        help="(optional) render each trajectory to its own video file in this directory",
+    )
+
+    # number of processes to render trajectories in parallel (requires @video_dir)
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="(optional) number of worker processes to render trajectories to separate videos in parallel",
+    )
+
     # How often to write video frames during the playback
     parser.add_argument(
         "--video_skip",
@@ -388,5 +548,14 @@ if __name__ == "__main__":
         help="use first frame of each episode",
     )
 
+    # number of timesteps of image observations to read at a time
+    parser.add_argument(
+        "--read_block_size",
+        type=int,
+        default=None,
+        help="(optional) number of timesteps of image observations to read at a time with --use-obs \
+            (defaults to a multiple of the hdf5 chunk length)",
+    )
+
     args = parser.parse_args()
     playback_dataset(args)
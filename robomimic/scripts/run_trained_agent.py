@@ -25,6 +25,11 @@ Args:
         possible high-dimensional observations in output dataset hdf5 file (by default,
         observations are excluded and only simulator states are saved).
 
+    write_chunk_size (int): trajectories are written to @dataset_path step by step, in hdf5 chunks
+        of this many timesteps, so memory use does not grow with the rollout horizon
+
+    background_write (bool): if flag is provided, write to @dataset_path on a background thread
+
     seed (int): if provided, set seed for rollouts
 
 Example usage:
@@ -53,7 +58,6 @@ Example usage:
 """
 import argparse
 import json
-import h5py
 import imageio
 import numpy as np
 from copy import deepcopy
@@ -69,10 +73,10 @@ from robomimic.envs.env_base import EnvBase
 from robomimic.algo import RolloutPolicy
 
 
-def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5, return_obs=False, camera_names=None):
+def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5, return_obs=False, camera_names=None, traj_writer=None):
     """
     Helper function to carry out rollouts. Supports on-screen rendering, off-screen rendering to a video, 
-    and returns the rollout trajectory.
+    and returns the rollout trajectory, or streams it to @traj_writer.
 
     Args:
         policy (instance of RolloutPolicy): policy loaded from a checkpoint
@@ -86,10 +90,12 @@ def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5,
             representation of the environment. 
         camera_names (list): determines which camera(s) are used for rendering. Pass more than
             one to output a video with multiple camera views concatenated horizontally.
+        traj_writer (FileUtils.HDF5TrajectoryWriter): if provided, each step of the rollout is written
+            to a new episode of this writer as it happens, instead of being collected in memory
 
     Returns:
         stats (dict): some statistics for the rollout - such as return, horizon, and task success
-        traj (dict): dictionary that corresponds to the rollout trajectory
+        traj (dict): dictionary that corresponds to the rollout trajectory (None if @traj_writer is provided)
     """
     assert isinstance(env, EnvBase)
     assert isinstance(policy, RolloutPolicy)
@@ -105,10 +111,17 @@ def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5,
     results = {}
     video_count = 0  # video frame counter
     total_reward = 0.
-    traj = dict(actions=[], rewards=[], dones=[], states=[], initial_state_dict=state_dict)
-    if return_obs:
-        # store observations too
-        traj.update(dict(obs=[], next_obs=[]))
+    traj = None
+    if traj_writer is not None:
+        ep_attrs = dict()
+        if "model" in state_dict:
+            ep_attrs["model_file"] = state_dict["model"] # model xml for this episode
+        traj_writer.start_episode(attrs=ep_attrs)
+    else:
+        traj = dict(actions=[], rewards=[], dones=[], states=[], initial_state_dict=state_dict)
+        if return_obs:
+            # store observations too
+            traj.update(dict(obs=[], next_obs=[]))
     try:
         for step_i in range(horizon):
 
@@ -135,16 +148,18 @@ def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5,
                 video_count += 1
 
             # collect transition
-            traj["actions"].append(act)
-            traj["rewards"].append(r)
-            traj["dones"].append(done)
-            traj["states"].append(state_dict["states"])
+            step = dict(actions=act, rewards=r, dones=done, states=state_dict["states"])
             if return_obs:
                 # Note: We need to "unprocess" the observations to prepare to write them to dataset.
                 #       This includes operations like channel swapping and float to uint8 conversion
                 #       for saving disk space.
-                traj["obs"].append(ObsUtils.unprocess_obs_dict(obs))
-                traj["next_obs"].append(ObsUtils.unprocess_obs_dict(next_obs))
+                step["obs"] = ObsUtils.unprocess_obs_dict(obs)
+                step["next_obs"] = ObsUtils.unprocess_obs_dict(next_obs)
+            if traj_writer is not None:
+                traj_writer.add_step(step)
+            else:
+                for k in step:
+                    traj[k].append(step[k])
 
             # break if done or if success
             if done or success:
@@ -159,6 +174,10 @@ def rollout(policy, env, horizon, render=False, video_writer=None, video_skip=5,
 
     stats = dict(Return=total_reward, Horizon=(step_i + 1), Success_Rate=float(success))
 
+    if traj_writer is not None:
+        traj_writer.end_episode()
+        return stats, traj
+
     if return_obs:
         # convert list of dict to dict of list for obs dictionaries (for convenient writes to hdf5 dataset)
         traj["obs"] = TensorUtils.list_of_flat_dict_to_dict_of_list(traj["obs"])
@@ -221,44 +240,37 @@ def run_trained_agent(args):
     if write_video:
         video_writer = imageio.get_writer(args.video_path, fps=20)
 
-    # maybe open hdf5 to write rollouts
+    # maybe open hdf5 to write rollouts - each rollout is streamed to the file as it happens
     write_dataset = (args.dataset_path is not None)
+    traj_writer = None
     if write_dataset:
-        data_writer = h5py.File(args.dataset_path, "w")
-        data_grp = data_writer.create_group("data")
-        total_samples = 0
+        traj_writer = FileUtils.HDF5TrajectoryWriter(
+            args.dataset_path,
+            chunk_size=args.write_chunk_size,
+            background=args.background_write,
+        )
 
     rollout_stats = []
-    for i in range(rollout_num_episodes):
-        stats, traj = rollout(
-            policy=policy, 
-            env=env, 
-            horizon=rollout_horizon, 
-            render=args.render, 
-            video_writer=video_writer, 
-            video_skip=args.video_skip, 
-            return_obs=(write_dataset and args.dataset_obs),
-            camera_names=args.camera_names,
-        )
-        rollout_stats.append(stats)
-
-        if write_dataset:
-            # store transitions
-            ep_data_grp = data_grp.create_group("demo_{}".format(i))
-            ep_data_grp.create_dataset("actions", data=np.array(traj["actions"]))
-            ep_data_grp.create_dataset("states", data=np.array(traj["states"]))
-            ep_data_grp.create_dataset("rewards", data=np.array(traj["rewards"]))
-            ep_data_grp.create_dataset("dones", data=np.array(traj["dones"]))
-            if args.dataset_obs:
-                for k in traj["obs"]:
-                    ep_data_grp.create_dataset("obs/{}".format(k), data=np.array(traj["obs"][k]))
-                    ep_data_grp.create_dataset("next_obs/{}".format(k), data=np.array(traj["next_obs"][k]))
-
-            # episode metadata
-            if "model" in traj["initial_state_dict"]:
-                ep_data_grp.attrs["model_file"] = traj["initial_state_dict"]["model"] # model xml for this episode
-            ep_data_grp.attrs["num_samples"] = traj["actions"].shape[0] # number of transitions in this episode
-            total_samples += traj["actions"].shape[0]
+    try:
+        for i in range(rollout_num_episodes):
+            stats, _ = rollout(
+                policy=policy, 
+                env=env, 
+                horizon=rollout_horizon, 
+                render=args.render, 
+                video_writer=video_writer, 
+                video_skip=args.video_skip, 
+                return_obs=(write_dataset and args.dataset_obs),
+                camera_names=args.camera_names,
+                traj_writer=traj_writer,
+            )
+            rollout_stats.append(stats)
+    except BaseException:
+        # keep the rollouts written so far (an unfinished rollout is marked as partial)
+        if traj_writer is not None:
+            traj_writer.close(data_attrs=dict(env_args=json.dumps(env.serialize(), indent=4)))
+            print("Wrote {} dataset trajectories to {} before exiting".format(traj_writer.num_episodes, args.dataset_path))
+        raise
 
     rollout_stats = TensorUtils.list_of_flat_dict_to_dict_of_list(rollout_stats)
     avg_rollout_stats = { k : np.mean(rollout_stats[k]) for k in rollout_stats }
@@ -270,10 +282,8 @@ def run_trained_agent(args):
         video_writer.close()
 
     if write_dataset:
-        # global metadata
-        data_grp.attrs["total"] = total_samples
-        data_grp.attrs["env_args"] = json.dumps(env.serialize(), indent=4) # environment info
-        data_writer.close()
+        # global metadata (the total number of samples is kept up to date by the writer)
+        traj_writer.close(data_attrs=dict(env_args=json.dumps(env.serialize(), indent=4))) # environment info
         print("Wrote dataset trajectories to {}".format(args.dataset_path))
 
 
@@ -361,6 +371,21 @@ if __name__ == "__main__":
             observations are excluded and only simulator states are saved)",
     )
 
+    # number of timesteps per hdf5 chunk when writing rollouts to @dataset_path
+    parser.add_argument(
+        "--write_chunk_size",
+        type=int,
+        default=64,
+        help="(optional) write rollouts to @dataset_path in hdf5 chunks of this many timesteps",
+    )
+
+    # If True and @dataset_path is supplied, will write the rollouts on a background thread
+    parser.add_argument(
+        "--background_write",
+        action='store_true',
+        help="write rollouts to @dataset_path on a background thread, so rollouts do not wait for disk writes",
+    )
+
     # for seeding before starting rollouts
     parser.add_argument(
         "--seed",
@@ -25,6 +25,7 @@ import psutil
 import sys
 import socket
 import traceback
+import functools
 
 from collections import OrderedDict
 
@@ -37,8 +38,10 @@ import robomimic.utils.torch_utils as TorchUtils
 import robomimic.utils.obs_utils as ObsUtils
 import robomimic.utils.env_utils as EnvUtils
 import robomimic.utils.file_utils as FileUtils
+import robomimic.utils.vis_utils as VisUtils
 from robomimic.config import config_factory
 from robomimic.algo import algo_factory, RolloutPolicy
+from robomimic.envs.vec_env import SubprocVectorEnv
 from robomimic.utils.log_utils import PrintLogger, DataLogger, flush_warnings
 
 import gc
@@ -81,7 +84,8 @@ def train(config, device):
     shape_meta = FileUtils.get_shape_metadata_from_dataset(
         dataset_path=config.train.data,
         all_obs_keys=config.all_obs_keys,
-        verbose=True
+        verbose=True,
+        use_metadata_cache=config.train.hdf5_use_metadata_cache,
     )
 
     if config.experiment.env is not None:
@@ -99,15 +103,29 @@ def train(config, device):
                 env_names.append(name)
 
         for env_name in env_names:
-            env = EnvUtils.create_env_from_metadata(
-                env_meta=env_meta,
-                env_name=env_name, 
-                render=False, 
-                render_offscreen=config.experiment.render_video,
-                use_image_obs=shape_meta["use_images"],
-                use_depth_obs=shape_meta["use_depths"],
-            )
-            env = EnvUtils.wrap_env_from_config(env, config=config) # apply environment warpper, if applicable
+            if config.experiment.rollout.num_envs > 1:
+                # step copies of the environment in subprocesses, so that rollouts can batch policy calls
+                env_fn = functools.partial(
+                    EnvUtils.create_env_for_subprocess,
+                    env_meta=env_meta,
+                    config_json=config.dump(),
+                    env_name=env_name,
+                    render=False,
+                    render_offscreen=config.experiment.render_video,
+                    use_image_obs=shape_meta["use_images"],
+                    use_depth_obs=shape_meta["use_depths"],
+                )
+                env = SubprocVectorEnv([env_fn] * config.experiment.rollout.num_envs)
+            else:
+                env = EnvUtils.create_env_from_metadata(
+                    env_meta=env_meta,
+                    env_name=env_name, 
+                    render=False, 
+                    render_offscreen=config.experiment.render_video,
+                    use_image_obs=shape_meta["use_images"],
+                    use_depth_obs=shape_meta["use_depths"],
+                )
+                env = EnvUtils.wrap_env_from_config(env, config=config) # apply environment warpper, if applicable
             envs[env.name] = env
             print(envs[env.name])
 
@@ -138,7 +156,7 @@ def train(config, device):
 
     # load training data
     trainset, validset = TrainUtils.load_data_for_training(
-        config, obs_keys=shape_meta["all_obs_keys"])
+        config, obs_keys=shape_meta["all_obs_keys"], seq_fetch_indices=model.seq_fetch_indices)
     train_sampler = trainset.get_dataset_sampler()
     print("\n============= Training Dataset =============")
     print(trainset)
@@ -151,30 +169,54 @@ def train(config, device):
     # maybe retreve statistics for normalizing observations
     obs_normalization_stats = None
     if config.train.hdf5_normalize_obs:
-        obs_normalization_stats = trainset.get_obs_normalization_stats()
-
-    # initialize data loaders
-    train_loader = DataLoader(
-        dataset=trainset,
-        sampler=train_sampler,
-        batch_size=config.train.batch_size,
-        shuffle=(train_sampler is None),
-        num_workers=config.train.num_data_workers,
-        drop_last=True
-    )
+        # converted to tensors on the training device once, instead of for every batch
+        obs_normalization_stats = ObsUtils.ObsNormalizationStats(trainset.get_obs_normalization_stats())
+
+    # initialize data loaders - when prefetching to a GPU, batches are pinned by the data loader so that
+    # the prefetcher can issue non-blocking copies
+    pin_memory = config.train.prefetch_to_device and (device.type == "cuda")
+    if config.train.batched_fetch:
+        # the dataset returns whole batches, so the batch sampler drives the loader directly
+        train_loader = DataLoader(
+            dataset=trainset,
+            sampler=trainset.get_batch_sampler(batch_size=config.train.batch_size, shuffle=True, drop_last=True),
+            batch_size=None,
+            num_workers=config.train.num_data_workers,
+            pin_memory=pin_memory,
+        )
+    else:
+        train_loader = DataLoader(
+            dataset=trainset,
+            sampler=train_sampler,
+            batch_size=config.train.batch_size,
+            shuffle=(train_sampler is None),
+            num_workers=config.train.num_data_workers,
+            drop_last=True,
+            pin_memory=pin_memory,
+        )
 
     if config.experiment.validate:
         # cap num workers for validation dataset at 1
         num_workers = min(config.train.num_data_workers, 1)
-        valid_sampler = validset.get_dataset_sampler()
-        valid_loader = DataLoader(
-            dataset=validset,
-            sampler=valid_sampler,
-            batch_size=config.train.batch_size,
-            shuffle=(valid_sampler is None),
-            num_workers=num_workers,
-            drop_last=True
-        )
+        if config.train.batched_fetch:
+            valid_loader = DataLoader(
+                dataset=validset,
+                sampler=validset.get_batch_sampler(batch_size=config.train.batch_size, shuffle=True, drop_last=True),
+                batch_size=None,
+                num_workers=num_workers,
+                pin_memory=pin_memory,
+            )
+        else:
+            valid_sampler = validset.get_dataset_sampler()
+            valid_loader = DataLoader(
+                dataset=validset,
+                sampler=valid_sampler,
+                batch_size=config.train.batch_size,
+                shuffle=(valid_sampler is None),
+                num_workers=num_workers,
+                drop_last=True,
+                pin_memory=pin_memory,
+            )
     else:
         valid_loader = None
 
@@ -202,6 +244,9 @@ def train(config, device):
             epoch=epoch,
             num_steps=train_num_steps,
             obs_normalization_stats=obs_normalization_stats,
+            log_every_n_steps=config.experiment.logging.log_every_n_steps,
+            prefetch_to_device=config.train.prefetch_to_device,
+            prefetch_uint8_to_float=config.train.prefetch_uint8_to_float,
         )
         model.on_epoch_end(epoch)
 
@@ -233,7 +278,15 @@ def train(config, device):
         # Evaluate the model on validation set
         if config.experiment.validate:
             with torch.no_grad():
-                step_log = TrainUtils.run_epoch(model=model, data_loader=valid_loader, epoch=epoch, validate=True, num_steps=valid_num_steps)
+                step_log = TrainUtils.run_epoch(
+                    model=model,
+                    data_loader=valid_loader,
+                    epoch=epoch,
+                    validate=True,
+                    num_steps=valid_num_steps,
+                    prefetch_to_device=config.train.prefetch_to_device,
+                    prefetch_uint8_to_float=config.train.prefetch_uint8_to_float,
+                )
             for k, v in step_log.items():
                 if k.startswith("Time_"):
                     data_logger.record("Timing_Stats/Valid_{}".format(k[5:]), v, epoch)
@@ -335,6 +388,14 @@ def train(config, device):
     # terminate logging
     data_logger.close()
 
+    # wait for classifier diagnostic videos that are still being written in the background
+    VisUtils.wait_for_background_video_writers()
+
+    # shut down rollout worker processes
+    for env in envs.values():
+        if isinstance(env, SubprocVectorEnv):
+            env.close()
+
 
 def main(args):
 
@@ -0,0 +1,223 @@
+"""
+A collection of utility functions for persisting dataset metadata (demo lengths, observation
+shapes and dtypes) and observation normalization statistics on disk, so that repeated training
+runs on the same hdf5 do not need to re-scan the whole file. Cache entries are keyed by the
+absolute path of the hdf5 along with its size and modification time, so that any change to the
+file invalidates the cache. See scripts/dataset_metadata_cache.py to build or clear the cache
+ahead of time.
+"""
+import os
+import json
+import shutil
+import hashlib
+import h5py
+import numpy as np
+
+import robomimic.macros as Macros
+import robomimic.utils.obs_utils as ObsUtils
+
+
+def hdf5_fingerprint(hdf5_path):
+    """
+    Identify the current version of an hdf5 file by its absolute path, size, and modification time.
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+
+    Returns:
+        fingerprint (dict): dictionary with "path", "size", and "mtime" keys
+    """
+    hdf5_path = os.path.abspath(os.path.expanduser(hdf5_path))
+    stat = os.stat(hdf5_path)
+    return dict(path=hdf5_path, size=stat.st_size, mtime=stat.st_mtime)
+
+
+def _hash_json(obj):
+    """
+    Stable hash of a json-serializable object.
+    """
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_cache_dir_for_dataset(hdf5_path, cache_dir=None):
+    """
+    Directory that holds all cache entries for a particular hdf5 file.
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+        cache_dir (str): root cache directory. Defaults to Macros.DATASET_METADATA_CACHE_DIR.
+
+    Returns:
+        dataset_cache_dir (str): cache directory for this dataset
+    """
+    if cache_dir is None:
+        cache_dir = Macros.DATASET_METADATA_CACHE_DIR
+    hdf5_path = os.path.abspath(os.path.expanduser(hdf5_path))
+    name = "{}_{}".format(os.path.splitext(os.path.basename(hdf5_path))[0], _hash_json(hdf5_path)[:16])
+    return os.path.join(os.path.expanduser(cache_dir), name)
+
+
+def _atomic_write_json(obj, path):
+    """
+    Write json to a temporary file and move it into place, so that readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def _load_json_if_valid(path, fingerprint):
+    """
+    Load a cache entry, returning None if it does not exist or does not match @fingerprint.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except ValueError:
+        # corrupt entry - treat as a cache miss
+        return None
+    if entry.get("fingerprint") != fingerprint:
+        return None
+    return entry
+
+
+def compute_demo_metadata(hdf5_file):
+    """
+    Read demo lengths, observation shapes and dtypes, and action dimension from an open hdf5 file.
+
+    Args:
+        hdf5_file (h5py.File): file handle to the hdf5 dataset
+
+    Returns:
+        metadata (dict): dictionary with the following keys:
+
+            :`'demo_lengths'`: dictionary that maps demo key to number of samples
+            :`'obs_shapes'`: dictionary that maps observation key to (unprocessed) shape in the first demo
+            :`'obs_dtypes'`: dictionary that maps observation key to dtype string in the first demo
+            :`'ac_dim'`: action space dimension
+    """
+    demos = list(hdf5_file["data"].keys())
+    demo_lengths = {ep: int(hdf5_file["data/{}".format(ep)].attrs["num_samples"]) for ep in demos}
+
+    obs_shapes = dict()
+    obs_dtypes = dict()
+    ac_dim = None
+    if len(demos) > 0:
+        demo = hdf5_file["data/{}".format(demos[0])]
+        if "obs" in demo:
+            for k in demo["obs"]:
+                obs_shapes[k] = list(demo["obs/{}".format(k)].shape[1:])
+                obs_dtypes[k] = str(demo["obs/{}".format(k)].dtype)
+        if "actions" in demo:
+            ac_dim = int(demo["actions"].shape[1])
+
+    return dict(
+        demo_lengths=demo_lengths,
+        obs_shapes=obs_shapes,
+        obs_dtypes=obs_dtypes,
+        ac_dim=ac_dim,
+    )
+
+
+def get_demo_metadata(hdf5_path, hdf5_file=None, cache_dir=None):
+    """
+    Load dataset metadata from the cache, or read it from the hdf5 (see @compute_demo_metadata)
+    and write it to the cache.
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+        hdf5_file (h5py.File): optional open file handle for @hdf5_path, used on a cache miss
+        cache_dir (str): root cache directory. Defaults to Macros.DATASET_METADATA_CACHE_DIR.
+
+    Returns:
+        metadata (dict): dataset metadata
+    """
+    fingerprint = hdf5_fingerprint(hdf5_path)
+    path = os.path.join(get_cache_dir_for_dataset(hdf5_path, cache_dir=cache_dir), "demo_metadata.json")
+    entry = _load_json_if_valid(path, fingerprint)
+    if entry is not None:
+        return entry["metadata"]
+
+    if hdf5_file is None:
+        with h5py.File(fingerprint["path"], "r") as f:
+            metadata = compute_demo_metadata(f)
+    else:
+        metadata = compute_demo_metadata(hdf5_file)
+    _atomic_write_json(dict(fingerprint=fingerprint, metadata=metadata), path)
+    return metadata
+
+
+def _obs_stats_path(hdf5_path, obs_keys, demos, cache_dir=None):
+    """
+    Normalization statistics depend on the observation keys, how each key is processed (its
+    modality), and the set of demos they are computed over (e.g. the filter key).
+    """
+    spec = dict(
+        obs_keys=sorted(obs_keys),
+        modalities=[ObsUtils.OBS_KEYS_TO_MODALITIES[k] for k in sorted(obs_keys)],
+        demos=sorted(demos),
+    )
+    return os.path.join(get_cache_dir_for_dataset(hdf5_path, cache_dir=cache_dir), "obs_stats_{}.npz".format(_hash_json(spec)[:16]))
+
+
+def load_obs_normalization_stats(hdf5_path, obs_keys, demos, cache_dir=None):
+    """
+    Load cached observation normalization statistics (see SequenceDataset.normalize_obs).
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+        obs_keys (list): observation keys the statistics were computed for
+        demos (list): demo keys the statistics were computed over
+        cache_dir (str): root cache directory. Defaults to Macros.DATASET_METADATA_CACHE_DIR.
+
+    Returns:
+        obs_normalization_stats (dict or None): maps observation keys to dicts with a "mean" and "std",
+            or None if there is no valid cache entry
+    """
+    path = _obs_stats_path(hdf5_path, obs_keys, demos, cache_dir=cache_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        if json.loads(str(data["fingerprint"])) != hdf5_fingerprint(hdf5_path):
+            return None
+        return { k : dict(mean=data["{}/mean".format(k)], std=data["{}/std".format(k)]) for k in obs_keys }
+
+
+def save_obs_normalization_stats(hdf5_path, obs_keys, demos, obs_normalization_stats, cache_dir=None):
+    """
+    Write observation normalization statistics to the cache.
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+        obs_keys (list): observation keys the statistics were computed for
+        demos (list): demo keys the statistics were computed over
+        obs_normalization_stats (dict): maps observation keys to dicts with a "mean" and "std"
+        cache_dir (str): root cache directory. Defaults to Macros.DATASET_METADATA_CACHE_DIR.
+    """
+    path = _obs_stats_path(hdf5_path, obs_keys, demos, cache_dir=cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = dict(fingerprint=np.array(json.dumps(hdf5_fingerprint(hdf5_path))))
+    for k in obs_keys:
+        arrays["{}/mean".format(k)] = obs_normalization_stats[k]["mean"]
+        arrays["{}/std".format(k)] = obs_normalization_stats[k]["std"]
+    # note: np.savez appends .npz to paths that do not end with it, so keep the extension on the temp file
+    tmp_path = "{}.{}.tmp.npz".format(path[:-4], os.getpid())
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def clear_cache(hdf5_path, cache_dir=None):
+    """
+    Remove all cache entries for an hdf5 file.
+
+    Args:
+        hdf5_path (str): path to hdf5 file
+        cache_dir (str): root cache directory. Defaults to Macros.DATASET_METADATA_CACHE_DIR.
+    """
+    dataset_cache_dir = get_cache_dir_for_dataset(hdf5_path, cache_dir=cache_dir)
+    if os.path.exists(dataset_cache_dir):
+        shutil.rmtree(dataset_cache_dir)
@@ -3,7 +3,9 @@ This file contains Dataset classes that are used by torch dataloaders
 to fetch batches from hdf5 files.
 """
 import os
+import json
 import h5py
+import multiprocessing
 import numpy as np
 from copy import deepcopy
 from contextlib import contextmanager
@@ -13,6 +15,13 @@ import torch.utils.data
 import robomimic.utils.tensor_utils as TensorUtils
 import robomimic.utils.obs_utils as ObsUtils
 import robomimic.utils.log_utils as LogUtils
+import robomimic.utils.cache_utils as CacheUtils
+
+try:
+    # registers additional hdf5 compression filters (e.g. lz4, see scripts/dataset_states_to_obs.py)
+    import hdf5plugin
+except ImportError:
+    pass
 
 
 class SequenceDataset(torch.utils.data.Dataset):
@@ -32,6 +41,11 @@ class SequenceDataset(torch.utils.data.Dataset):
         hdf5_normalize_obs=False,
         filter_by_attribute=None,
         load_next_obs=True,
+        hdf5_mmap_cache_dir=None,
+        hdf5_use_metadata_cache=False,
+        hdf5_normalize_obs_num_workers=0,
+        batched_fetch=False,
+        seq_fetch_indices=None,
     ):
         """
         Dataset class for fetching sequences of experience.
@@ -62,11 +76,13 @@ class SequenceDataset(torch.utils.data.Dataset):
 
             goal_mode (str): either "last" or None. Defaults to None, which is to not fetch goals
 
-            hdf5_cache_mode (str): one of ["all", "low_dim", or None]. Set to "all" to cache entire hdf5 
+            hdf5_cache_mode (str): one of ["all", "low_dim", "mmap", or None]. Set to "all" to cache entire hdf5 
                 in memory - this is by far the fastest for data loading. Set to "low_dim" to cache all 
-                non-image data. Set to None to use no caching - in this case, every batch sample is 
-                retrieved via file i/o. You should almost never set this to None, even for large 
-                image datasets.
+                non-image data. Set to "mmap" to pack every key across all demos into one contiguous 
+                memory-mapped .npy file (see @hdf5_mmap_cache_dir) - sequences are sliced by offset, and 
+                all data loader workers share the same physical pages through the OS page cache. Set to 
+                None to use no caching - in this case, every batch sample is retrieved via file i/o. You 
+                should almost never set this to None, even for large image datasets.
 
             hdf5_use_swmr (bool): whether to use swmr feature when opening the hdf5 file. This ensures
                 that multiple Dataset instances can all access the same hdf5 file without problems.
@@ -79,16 +95,48 @@ class SequenceDataset(torch.utils.data.Dataset):
                 demonstrations to load
 
             load_next_obs (bool): whether to load next_obs from the dataset
+
+            hdf5_mmap_cache_dir (str): directory for the memory-mapped arrays used by the "mmap" cache mode.
+                Defaults to a sidecar directory next to the hdf5 file.
+
+            hdf5_use_metadata_cache (bool): if True, read demo lengths and observation normalization
+                statistics from the on-disk metadata cache (see utils/cache_utils.py) when it is valid
+                for this hdf5, and populate the cache otherwise.
+
+            hdf5_normalize_obs_num_workers (int): if greater than 0, compute the observation normalization
+                statistics with this many worker processes (see @normalize_obs). Otherwise, demos are
+                processed serially in this process.
+
+            batched_fetch (bool): if True, in-memory caches are stored as one contiguous array per key
+                (instead of per-demo arrays or per-sample getitem caches), so that whole batches can be
+                gathered with one fancy index per key. Use with @get_batch_sampler, so that the dataset
+                is indexed with a full batch of indices at a time (see @get_items).
+
+            seq_fetch_indices (dict): if provided, maps "obs", "next_obs", or dataset keys (e.g. "actions")
+                to the positions in the fetched sequence (of length @frame_stack - 1 + @seq_length) that
+                should be fetched for that key, for example {"obs": [0], "next_obs": [9]}. Only these
+                timesteps are read from the hdf5 or cache, so the sequence of each such key only has
+                len(indices) elements, in sorted order. Keys that are not present are fetched in full
+                (see @Algo.get_seq_fetch_indices).
         """
         super(SequenceDataset, self).__init__()
 
         self.hdf5_path = os.path.expanduser(hdf5_path)
         self.hdf5_use_swmr = hdf5_use_swmr
         self.hdf5_normalize_obs = hdf5_normalize_obs
+        self.hdf5_use_metadata_cache = hdf5_use_metadata_cache
+        self.hdf5_normalize_obs_num_workers = hdf5_normalize_obs_num_workers
+        self.batched_fetch = batched_fetch
         self._hdf5_file = None
+        self._mmap_cache = None
+        self._flat_cache = None
+        self.getitem_cache = None
 
-        assert hdf5_cache_mode in ["all", "low_dim", None]
+        assert hdf5_cache_mode in ["all", "low_dim", "mmap", None]
         self.hdf5_cache_mode = hdf5_cache_mode
+        if hdf5_mmap_cache_dir is None:
+            hdf5_mmap_cache_dir = os.path.splitext(self.hdf5_path)[0] + "_mmap_cache"
+        self.hdf5_mmap_cache_dir = os.path.expanduser(hdf5_mmap_cache_dir)
 
         self.load_next_obs = load_next_obs
         self.filter_by_attribute = filter_by_attribute
@@ -113,6 +161,18 @@ class SequenceDataset(torch.utils.data.Dataset):
         self.pad_frame_stack = pad_frame_stack
         self.get_pad_mask = get_pad_mask
 
+        self.seq_fetch_indices = None
+        if seq_fetch_indices is not None:
+            # padding masks are defined over full sequences
+            assert not self.get_pad_mask, "padding masks are not supported with @seq_fetch_indices"
+            window_length = self.n_frame_stack - 1 + self.seq_length
+            self.seq_fetch_indices = dict()
+            for k, inds in seq_fetch_indices.items():
+                inds = np.unique(np.asarray(inds, dtype=np.int64))
+                assert np.all((inds >= 0) & (inds < window_length)), \
+                    "fetch indices {} for key {} outside of sequence of length {}".format(inds, k, window_length)
+                self.seq_fetch_indices[k] = inds
+
         self.load_demo_info(filter_by_attribute=self.filter_by_attribute)
 
         # maybe prepare for observation normalization
@@ -139,7 +199,14 @@ class SequenceDataset(torch.utils.data.Dataset):
                 load_next_obs=self.load_next_obs
             )
 
-            if self.hdf5_cache_mode == "all":
+            if self.batched_fetch:
+                # pack the in-memory cache into one contiguous array per key, so that whole batches
+                # can be gathered with one fancy index per key
+                self._flat_cache = self._flatten_dataset_cache(self.hdf5_cache)
+                self._set_demo_flat_offsets(dict(zip(self.demos, self._demo_start_offsets_in(self._demo_lengths))))
+                del self.hdf5_cache
+                self.hdf5_cache = None
+            elif self.hdf5_cache_mode == "all":
                 # cache getitem calls for even more speedup. We don't do this for
                 # "low-dim" since image observations require calls to getitem anyways.
                 print("SequenceDataset: caching get_item calls...")
@@ -148,6 +215,15 @@ class SequenceDataset(torch.utils.data.Dataset):
                 # don't need the previous cache anymore
                 del self.hdf5_cache
                 self.hdf5_cache = None
+        elif self.hdf5_cache_mode == "mmap":
+            self._mmap_keys = list(self.dataset_keys) + ["obs/{}".format(k) for k in self.obs_keys]
+            if self.load_next_obs:
+                self._mmap_keys += ["next_obs/{}".format(k) for k in self.obs_keys]
+            mmap_index = self.build_mmap_cache(keys=self._mmap_keys)
+
+            # offset of each demo's first sample in the flat arrays
+            self._set_demo_flat_offsets(dict(zip(mmap_index["demos"], self._demo_start_offsets_in(mmap_index["lengths"]))))
+            self.hdf5_cache = None
         else:
             self.hdf5_cache = None
 
@@ -177,34 +253,54 @@ class SequenceDataset(torch.utils.data.Dataset):
 
         self.n_demos = len(self.demos)
 
-        # keep internal index maps to know which transitions belong to which demos
-        self._index_to_demo_id = dict()  # maps every index to a demo id
+        # keep compact per-demo index maps (instead of one entry per transition) to know which
+        # transitions belong to which demos - sequence index -> demo lookup is done with a binary
+        # search over the demo start offsets (see @_index_to_demo_index)
         self._demo_id_to_start_indices = dict()  # gives start index per demo id
         self._demo_id_to_demo_length = dict()
+        if self.hdf5_use_metadata_cache:
+            all_demo_lengths = CacheUtils.get_demo_metadata(self.hdf5_path, hdf5_file=self.hdf5_file)["demo_lengths"]
+            demo_lengths = [all_demo_lengths[ep] for ep in self.demos]
+        else:
+            demo_lengths = [self.hdf5_file["data/{}".format(ep)].attrs["num_samples"] for ep in self.demos]
+        demo_lengths = np.array(demo_lengths, dtype=np.int64).reshape(-1)
+
+        # determine actual number of sequences taking into account whether to pad for frame_stack and seq_length
+        num_sequences = demo_lengths.copy()
+        if not self.pad_frame_stack:
+            num_sequences -= (self.n_frame_stack - 1)
+        if not self.pad_seq_length:
+            num_sequences -= (self.seq_length - 1)
+
+        if self.pad_seq_length:
+            assert np.all(demo_lengths >= 1)  # sequence needs to have at least one sample
+            num_sequences = np.maximum(num_sequences, 1)
+        else:
+            assert np.all(num_sequences >= 1)  # assume demo_length >= (self.n_frame_stack - 1 + self.seq_length)
 
         # determine index mapping
-        self.total_num_sequences = 0
-        for ep in self.demos:
-            demo_length = self.hdf5_file["data/{}".format(ep)].attrs["num_samples"]
-            self._demo_id_to_start_indices[ep] = self.total_num_sequences
-            self._demo_id_to_demo_length[ep] = demo_length
-
-            num_sequences = demo_length
-            # determine actual number of sequences taking into account whether to pad for frame_stack and seq_length
-            if not self.pad_frame_stack:
-                num_sequences -= (self.n_frame_stack - 1)
-            if not self.pad_seq_length:
-                num_sequences -= (self.seq_length - 1)
-
-            if self.pad_seq_length:
-                assert demo_length >= 1  # sequence needs to have at least one sample
-                num_sequences = max(num_sequences, 1)
-            else:
-                assert num_sequences >= 1  # assume demo_length >= (self.n_frame_stack - 1 + self.seq_length)
+        self._demo_lengths = demo_lengths
+        self._demo_num_sequences = num_sequences
+        self._demo_start_indices = np.zeros(self.n_demos, dtype=np.int64)
+        if self.n_demos > 0:
+            self._demo_start_indices[1:] = np.cumsum(num_sequences)[:-1]
+        self.total_num_sequences = int(num_sequences.sum())
+        for i, ep in enumerate(self.demos):
+            self._demo_id_to_start_indices[ep] = int(self._demo_start_indices[i])
+            self._demo_id_to_demo_length[ep] = int(demo_lengths[i])
+
+    def _index_to_demo_index(self, index):
+        """
+        Maps sequence index (or array of sequence indices) to the position of the
+        corresponding demo in @self.demos.
+
+        Args:
+            index (int or np.array): sequence index or array of sequence indices
 
-            for _ in range(num_sequences):
-                self._index_to_demo_id[self.total_num_sequences] = ep
-                self.total_num_sequences += 1
+        Returns:
+            demo_index (int or np.array): index into @self.demos for each sequence index
+        """
+        return np.searchsorted(self._demo_start_indices, index, side="right") - 1
 
     @property
     def hdf5_file(self):
@@ -215,6 +311,50 @@ class SequenceDataset(torch.utils.data.Dataset):
             self._hdf5_file = h5py.File(self.hdf5_path, 'r', swmr=self.hdf5_use_swmr, libver='latest')
         return self._hdf5_file
 
+    @property
+    def mmap_cache(self):
+        """
+        This property allows for a lazy open of the memory-mapped arrays used by the "mmap"
+        cache mode. Arrays are opened copy-on-write, so pages are shared with every other
+        process mapping the same file until written to.
+        """
+        if self._mmap_cache is None:
+            self._mmap_cache = {k: np.load(self._mmap_path_for_key(k), mmap_mode="c") for k in self._mmap_keys}
+        return self._mmap_cache
+
+    def __getstate__(self):
+        """
+        Don't pickle the memory maps (that would copy the data) - worker processes re-open them lazily.
+        """
+        state = self.__dict__.copy()
+        state["_mmap_cache"] = None
+        return state
+
+    @property
+    def flat_cache(self):
+        """
+        Dictionary that maps keys (e.g. "actions" or "obs/agentview_image") to contiguous arrays
+        over all demos - either the memory-mapped arrays of the "mmap" cache mode, or the packed
+        in-memory cache when using @batched_fetch. None if not available.
+        """
+        if self.hdf5_cache_mode == "mmap":
+            return self.mmap_cache
+        return self._flat_cache
+
+    @staticmethod
+    def _demo_start_offsets_in(demo_lengths):
+        """
+        Start offset of each demo when demos with lengths @demo_lengths are packed back to back.
+        """
+        return np.concatenate([[0], np.cumsum(demo_lengths)[:-1]]).astype(np.int64)
+
+    def _set_demo_flat_offsets(self, demo_id_to_flat_offset):
+        """
+        Record the offset of each demo's first sample in the arrays of @flat_cache.
+        """
+        self._demo_id_to_flat_offset = {ep: int(demo_id_to_flat_offset[ep]) for ep in self.demos}
+        self._demo_flat_offsets = np.array([self._demo_id_to_flat_offset[ep] for ep in self.demos], dtype=np.int64)
+
     def close_and_delete_hdf5_handle(self):
         """
         Maybe close the file handle.
@@ -299,59 +439,187 @@ class SequenceDataset(torch.utils.data.Dataset):
 
         return all_data
 
+    def _flatten_dataset_cache(self, hdf5_cache):
+        """
+        Pack the per-demo in-memory cache from @load_dataset_in_memory into one contiguous array per
+        key, in the order of @self.demos. Per-demo arrays are released as soon as they are packed.
+
+        Args:
+            hdf5_cache (dict): in-memory dataset, as returned by @load_dataset_in_memory
+
+        Returns:
+            flat_cache (dict): maps keys (e.g. "actions" or "obs/agentview_image") to arrays
+        """
+        keys = list(self.dataset_keys) + ["obs/{}".format(k) for k in self.obs_keys_in_memory]
+        if self.load_next_obs:
+            keys += ["next_obs/{}".format(k) for k in self.obs_keys_in_memory]
+
+        print("SequenceDataset: packing in-memory dataset into contiguous arrays...")
+        flat_cache = dict()
+        for k in keys:
+            if '/' in k:
+                key1, key2 = k.split('/')
+                flat_cache[k] = np.concatenate([hdf5_cache[ep][key1].pop(key2) for ep in self.demos], axis=0)
+            else:
+                flat_cache[k] = np.concatenate([hdf5_cache[ep].pop(k) for ep in self.demos], axis=0)
+        return flat_cache
+
+    def _mmap_path_for_key(self, key):
+        """
+        Path to the memory-mapped array for @key (e.g. "actions" or "obs/agentview_image").
+        """
+        return os.path.join(self.hdf5_mmap_cache_dir, "{}.npy".format(key.replace("/", ".")))
+
+    def build_mmap_cache(self, keys):
+        """
+        Makes sure that a flat memory-mapped array exists for every key in @keys. Each array packs the
+        key across all demos in the hdf5 (in sorted demo order), so that the same files can be shared
+        between runs that use different filter keys. An index file records the demo order and lengths,
+        along with the size and modification time of the hdf5 - the arrays are rebuilt if the hdf5 changes.
+
+        Args:
+            keys (list): keys to pack, e.g. "actions" or "obs/agentview_image"
+
+        Returns:
+            mmap_index (dict): index with the packed "demos", their "lengths", and the packed "keys"
+        """
+        index_path = os.path.join(self.hdf5_mmap_cache_dir, "index.json")
+        hdf5_stat = os.stat(self.hdf5_path)
+        all_demos = sorted(self.hdf5_file["data"].keys(), key=lambda x: int(x[5:]))
+
+        mmap_index = None
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                mmap_index = json.load(f)
+            is_stale = (mmap_index["hdf5_size"] != hdf5_stat.st_size) or \
+                (mmap_index["hdf5_mtime"] != hdf5_stat.st_mtime) or (mmap_index["demos"] != all_demos)
+            if is_stale:
+                print("SequenceDataset: hdf5 has changed, rebuilding memory-mapped arrays...")
+                mmap_index = None
+        if mmap_index is None:
+            mmap_index = dict(
+                hdf5_size=hdf5_stat.st_size,
+                hdf5_mtime=hdf5_stat.st_mtime,
+                demos=all_demos,
+                lengths=[int(self.hdf5_file["data/{}".format(ep)].attrs["num_samples"]) for ep in all_demos],
+                keys=[],
+            )
+
+        missing_keys = [k for k in keys if (k not in mmap_index["keys"]) or (not os.path.exists(self._mmap_path_for_key(k)))]
+        if len(missing_keys) > 0:
+            os.makedirs(self.hdf5_mmap_cache_dir, exist_ok=True)
+            offsets = np.cumsum([0] + mmap_index["lengths"])
+            for k in missing_keys:
+                print("SequenceDataset: packing {} into {}...".format(k, self._mmap_path_for_key(k)))
+                self._write_mmap_array(k, demos=mmap_index["demos"], offsets=offsets)
+            mmap_index["keys"] = sorted(set(mmap_index["keys"]) | set(missing_keys))
+
+            # write index last (and atomically), so that an interrupted build is detected on the next run
+            tmp_index_path = index_path + ".tmp"
+            with open(tmp_index_path, "w") as f:
+                json.dump(mmap_index, f)
+            os.replace(tmp_index_path, index_path)
+
+        return mmap_index
+
+    def _write_mmap_array(self, key, demos, offsets):
+        """
+        Write @key for all @demos into one contiguous .npy file. Non-observation dataset keys are
+        converted to float32, and missing ones are filled with zeros, as in @load_dataset_in_memory.
+
+        Args:
+            key (str): key to pack, e.g. "actions" or "obs/agentview_image"
+            demos (list): demo keys, in the order they should be packed
+            offsets (np.array): start offset of each demo in the packed array, followed by the total length
+        """
+        assert len(demos) > 0
+        path = self._mmap_path_for_key(key)
+        tmp_path = path + ".tmp"
+        arr = None
+        for i, ep in enumerate(LogUtils.custom_tqdm(demos)):
+            hd5key = "data/{}/{}".format(ep, key)
+            if hd5key in self.hdf5_file:
+                data = self.hdf5_file[hd5key][()]
+                if '/' not in key:
+                    data = data.astype('float32')
+            else:
+                assert '/' not in key, "observation key {} not found in hdf5".format(key)
+                data = np.zeros((offsets[i + 1] - offsets[i], 1), dtype=np.float32)
+            if arr is None:
+                arr = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=data.dtype, shape=(int(offsets[-1]),) + data.shape[1:])
+            arr[offsets[i]:offsets[i + 1]] = data
+        arr.flush()
+        del arr
+        os.replace(tmp_path, path)
+
     def normalize_obs(self):
         """
         Computes a dataset-wide mean and standard deviation for the observations 
         (per dimension and per obs key) and returns it.
         """
-        def _compute_traj_stats(traj_obs_dict):
-            """
-            Helper function to compute statistics over a single trajectory of observations.
-            """
-            traj_stats = { k : {} for k in traj_obs_dict }
-            for k in traj_obs_dict:
-                traj_stats[k]["n"] = traj_obs_dict[k].shape[0]
-                traj_stats[k]["mean"] = traj_obs_dict[k].mean(axis=0, keepdims=True) # [1, ...]
-                traj_stats[k]["sqdiff"] = ((traj_obs_dict[k] - traj_stats[k]["mean"]) ** 2).sum(axis=0, keepdims=True) # [1, ...]
-            return traj_stats
-
-        def _aggregate_traj_stats(traj_stats_a, traj_stats_b):
-            """
-            Helper function to aggregate trajectory statistics.
-            See https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
-            for more information.
-            """
-            merged_stats = {}
-            for k in traj_stats_a:
-                n_a, avg_a, M2_a = traj_stats_a[k]["n"], traj_stats_a[k]["mean"], traj_stats_a[k]["sqdiff"]
-                n_b, avg_b, M2_b = traj_stats_b[k]["n"], traj_stats_b[k]["mean"], traj_stats_b[k]["sqdiff"]
-                n = n_a + n_b
-                mean = (n_a * avg_a + n_b * avg_b) / n
-                delta = (avg_b - avg_a)
-                M2 = M2_a + M2_b + (delta ** 2) * (n_a * n_b) / n
-                merged_stats[k] = dict(n=n, mean=mean, sqdiff=M2)
-            return merged_stats
+        if self.hdf5_use_metadata_cache:
+            obs_normalization_stats = CacheUtils.load_obs_normalization_stats(self.hdf5_path, self.obs_keys, self.demos)
+            if obs_normalization_stats is not None:
+                print("SequenceDataset: loaded observation normalization stats from cache")
+                return obs_normalization_stats
 
         # Run through all trajectories. For each one, compute minimal observation statistics, and then aggregate
         # with the previous statistics.
-        ep = self.demos[0]
-        obs_traj = {k: self.hdf5_file["data/{}/obs/{}".format(ep, k)][()].astype('float32') for k in self.obs_keys}
-        obs_traj = ObsUtils.process_obs_dict(obs_traj)
-        merged_stats = _compute_traj_stats(obs_traj)
         print("SequenceDataset: normalizing observations...")
-        for ep in LogUtils.custom_tqdm(self.demos[1:]):
-            obs_traj = {k: self.hdf5_file["data/{}/obs/{}".format(ep, k)][()].astype('float32') for k in self.obs_keys}
-            obs_traj = ObsUtils.process_obs_dict(obs_traj)
-            traj_stats = _compute_traj_stats(obs_traj)
-            merged_stats = _aggregate_traj_stats(merged_stats, traj_stats)
+        if self.hdf5_normalize_obs_num_workers > 0:
+            merged_stats = self._compute_obs_stats_parallel(num_workers=self.hdf5_normalize_obs_num_workers)
+        else:
+            merged_stats = None
+            for ep in LogUtils.custom_tqdm(self.demos):
+                traj_stats = _compute_traj_stats(_load_processed_obs_traj(self.hdf5_file, ep, self.obs_keys))
+                merged_stats = traj_stats if merged_stats is None else _aggregate_traj_stats(merged_stats, traj_stats)
 
         obs_normalization_stats = { k : {} for k in merged_stats }
         for k in merged_stats:
             # note we add a small tolerance of 1e-3 for std
             obs_normalization_stats[k]["mean"] = merged_stats[k]["mean"].astype(np.float32)
             obs_normalization_stats[k]["std"] = (np.sqrt(merged_stats[k]["sqdiff"] / merged_stats[k]["n"]) + 1e-3).astype(np.float32)
+
+        if self.hdf5_use_metadata_cache:
+            CacheUtils.save_obs_normalization_stats(self.hdf5_path, self.obs_keys, self.demos, obs_normalization_stats)
         return obs_normalization_stats
 
+    def _compute_obs_stats_parallel(self, num_workers):
+        """
+        Computes the merged observation statistics of @normalize_obs with a pool of worker processes.
+        Demos are split into contiguous shards, each worker reads its shards with its own hdf5 handle,
+        and the partial statistics are merged with a tree reduction (the merge is associative).
+
+        Args:
+            num_workers (int): number of worker processes
+
+        Returns:
+            merged_stats (dict): maps observation keys to dicts with "n", "mean", and "sqdiff"
+        """
+        # a few shards per worker for load balancing, since demos can have very different lengths
+        num_shards = min(len(self.demos), 4 * num_workers)
+        shards = [[str(ep) for ep in shard] for shard in np.array_split(self.demos, num_shards)]
+
+        # workers re-initialize the observation modality mapping, in case they don't inherit it (spawn)
+        modality_mapping = None
+        if ObsUtils.OBS_MODALITIES_TO_KEYS is not None:
+            modality_mapping = deepcopy(ObsUtils.OBS_MODALITIES_TO_KEYS)
+        worker_args = [(self.hdf5_path, self.hdf5_use_swmr, shard, self.obs_keys, modality_mapping) for shard in shards]
+
+        # don't share this process's open file handle with the workers
+        self.close_and_delete_hdf5_handle()
+        ctx = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        with ctx.Pool(processes=num_workers) as pool:
+            shard_stats = list(LogUtils.custom_tqdm(pool.imap(_compute_obs_stats_for_shard, worker_args), total=len(worker_args)))
+
+        # pairwise tree reduction over shards (in demo order)
+        while len(shard_stats) > 1:
+            reduced = [_aggregate_traj_stats(shard_stats[i], shard_stats[i + 1]) for i in range(0, len(shard_stats) - 1, 2)]
+            if len(shard_stats) % 2 == 1:
+                reduced.append(shard_stats[-1])
+            shard_stats = reduced
+        return shard_stats[0]
+
     def get_obs_normalization_stats(self):
         """
         Returns dictionary of mean and std for each observation key if using
@@ -372,6 +640,12 @@ class SequenceDataset(torch.utils.data.Dataset):
         Takes into account whether the dataset has been loaded into memory.
         """
 
+        flat_cache = self.flat_cache
+        if (flat_cache is not None) and (key in flat_cache):
+            # zero-copy view into the flat array
+            offset = self._demo_id_to_flat_offset[ep]
+            return flat_cache[key][offset: offset + self._demo_id_to_demo_length[ep]]
+
         # check if this key should be in memory
         key_should_be_in_memory = (self.hdf5_cache_mode in ["all", "low_dim"])
         if key_should_be_in_memory:
@@ -399,8 +673,11 @@ class SequenceDataset(torch.utils.data.Dataset):
     def __getitem__(self, index):
         """
         Fetch dataset sequence @index (inferred through internal index map), using the getitem_cache if available.
+        If @index is a list or array of indices (e.g. from @get_batch_sampler), the whole batch is fetched at once.
         """
-        if self.hdf5_cache_mode == "all":
+        if isinstance(index, (list, tuple, np.ndarray)):
+            return self.get_items(index)
+        if self.getitem_cache is not None:
             return self.getitem_cache[index]
         return self.get_item(index)
 
@@ -409,25 +686,29 @@ class SequenceDataset(torch.utils.data.Dataset):
         Main implementation of getitem when not using cache.
         """
 
-        demo_id = self._index_to_demo_id[index]
-        demo_start_index = self._demo_id_to_start_indices[demo_id]
-        demo_length = self._demo_id_to_demo_length[demo_id]
+        demo_index = self._index_to_demo_index(index)
+        demo_id = self.demos[demo_index]
+        demo_start_index = self._demo_start_indices[demo_index]
+        demo_length = self._demo_lengths[demo_index]
 
         # start at offset index if not padding for frame stacking
         demo_index_offset = 0 if self.pad_frame_stack else (self.n_frame_stack - 1)
-        index_in_demo = index - demo_start_index + demo_index_offset
+        index_in_demo = int(index - demo_start_index + demo_index_offset)
 
         # end at offset index if not padding for seq length
         demo_length_offset = 0 if self.pad_seq_length else (self.seq_length - 1)
-        end_index_in_demo = demo_length - demo_length_offset
+        end_index_in_demo = int(demo_length - demo_length_offset)
 
-        meta = self.get_dataset_sequence_from_demo(
-            demo_id,
-            index_in_demo=index_in_demo,
-            keys=self.dataset_keys,
-            num_frames_to_stack=self.n_frame_stack - 1, # note: need to decrement self.n_frame_stack by one
-            seq_length=self.seq_length
-        )
+        meta = dict()
+        for fetch_indices, keys in self._group_keys_by_fetch_indices(self.dataset_keys):
+            meta.update(self.get_dataset_sequence_from_demo(
+                demo_id,
+                index_in_demo=index_in_demo,
+                keys=keys,
+                num_frames_to_stack=self.n_frame_stack - 1, # note: need to decrement self.n_frame_stack by one
+                seq_length=self.seq_length,
+                fetch_indices=fetch_indices,
+            ))
 
         # determine goal index
         goal_index = None
@@ -440,7 +721,8 @@ class SequenceDataset(torch.utils.data.Dataset):
             keys=self.obs_keys,
             num_frames_to_stack=self.n_frame_stack - 1,
             seq_length=self.seq_length,
-            prefix="obs"
+            prefix="obs",
+            fetch_indices=self._get_fetch_indices("obs"),
         )
 
         if self.load_next_obs:
@@ -450,7 +732,8 @@ class SequenceDataset(torch.utils.data.Dataset):
                 keys=self.obs_keys,
                 num_frames_to_stack=self.n_frame_stack - 1,
                 seq_length=self.seq_length,
-                prefix="next_obs"
+                prefix="next_obs",
+                fetch_indices=self._get_fetch_indices("next_obs"),
             )
 
         if goal_index is not None:
@@ -466,7 +749,196 @@ class SequenceDataset(torch.utils.data.Dataset):
 
         return meta
 
-    def get_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1):
+    def get_items(self, indices):
+        """
+        Batched version of @get_item. Window bounds and padding masks for all @indices are
+        computed in one vectorized pass, and each key is read at most once per demo.
+
+        Args:
+            indices (list or np.array): sequence indices to fetch
+
+        Returns:
+            meta (dict): same structure as the output of @get_item, but every array has
+                a leading batch dimension of size len(@indices)
+        """
+        if self.getitem_cache is not None:
+            return self._stack_items([self.getitem_cache[i] for i in indices])
+
+        demo_inds, time_inds, pad_mask = self._get_window_indices(
+            indices,
+            num_frames_to_stack=self.n_frame_stack - 1,
+            seq_length=self.seq_length,
+        )
+
+        meta = dict()
+        for fetch_indices, keys in self._group_keys_by_fetch_indices(self.dataset_keys):
+            fetch_time_inds = time_inds if fetch_indices is None else time_inds[:, fetch_indices]
+            meta.update(self._gather_sequences(demo_inds, fetch_time_inds, keys=keys))
+        if self.get_pad_mask:
+            meta["pad_mask"] = pad_mask
+
+        prefixes = ["obs", "next_obs"] if self.load_next_obs else ["obs"]
+        for prefix in prefixes:
+            fetch_indices = self._get_fetch_indices(prefix)
+            fetch_time_inds = time_inds if fetch_indices is None else time_inds[:, fetch_indices]
+            meta[prefix] = self._gather_obs_sequences(demo_inds, fetch_time_inds, keys=self.obs_keys, prefix=prefix)
+            if self.get_pad_mask:
+                meta[prefix]["pad_mask"] = pad_mask
+
+        if self.goal_mode == "last":
+            # goal is last next_obs in the (unpadded) demo
+            demo_length_offset = 0 if self.pad_seq_length else (self.seq_length - 1)
+            goal_inds = (self._demo_lengths[demo_inds] - demo_length_offset - 1)[:, None]
+            goal = self._gather_obs_sequences(demo_inds, goal_inds, keys=self.obs_keys, prefix="next_obs")
+            meta["goal_obs"] = {k: goal[k][:, 0] for k in goal}  # remove sequence dimension for goal
+            if self.get_pad_mask:
+                meta["goal_obs"]["pad_mask"] = np.ones((len(demo_inds), 1), dtype=bool)
+
+        return meta
+
+    def _get_fetch_indices(self, key):
+        """
+        Positions in the fetched sequence to read for @key ("obs", "next_obs", or a dataset key),
+        or None if the full sequence should be read (see @seq_fetch_indices in the constructor).
+        """
+        if self.seq_fetch_indices is None:
+            return None
+        return self.seq_fetch_indices.get(key, None)
+
+    def _group_keys_by_fetch_indices(self, keys):
+        """
+        Group dataset @keys that read the same positions of the fetched sequence, so that
+        each group can be read together.
+
+        Returns:
+            groups (list): list of (fetch_indices, keys) tuples, where fetch_indices is None
+                for keys that are read in full
+        """
+        groups = dict()
+        for k in keys:
+            fetch_indices = self._get_fetch_indices(k)
+            group = None if fetch_indices is None else tuple(fetch_indices.tolist())
+            groups.setdefault(group, []).append(k)
+        return [
+            (None if group is None else np.array(group, dtype=np.int64), tuple(group_keys))
+            for group, group_keys in groups.items()
+        ]
+
+    def _get_window_indices(self, indices, num_frames_to_stack=0, seq_length=1):
+        """
+        Vectorized computation of the sequence windows for a batch of sequence indices.
+        Note that clipping timesteps to the demo boundaries is equivalent to padding
+        by repeating the first / last frame (see @get_sequence_from_demo).
+
+        Args:
+            indices (list or np.array): sequence indices
+            num_frames_to_stack (int): numbers of frame to stack
+            seq_length (int): sequence length to extract
+
+        Returns:
+            demo_inds (np.array): position of each sample's demo in @self.demos, of shape [B]
+            time_inds (np.array): clipped timestep of each window element in its demo, of shape [B, T]
+            pad_mask (np.array): boolean mask that is False on padded elements, of shape [B, T, 1]
+        """
+        assert num_frames_to_stack >= 0
+        assert seq_length >= 1
+
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        demo_inds = self._index_to_demo_index(indices)
+        demo_lengths = self._demo_lengths[demo_inds][:, None]
+
+        # start at offset index if not padding for frame stacking
+        demo_index_offset = 0 if self.pad_frame_stack else (self.n_frame_stack - 1)
+        index_in_demo = indices - self._demo_start_indices[demo_inds] + demo_index_offset
+
+        time_inds = index_in_demo[:, None] + np.arange(-num_frames_to_stack, seq_length)[None, :]
+        pad_mask = (time_inds >= 0) & (time_inds < demo_lengths)
+
+        # make sure we are not padding if specified.
+        if not self.pad_frame_stack:
+            assert np.all(time_inds[:, :num_frames_to_stack + 1] >= 0)
+        if not self.pad_seq_length:
+            assert np.all(time_inds[:, num_frames_to_stack:] < demo_lengths)
+
+        time_inds = np.clip(time_inds, 0, demo_lengths - 1)
+        return demo_inds, time_inds, pad_mask[..., None]
+
+    def _gather_sequences(self, demo_inds, time_inds, keys):
+        """
+        Gather windows of data items for a batch of samples. Samples are grouped
+        by demo so that each key is read with one contiguous slice per demo.
+
+        Args:
+            demo_inds (np.array): position of each sample's demo in @self.demos, of shape [B]
+            time_inds (np.array): timestep of each window element in its demo, of shape [B, T]
+            keys (tuple): list of keys to extract
+
+        Returns:
+            a dictionary of extracted items, each of shape [B, T, ...]
+        """
+        seq = dict()
+        flat_cache = self.flat_cache
+        flat_inds = None
+        rows_per_demo = None
+        for k in keys:
+            if (flat_cache is not None) and (k in flat_cache):
+                # single fancy-indexed gather over the flat array
+                if flat_inds is None:
+                    flat_inds = self._demo_flat_offsets[demo_inds][:, None] + time_inds
+                seq[k] = flat_cache[k][flat_inds]
+                continue
+
+            if rows_per_demo is None:
+                unique_demo_inds, inverse = np.unique(demo_inds, return_inverse=True)
+                rows_per_demo = [np.nonzero(inverse == j)[0] for j in range(len(unique_demo_inds))]
+            out = None
+            for demo_ind, rows in zip(unique_demo_inds, rows_per_demo):
+                t = time_inds[rows]
+                data = self._read_timesteps(self.get_dataset_for_ep(self.demos[demo_ind], k), t)
+                if out is None:
+                    out = np.empty((len(demo_inds),) + data.shape[1:], dtype=data.dtype)
+                out[rows] = data
+            seq[k] = out
+        return seq
+
+    @staticmethod
+    def _read_timesteps(data, time_inds):
+        """
+        Read timesteps @time_inds (array of any shape) from per-demo array or hdf5 dataset @data.
+        Contiguous timesteps are read with one slice, and sparse timesteps (see @seq_fetch_indices
+        in the constructor) only read the distinct rows that are needed.
+
+        Returns:
+            array of shape time_inds.shape + data.shape[1:]
+        """
+        if time_inds.size == 0:
+            return np.asarray(data[0:0]).reshape(time_inds.shape + data.shape[1:])
+        rows, inverse = np.unique(time_inds, return_inverse=True)
+        begin, end = int(rows[0]), int(rows[-1]) + 1
+        if len(rows) == end - begin:
+            rows = data[begin:end]
+        else:
+            # note: hdf5 point selections must be increasing, which np.unique ensures
+            rows = data[rows]
+        return rows[inverse.reshape(time_inds.shape)]
+
+    def _gather_obs_sequences(self, demo_inds, time_inds, keys, prefix="obs"):
+        """
+        Same as @_gather_sequences, but for observation items under @prefix ("obs" or "next_obs").
+        """
+        obs = self._gather_sequences(demo_inds, time_inds, keys=tuple('{}/{}'.format(prefix, k) for k in keys))
+        return {k.split('/')[1]: obs[k] for k in obs}  # strip the prefix
+
+    @staticmethod
+    def _stack_items(items):
+        """
+        Stack a list of (possibly nested) dictionaries of arrays along a new leading batch dimension.
+        """
+        if isinstance(items[0], dict):
+            return {k: SequenceDataset._stack_items([x[k] for x in items]) for k in items[0]}
+        return np.stack(items, axis=0)
+
+    def get_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1, fetch_indices=None):
         """
         Extract a (sub)sequence of data items from a demo given the @keys of the items.
 
@@ -476,6 +948,7 @@ class SequenceDataset(torch.utils.data.Dataset):
             keys (tuple): list of keys to extract
             num_frames_to_stack (int): numbers of frame to stack. Seq gets prepended with repeated items if out of range
             seq_length (int): sequence length to extract. Seq gets post-pended with repeated items if out of range
+            fetch_indices (np.array): if provided, only extract these positions of the sequence
 
         Returns:
             a dictionary of extracted items.
@@ -500,6 +973,14 @@ class SequenceDataset(torch.utils.data.Dataset):
         if not self.pad_seq_length:
             assert seq_end_pad == 0
 
+        if fetch_indices is not None:
+            # clipping timesteps to the demo boundaries is equivalent to padding by repeating the first / last frame
+            time_inds = index_in_demo - num_frames_to_stack + fetch_indices
+            pad_mask = ((time_inds >= 0) & (time_inds < demo_length))[:, None]
+            time_inds = np.clip(time_inds, 0, demo_length - 1)
+            seq = {k: self._read_timesteps(self.get_dataset_for_ep(demo_id, k), time_inds) for k in keys}
+            return seq, pad_mask
+
         # fetch observation from the dataset file
         seq = dict()
         for k in keys:
@@ -512,7 +993,7 @@ class SequenceDataset(torch.utils.data.Dataset):
 
         return seq, pad_mask
 
-    def get_obs_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1, prefix="obs"):
+    def get_obs_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1, prefix="obs", fetch_indices=None):
         """
         Extract a (sub)sequence of observation items from a demo given the @keys of the items.
 
@@ -523,6 +1004,7 @@ class SequenceDataset(torch.utils.data.Dataset):
             num_frames_to_stack (int): numbers of frame to stack. Seq gets prepended with repeated items if out of range
             seq_length (int): sequence length to extract. Seq gets post-pended with repeated items if out of range
             prefix (str): one of "obs", "next_obs"
+            fetch_indices (np.array): if provided, only extract these positions of the sequence
 
         Returns:
             a dictionary of extracted items.
@@ -533,6 +1015,7 @@ class SequenceDataset(torch.utils.data.Dataset):
             keys=tuple('{}/{}'.format(prefix, k) for k in keys),
             num_frames_to_stack=num_frames_to_stack,
             seq_length=seq_length,
+            fetch_indices=fetch_indices,
         )
         obs = {k.split('/')[1]: obs[k] for k in obs}  # strip the prefix
         if self.get_pad_mask:
@@ -540,7 +1023,7 @@ class SequenceDataset(torch.utils.data.Dataset):
 
         return obs
 
-    def get_dataset_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1):
+    def get_dataset_sequence_from_demo(self, demo_id, index_in_demo, keys, num_frames_to_stack=0, seq_length=1, fetch_indices=None):
         """
         Extract a (sub)sequence of dataset items from a demo given the @keys of the items (e.g., states, actions).
         
@@ -550,6 +1033,7 @@ class SequenceDataset(torch.utils.data.Dataset):
             keys (tuple): list of keys to extract
             num_frames_to_stack (int): numbers of frame to stack. Seq gets prepended with repeated items if out of range
             seq_length (int): sequence length to extract. Seq gets post-pended with repeated items if out of range
+            fetch_indices (np.array): if provided, only extract these positions of the sequence
 
         Returns:
             a dictionary of extracted items.
@@ -560,6 +1044,7 @@ class SequenceDataset(torch.utils.data.Dataset):
             keys=keys,
             num_frames_to_stack=num_frames_to_stack,
             seq_length=seq_length,
+            fetch_indices=fetch_indices,
         )
         if self.get_pad_mask:
             data["pad_mask"] = pad_mask
@@ -607,3 +1092,80 @@ class SequenceDataset(torch.utils.data.Dataset):
         `DataLoader` documentation, for more info.
         """
         return None
+
+    def get_batch_sampler(self, batch_size, shuffle=True, drop_last=True):
+        """
+        Return instance of torch.utils.data.BatchSampler that yields lists of indices, built
+        on top of @get_dataset_sampler. Pass it as the sampler of a DataLoader with batch_size=None,
+        so that each batch is fetched with a single call to @get_items instead of one call
+        to @get_item per sample followed by collation.
+
+        Args:
+            batch_size (int): number of indices per batch
+            shuffle (bool): whether to shuffle indices (only used if @get_dataset_sampler returns None)
+            drop_last (bool): whether to drop the last incomplete batch
+
+        Returns:
+            batch_sampler (torch.utils.data.BatchSampler): batch sampler
+        """
+        sampler = self.get_dataset_sampler()
+        if sampler is None:
+            if shuffle:
+                sampler = torch.utils.data.RandomSampler(self)
+            else:
+                sampler = torch.utils.data.SequentialSampler(self)
+        return torch.utils.data.BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+
+
+def _load_processed_obs_traj(hdf5_file, ep, obs_keys):
+    """
+    Helper function to read and process all observations of a single trajectory.
+    """
+    obs_traj = {k: hdf5_file["data/{}/obs/{}".format(ep, k)][()].astype('float32') for k in obs_keys}
+    return ObsUtils.process_obs_dict(obs_traj)
+
+
+def _compute_traj_stats(traj_obs_dict):
+    """
+    Helper function to compute statistics over a single trajectory of observations.
+    """
+    traj_stats = { k : {} for k in traj_obs_dict }
+    for k in traj_obs_dict:
+        traj_stats[k]["n"] = traj_obs_dict[k].shape[0]
+        traj_stats[k]["mean"] = traj_obs_dict[k].mean(axis=0, keepdims=True) # [1, ...]
+        traj_stats[k]["sqdiff"] = ((traj_obs_dict[k] - traj_stats[k]["mean"]) ** 2).sum(axis=0, keepdims=True) # [1, ...]
+    return traj_stats
+
+
+def _aggregate_traj_stats(traj_stats_a, traj_stats_b):
+    """
+    Helper function to aggregate trajectory statistics.
+    See https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+    for more information.
+    """
+    merged_stats = {}
+    for k in traj_stats_a:
+        n_a, avg_a, M2_a = traj_stats_a[k]["n"], traj_stats_a[k]["mean"], traj_stats_a[k]["sqdiff"]
+        n_b, avg_b, M2_b = traj_stats_b[k]["n"], traj_stats_b[k]["mean"], traj_stats_b[k]["sqdiff"]
+        n = n_a + n_b
+        mean = (n_a * avg_a + n_b * avg_b) / n
+        delta = (avg_b - avg_a)
+        M2 = M2_a + M2_b + (delta ** 2) * (n_a * n_b) / n
+        merged_stats[k] = dict(n=n, mean=mean, sqdiff=M2)
+    return merged_stats
+
+
+def _compute_obs_stats_for_shard(args):
+    """
+    Worker function for SequenceDataset._compute_obs_stats_parallel. Computes merged observation
+    statistics over a shard of demos, using its own hdf5 file handle.
+    """
+    hdf5_path, hdf5_use_swmr, demos, obs_keys, modality_mapping = args
+    if modality_mapping is not None:
+        ObsUtils.initialize_obs_modality_mapping_from_dict(modality_mapping)
+    merged_stats = None
+    with h5py.File(hdf5_path, 'r', swmr=hdf5_use_swmr, libver='latest') as f:
+        for ep in demos:
+            traj_stats = _compute_traj_stats(_load_processed_obs_traj(f, ep, obs_keys))
+            merged_stats = traj_stats if merged_stats is None else _aggregate_traj_stats(merged_stats, traj_stats)
+    return merged_stats
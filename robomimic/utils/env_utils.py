@@ -339,3 +339,34 @@ def wrap_env_from_config(env, config):
         env = FrameStackWrapper(env, num_frames=config.train.frame_stack)
 
     return env
+
+
+def create_env_for_subprocess(env_meta, config_json, env_name=None, **kwargs):
+    """
+    Creates and wraps an environment in a fresh worker process (see @SubprocVectorEnv), which
+    does not share the observation processing setup of the main process.
+
+    Args:
+        env_meta (dict): environment metadata (see @create_env_from_metadata)
+
+        config_json (str): json string of the training config (see Config.dump), used to
+            set up observation processing and environment wrappers
+
+        env_name (str): name of environment. Only needs to be provided if making a different
+            environment from the one in @env_meta.
+
+        kwargs: additional arguments to pass to @create_env_from_metadata
+    """
+    import json
+    import robomimic.utils.obs_utils as ObsUtils
+    from robomimic.config import config_factory
+
+    ext_cfg = json.loads(config_json)
+    config = config_factory(ext_cfg["algo_name"])
+    with config.values_unlocked():
+        config.update(ext_cfg)
+    ObsUtils.initialize_obs_utils_with_config(config)
+    set_env_specific_obs_processing(env_meta=env_meta)
+
+    env = create_env_from_metadata(env_meta=env_meta, env_name=env_name, **kwargs)
+    return wrap_env_from_config(env, config=config)
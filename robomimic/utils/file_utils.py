@@ -1,11 +1,14 @@
 """
 A collection of utility functions for working with files, such as reading metadata from
-demonstration datasets, loading model checkpoints, or downloading dataset files.
+demonstration datasets, writing trajectories to datasets, loading model checkpoints, or
+downloading dataset files.
 """
 import os
 import h5py
 import json
 import time
+import queue
+import threading
 import urllib.request
 import numpy as np
 from collections import OrderedDict
@@ -16,6 +19,7 @@ import torch
 import robomimic.utils.obs_utils as ObsUtils
 import robomimic.utils.env_utils as EnvUtils
 import robomimic.utils.torch_utils as TorchUtils
+import robomimic.utils.cache_utils as CacheUtils
 from robomimic.config import config_factory
 from robomimic.algo import algo_factory
 from robomimic.algo import RolloutPolicy
@@ -82,6 +86,256 @@ def get_demos_for_filter_key(hdf5_path, filter_key):
     return demo_keys
 
 
+class HDF5TrajectoryWriter(object):
+    """
+    Writes trajectories to a robomimic hdf5 file one step at a time, so that memory use does not
+    grow with the episode length. Each per-timestep key (such as "actions" or "obs/agentview_image")
+    is stored in a resizable hdf5 dataset that is chunked along time. Steps are collected in a
+    buffer of @chunk_size steps per key, and each full buffer is appended to the datasets as one
+    chunk.
+
+    With @background=True, all hdf5 operations run on a separate writer thread, and the buffers
+    are handed over through a bounded queue, so that rollouts do not wait for disk writes.
+
+    Episodes are crash-safe: after every chunk, the datasets of the episode all have the same
+    length, its "num_samples" attribute matches that length, and the file is flushed. Episodes
+    that are not finished with @end_episode (for example, because of an exception during the
+    rollout) are kept with the steps written so far and have a "partial" attribute set to True.
+
+    Example usage:
+
+        writer = HDF5TrajectoryWriter("/path/to/output.hdf5", background=True)
+        writer.start_episode(attrs=dict(model_file=model_xml))
+        for t in range(horizon):
+            writer.add_step(dict(actions=act, rewards=r, dones=done, states=state, obs=obs, next_obs=next_obs))
+        writer.end_episode()
+        writer.close(data_attrs=dict(env_args=json.dumps(env.serialize(), indent=4)))
+    """
+    def __init__(self, hdf5_path, chunk_size=64, background=False, max_queue_size=8):
+        """
+        Args:
+            hdf5_path (str): path to output hdf5 file (overwritten if it exists)
+
+            chunk_size (int): number of timesteps per hdf5 chunk, and per write
+
+            background (bool): if True, write to the file on a separate thread
+
+            max_queue_size (int): maximum number of chunks waiting to be written by the
+                background thread - bounds the memory of chunks in flight
+        """
+        assert chunk_size > 0
+        self.hdf5_path = hdf5_path
+        self.chunk_size = chunk_size
+        self.background = background
+
+        self._f = h5py.File(hdf5_path, "w")
+        self._data_grp = self._f.create_group("data")
+        self._total = 0
+        self.num_episodes = 0
+
+        # current episode
+        self._ep = None
+        self._ep_attrs = None
+        self._ep_len = 0
+        self._buffers = None
+        self._buffer_len = 0
+
+        self._queue = None
+        self._thread = None
+        self._error = None
+        if self.background:
+            self._queue = queue.Queue(maxsize=max_queue_size)
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        """
+        Runs the hdf5 operations submitted to the queue, until it receives None. After an error,
+        the remaining operations are skipped, and the error is raised by the next call on the
+        main thread.
+        """
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            if self._error is not None:
+                continue
+            fn, args = op
+            try:
+                fn(*args)
+            except Exception as e:
+                self._error = e
+
+    def _submit(self, fn, *args):
+        """
+        Run hdf5 operation @fn with @args, on the writer thread if writing in the background.
+        """
+        if self._error is not None:
+            raise Exception("HDF5TrajectoryWriter: background write failed") from self._error
+        if self.background:
+            self._queue.put((fn, args))
+        else:
+            fn(*args)
+
+    @staticmethod
+    def _flatten_step(step, prefix=""):
+        """
+        Flatten nested dictionaries (such as "obs") in @step into "/"-separated hdf5 paths.
+        """
+        flat = OrderedDict()
+        for k in step:
+            if isinstance(step[k], dict):
+                flat.update(HDF5TrajectoryWriter._flatten_step(step[k], prefix="{}{}/".format(prefix, k)))
+            else:
+                flat[prefix + k] = np.asarray(step[k])
+        return flat
+
+    def start_episode(self, ep=None, attrs=None):
+        """
+        Start writing a new episode.
+
+        Args:
+            ep (str): name of the episode group under "data" - defaults to "demo_<i>", where i is
+                the number of episodes started so far
+
+            attrs (dict): attributes to write to the episode group, such as "model_file"
+        """
+        assert self._ep is None, "HDF5TrajectoryWriter: must call end_episode before starting a new one"
+        if ep is None:
+            ep = "demo_{}".format(self.num_episodes)
+        self._ep = ep
+        self._ep_attrs = dict() if attrs is None else dict(attrs)
+        self._ep_len = 0
+        self._buffers = None
+        self._buffer_len = 0
+        self.num_episodes += 1
+        self._submit(self._create_episode_group, ep, self._ep_attrs)
+
+    def add_step(self, step):
+        """
+        Add one timestep to the current episode.
+
+        Args:
+            step (dict): maps keys to the values of this timestep, and may contain nested
+                dictionaries of observations (such as "obs" and "next_obs"). All steps of an
+                episode must have the same keys, shapes, and dtypes.
+        """
+        assert self._ep is not None, "HDF5TrajectoryWriter: must call start_episode before add_step"
+        step = self._flatten_step(step)
+        if self._buffers is None:
+            self._buffers = OrderedDict(
+                (k, np.empty((self.chunk_size,) + step[k].shape, dtype=step[k].dtype)) for k in step
+            )
+        for k in self._buffers:
+            self._buffers[k][self._buffer_len] = step[k]
+        self._buffer_len += 1
+        if self._buffer_len == self.chunk_size:
+            self._write_buffers()
+
+    def _write_buffers(self):
+        """
+        Append the buffered steps to the datasets of the current episode.
+        """
+        if self._buffer_len == 0:
+            return
+        chunk = OrderedDict((k, self._buffers[k][:self._buffer_len]) for k in self._buffers)
+        self._submit(self._write_chunk, self._ep, chunk, self._ep_len)
+        self._ep_len += self._buffer_len
+        self._buffer_len = 0
+        if self.background:
+            # the writer thread owns the buffers now
+            self._buffers = None
+
+    def end_episode(self, partial=False):
+        """
+        Write the remaining steps of the current episode and finish it.
+
+        Args:
+            partial (bool): if True, mark the episode as partial (see class docstring)
+
+        Returns:
+            num_samples (int): number of steps in the episode
+        """
+        assert self._ep is not None, "HDF5TrajectoryWriter: no episode to end"
+        self._write_buffers()
+        num_samples = self._ep_len
+        self._submit(self._finish_episode, self._ep, num_samples, partial)
+        self._ep = None
+        self._buffers = None
+        return num_samples
+
+    def close(self, data_attrs=None):
+        """
+        Finish any ongoing episode (as a partial episode), write global metadata, and close the file.
+
+        Args:
+            data_attrs (dict): attributes to write to the "data" group, such as "env_args"
+        """
+        try:
+            if (self._ep is not None) and (self._error is None):
+                self.end_episode(partial=True)
+            if data_attrs is not None:
+                self._submit(self._write_data_attrs, data_attrs)
+        finally:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            self._f.close()
+        if self._error is not None:
+            raise Exception("HDF5TrajectoryWriter: background write failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # hdf5 operations, run on the writer thread if writing in the background
+
+    def _create_episode_group(self, ep, attrs):
+        ep_grp = self._data_grp.create_group(ep)
+        for k in attrs:
+            ep_grp.attrs[k] = attrs[k]
+        ep_grp.attrs["num_samples"] = 0
+        ep_grp.attrs["partial"] = True
+
+    def _write_chunk(self, ep, chunk, start):
+        ep_grp = self._data_grp[ep]
+        end = start + next(iter(chunk.values())).shape[0]
+        for k in chunk:
+            if k not in ep_grp:
+                shape = chunk[k].shape[1:]
+                ep_grp.create_dataset(
+                    k,
+                    shape=(0,) + shape,
+                    maxshape=(None,) + shape,
+                    chunks=(self.chunk_size,) + shape,
+                    dtype=chunk[k].dtype,
+                )
+            dset = ep_grp[k]
+            dset.resize(end, axis=0)
+            dset[start:end] = chunk[k]
+        ep_grp.attrs["num_samples"] = end
+        self._f.flush()
+
+    def _finish_episode(self, ep, num_samples, partial):
+        ep_grp = self._data_grp[ep]
+        ep_grp.attrs["num_samples"] = num_samples
+        if partial:
+            ep_grp.attrs["partial"] = True
+        else:
+            del ep_grp.attrs["partial"]
+        self._total += num_samples
+        self._data_grp.attrs["total"] = self._total
+        self._f.flush()
+
+    def _write_data_attrs(self, attrs):
+        for k in attrs:
+            self._data_grp.attrs[k] = attrs[k]
+        self._f.flush()
+
+
 def get_env_metadata_from_dataset(dataset_path, set_env_specific_obs_processors=True):
     """
     Retrieves env metadata from dataset.
@@ -111,7 +365,7 @@ def get_env_metadata_from_dataset(dataset_path, set_env_specific_obs_processors=
     return env_meta
 
 
-def get_shape_metadata_from_dataset(dataset_path, all_obs_keys=None, verbose=False):
+def get_shape_metadata_from_dataset(dataset_path, all_obs_keys=None, verbose=False, use_metadata_cache=False):
     """
     Retrieves shape metadata from dataset.
 
@@ -120,6 +374,8 @@ def get_shape_metadata_from_dataset(dataset_path, all_obs_keys=None, verbose=Fal
         all_obs_keys (list): list of all modalities used by the model. If not provided, all modalities
             present in the file are used.
         verbose (bool): if True, include print statements
+        use_metadata_cache (bool): if True, read raw shapes from the on-disk metadata cache
+            (see utils/cache_utils.py) instead of the hdf5 when the cache is valid
 
     Returns:
         shape_meta (dict): shape metadata. Contains the following keys:
@@ -135,22 +391,24 @@ def get_shape_metadata_from_dataset(dataset_path, all_obs_keys=None, verbose=Fal
 
     # read demo file for some metadata
     dataset_path = os.path.expanduser(dataset_path)
-    f = h5py.File(dataset_path, "r")
-    demo_id = list(f["data"].keys())[0]
-    demo = f["data/{}".format(demo_id)]
+    if use_metadata_cache:
+        metadata = CacheUtils.get_demo_metadata(dataset_path)
+    else:
+        with h5py.File(dataset_path, "r") as f:
+            metadata = CacheUtils.compute_demo_metadata(f)
 
     # action dimension
-    shape_meta['ac_dim'] = f["data/{}/actions".format(demo_id)].shape[1]
+    shape_meta['ac_dim'] = metadata["ac_dim"]
 
     # observation dimensions
     all_shapes = OrderedDict()
 
     if all_obs_keys is None:
         # use all modalities present in the file
-        all_obs_keys = [k for k in demo["obs"]]
+        all_obs_keys = [k for k in metadata["obs_shapes"]]
 
     for k in sorted(all_obs_keys):
-        initial_shape = demo["obs/{}".format(k)].shape[1:]
+        initial_shape = tuple(metadata["obs_shapes"][k])
         if verbose:
             print("obs key {} with shape {}".format(k, initial_shape))
         # Store processed shape for each obs key
@@ -159,8 +417,6 @@ def get_shape_metadata_from_dataset(dataset_path, all_obs_keys=None, verbose=Fal
             input_shape=initial_shape,
         )
 
-    f.close()
-
     shape_meta['all_shapes'] = all_shapes
     shape_meta['all_obs_keys'] = all_obs_keys
     shape_meta['use_images'] = ObsUtils.has_modality("rgb", all_obs_keys)
@@ -392,9 +648,7 @@ def policy_from_checkpoint(device=None, ckpt_path=None, ckpt_dict=None, verbose=
     obs_normalization_stats = ckpt_dict.get("obs_normalization_stats", None)
     if obs_normalization_stats is not None:
         assert config.train.hdf5_normalize_obs
-        for m in obs_normalization_stats:
-            for k in obs_normalization_stats[m]:
-                obs_normalization_stats[m][k] = np.array(obs_normalization_stats[m][k])
+        obs_normalization_stats = ObsUtils.ObsNormalizationStats(obs_normalization_stats)
 
     if device is None:
         # get torch device
@@ -409,6 +663,8 @@ def policy_from_checkpoint(device=None, ckpt_path=None, ckpt_dict=None, verbose=
         device=device,
     )
     model.deserialize(ckpt_dict["model"])
+    if ("grad_scaler" in ckpt_dict) and (getattr(model, "grad_scaler", None) is not None):
+        model.grad_scaler.load_state_dict(ckpt_dict["grad_scaler"])
     model.set_eval()
     model = RolloutPolicy(model, obs_normalization_stats=obs_normalization_stats)
     if verbose:
@@ -10,6 +10,7 @@ import torch
 import torch.nn.functional as F
 
 import robomimic.utils.tensor_utils as TU
+import robomimic.macros as Macros
 
 # MACRO FOR VALID IMAGE CHANNEL SIZES
 VALID_IMAGE_CHANNEL_DIMS = {1, 3}       # depth, rgb
@@ -253,6 +254,21 @@ def initialize_obs_utils_with_config(config):
     initialize_default_obs_encoder(obs_encoder_config=obs_encoder_config)
 
 
+def visual_feature_key(obs_key):
+    """
+    Name of the observation key that holds precomputed backbone features for image observation
+    @obs_key (see scripts/extract_visual_features.py). Observation encoders consume these features
+    in place of @obs_key when it is missing from their inputs.
+
+    Args:
+        obs_key (str): name of image observation
+
+    Returns:
+        feature_key (str): name of feature observation
+    """
+    return "{}_features".format(obs_key)
+
+
 def key_is_obs_modality(key, obs_modality):
     """
     Check if observation key corresponds to modality @obs_modality.
@@ -472,13 +488,15 @@ def normalize_obs(obs_dict, obs_normalization_stats):
         obs_dict (dict): dictionary mapping observation key to np.array or
             torch.Tensor. Can have any number of leading batch dimensions.
 
-        obs_normalization_stats (dict): this should map observation keys to dicts
+        obs_normalization_stats (dict or ObsNormalizationStats): this should map observation keys to dicts
             with a "mean" and "std" of shape (1, ...) where ... is the default
             shape for the observation.
 
     Returns:
         obs_dict (dict): obs dict with normalized observation arrays
     """
+    if isinstance(obs_normalization_stats, ObsNormalizationStats):
+        return obs_normalization_stats.normalize(obs_dict)
 
     # ensure we have statistics for each modality key in the observation
     assert set(obs_dict.keys()).issubset(obs_normalization_stats)
@@ -507,6 +525,105 @@ def normalize_obs(obs_dict, obs_normalization_stats):
     return obs_dict
 
 
+class ObsNormalizationStats(object):
+    """
+    Observation normalization statistics, which map observation keys to dicts with a "mean"
+    and "std" of shape (1, ...) where ... is the default shape for the observation. Supports
+    read-only dictionary access to these statistics.
+
+    For torch observations, the statistics are converted once per device into a precomputed
+    scale (1 / std) and shift (-mean / std) and kept there, so that normalizing an observation
+    is a single fused multiply-add instead of re-uploading the statistics for every batch.
+    """
+    def __init__(self, obs_normalization_stats):
+        """
+        Args:
+            obs_normalization_stats (dict or ObsNormalizationStats): statistics for each observation key
+        """
+        if isinstance(obs_normalization_stats, ObsNormalizationStats):
+            obs_normalization_stats = obs_normalization_stats.as_dict()
+        self._stats = OrderedDict()
+        for k in obs_normalization_stats:
+            self._stats[k] = { s : np.array(obs_normalization_stats[k][s]).astype(np.float32)
+                for s in obs_normalization_stats[k] }
+        self._device_params = dict()
+
+    def as_dict(self):
+        """
+        Returns a copy of the statistics as a dictionary of np.arrays (e.g. for saving to checkpoints).
+        """
+        return deepcopy(self._stats)
+
+    def __getitem__(self, k):
+        return self._stats[k]
+
+    def __contains__(self, k):
+        return k in self._stats
+
+    def __iter__(self):
+        return iter(self._stats)
+
+    def __len__(self):
+        return len(self._stats)
+
+    def keys(self):
+        return self._stats.keys()
+
+    def to(self, device):
+        """
+        Get the scale and shift tensors on @device, converting them on first use.
+
+        Args:
+            device (torch.device or str): device to get tensors on
+
+        Returns:
+            params (dict): maps observation keys to (scale, shift) tuples of tensors with the
+                default shape of the observation
+        """
+        device = torch.device(device)
+        if device not in self._device_params:
+            params = dict()
+            for k in self._stats:
+                mean = torch.from_numpy(self._stats[k]["mean"][0])
+                std = torch.from_numpy(self._stats[k]["std"][0])
+                params[k] = ((1. / std).to(device), (-mean / std).to(device))
+            self._device_params[device] = params
+        return self._device_params[device]
+
+    def normalize(self, obs_dict):
+        """
+        Normalize observations. The observation dictionary will be modified in-place.
+        See @normalize_obs.
+
+        Args:
+            obs_dict (dict): dictionary mapping observation key to np.array or
+                torch.Tensor. Can have any number of leading batch dimensions.
+
+        Returns:
+            obs_dict (dict): obs dict with normalized observation arrays
+        """
+        # ensure we have statistics for each modality key in the observation
+        assert set(obs_dict.keys()).issubset(self._stats)
+
+        for m in obs_dict:
+            if not isinstance(obs_dict[m], torch.Tensor):
+                obs_dict[m] = normalize_obs({ m : obs_dict[m] }, obs_normalization_stats=self._stats)[m]
+                continue
+            scale, shift = self.to(obs_dict[m].device)[m]
+
+            # shape consistency checks - stats broadcast over any leading batch dimensions
+            m_num_dims = len(scale.shape)
+            assert len(obs_dict[m].shape) >= m_num_dims, "shape length mismatch in @normalize"
+            assert obs_dict[m].shape[len(obs_dict[m].shape) - m_num_dims:] == scale.shape, "shape mismatch in @normalize"
+
+            obs_dict[m] = torch.addcmul(shift, obs_dict[m], scale)
+
+        return obs_dict
+
+    def __repr__(self):
+        return "ObsNormalizationStats(keys={})".format(list(self._stats.keys()))
+
+
 def has_modality(modality, obs_keys):
     """
     Returns True if @modality is present in the list of observation keys @obs_keys.
@@ -589,44 +706,26 @@ def crop_image_from_indices(images, crop_indices, crop_height, crop_width):
     image_c, image_h, image_w = images.shape[-3:]
     num_crops = crop_indices.shape[-2]
 
-    # make sure @crop_indices are in valid range
-    assert (crop_indices[..., 0] >= 0).all().item()
-    assert (crop_indices[..., 0] < (image_h - crop_height)).all().item()
-    assert (crop_indices[..., 1] >= 0).all().item()
-    assert (crop_indices[..., 1] < (image_w - crop_width)).all().item()
-
-    # convert each crop index (ch, cw) into a list of pixel indices that correspond to the entire window.
-
-    # 2D index array with columns [0, 1, ..., CH - 1] and shape [CH, CW]
-    crop_ind_grid_h = torch.arange(crop_height).to(device)
-    crop_ind_grid_h = TU.unsqueeze_expand_at(crop_ind_grid_h, size=crop_width, dim=-1)
-    # 2D index array with rows [0, 1, ..., CW - 1] and shape [CH, CW]
-    crop_ind_grid_w = torch.arange(crop_width).to(device)
-    crop_ind_grid_w = TU.unsqueeze_expand_at(crop_ind_grid_w, size=crop_height, dim=0)
-    # combine into shape [CH, CW, 2]
-    crop_in_grid = torch.cat((crop_ind_grid_h.unsqueeze(-1), crop_ind_grid_w.unsqueeze(-1)), dim=-1)
-
-    # Add above grid with the offset index of each sampled crop to get 2d indices for each crop.
-    # After broadcasting, this will be shape [..., N, CH, CW, 2] and each crop has a [CH, CW, 2]
-    # shape array that tells us which pixels from the corresponding source image to grab.
-    grid_reshape = [1] * len(crop_indices.shape[:-1]) + [crop_height, crop_width, 2]
-    all_crop_inds = crop_indices.unsqueeze(-2).unsqueeze(-2) + crop_in_grid.reshape(grid_reshape)
-
-    # For using @torch.gather, convert to flat indices from 2D indices, and also
-    # repeat across the channel dimension. To get flat index of each pixel to grab for 
-    # each sampled crop, we just use the mapping: ind = h_ind * @image_w + w_ind
-    all_crop_inds = all_crop_inds[..., 0] * image_w + all_crop_inds[..., 1] # shape [..., N, CH, CW]
-    all_crop_inds = TU.unsqueeze_expand_at(all_crop_inds, size=image_c, dim=-3) # shape [..., N, C, CH, CW]
-    all_crop_inds = TU.flatten(all_crop_inds, begin_axis=-2) # shape [..., N, C, CH * CW]
-
-    # Repeat and flatten the source images -> [..., N, C, H * W] and then use gather to index with crop pixel inds
-    images_to_crop = TU.unsqueeze_expand_at(images, size=num_crops, dim=-4)
-    images_to_crop = TU.flatten(images_to_crop, begin_axis=-2)
-    crops = torch.gather(images_to_crop, dim=-1, index=all_crop_inds)
-    # [..., N, C, CH * CW] -> [..., N, C, CH, CW]
-    reshape_axis = len(crops.shape) - 1
-    crops = TU.reshape_dimensions(crops, begin_axis=reshape_axis, end_axis=reshape_axis, 
-                    target_dims=(crop_height, crop_width))
+    # make sure @crop_indices are in valid range - only in debug mode, since these checks
+    # synchronize with the device
+    if Macros.DEBUG:
+        assert (crop_indices[..., 0] >= 0).all().item()
+        assert (crop_indices[..., 0] < (image_h - crop_height)).all().item()
+        assert (crop_indices[..., 1] >= 0).all().item()
+        assert (crop_indices[..., 1] < (image_w - crop_width)).all().item()
+
+    # Take a strided view of all (CH, CW) windows of each image, of shape [M, C, H - CH + 1, W - CW + 1, CH, CW]
+    # where M is the product of the leading dimensions. This does not copy any data, so the only copy made
+    # is when indexing the view to get the crops.
+    leading_shape = images.shape[:-3]
+    images = images.reshape(-1, image_c, image_h, image_w)
+    windows = images.unfold(2, crop_height, 1).unfold(3, crop_width, 1)
+
+    # index the top left corner of each crop -> [M * N, C, CH, CW]
+    flat_crop_indices = crop_indices.reshape(-1, 2).long()
+    batch_inds = torch.arange(images.shape[0], device=device).repeat_interleave(num_crops)
+    crops = windows[batch_inds, :, flat_crop_indices[:, 0], flat_crop_indices[:, 1]]
+    crops = crops.reshape(*leading_shape, num_crops, image_c, crop_height, crop_width)
 
     if is_padded:
         # undo padding -> [..., C, CH, CW]
@@ -661,26 +760,8 @@ def sample_random_image_crops(images, crop_height, crop_width, num_crops, pos_en
     """
     device = images.device
 
-    # maybe add 2 channels of spatial encoding to the source image
-    source_im = images
-    if pos_enc:
-        # spatial encoding [y, x] in [0, 1]
-        h, w = source_im.shape[-2:]
-        pos_y, pos_x = torch.meshgrid(torch.arange(h), torch.arange(w))
-        pos_y = pos_y.float().to(device) / float(h)
-        pos_x = pos_x.float().to(device) / float(w)
-        position_enc = torch.stack((pos_y, pos_x)) # shape [C, H, W]
-
-        # unsqueeze and expand to match leading dimensions -> shape [..., C, H, W]
-        leading_shape = source_im.shape[:-3]
-        position_enc = position_enc[(None,) * len(leading_shape)]
-        position_enc = position_enc.expand(*leading_shape, -1, -1, -1)
-
-        # concat across channel dimension with input
-        source_im = torch.cat((source_im, position_enc), dim=-3)
-
     # make sure sample boundaries ensure crops are fully within the images
-    image_c, image_h, image_w = source_im.shape[-3:]
+    image_c, image_h, image_w = images.shape[-3:]
     max_sample_h = image_h - crop_height
     max_sample_w = image_w - crop_width
 
@@ -690,17 +771,29 @@ def sample_random_image_crops(images, crop_height, crop_width, num_crops, pos_en
     # or possibly no leading dimension.
     #
     # Trick: sample in [0, 1) with rand, then re-scale to [0, M) and convert to long to get sampled ints
-    crop_inds_h = (max_sample_h * torch.rand(*source_im.shape[:-3], num_crops).to(device)).long()
-    crop_inds_w = (max_sample_w * torch.rand(*source_im.shape[:-3], num_crops).to(device)).long()
+    crop_inds_h = (max_sample_h * torch.rand(*images.shape[:-3], num_crops, device=device)).long()
+    crop_inds_w = (max_sample_w * torch.rand(*images.shape[:-3], num_crops, device=device)).long()
     crop_inds = torch.cat((crop_inds_h.unsqueeze(-1), crop_inds_w.unsqueeze(-1)), dim=-1) # shape [..., N, 2]
 
     crops = crop_image_from_indices(
-        images=source_im, 
+        images=images, 
         crop_indices=crop_inds, 
         crop_height=crop_height, 
         crop_width=crop_width, 
     )
 
+    if pos_enc:
+        # 2 channels of spatial encoding [y, x] in [0, 1] of the source pixel locations of each crop. These
+        # are computed from the crop indices directly, instead of adding them to the source image before cropping.
+        pos_y = (crop_inds_h.unsqueeze(-1) + torch.arange(crop_height, device=device)).float() / float(image_h)
+        pos_x = (crop_inds_w.unsqueeze(-1) + torch.arange(crop_width, device=device)).float() / float(image_w)
+        pos_y = pos_y.unsqueeze(-1).expand(*pos_y.shape, crop_width)                   # shape [..., N, CH, CW]
+        pos_x = pos_x.unsqueeze(-2).expand(*pos_x.shape[:-1], crop_height, crop_width) # shape [..., N, CH, CW]
+        position_enc = torch.stack((pos_y, pos_x), dim=-3).to(dtype=crops.dtype)      # shape [..., N, 2, CH, CW]
+
+        # concat across channel dimension with crops
+        crops = torch.cat((crops, position_enc), dim=-3)
+
     return crops, crop_inds
 
 
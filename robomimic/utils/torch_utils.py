@@ -6,19 +6,43 @@ import torch
 import torch.optim as optim
 
 
+def _soft_update_params(source_params, target_params, tau):
+    """
+    In-place update target = target * (1 - tau) + source * tau over lists of tensors. Uses
+    fused multi-tensor (foreach) kernels where available, and otherwise updates a single
+    flat copy of the target parameters and writes it back.
+    """
+    if len(target_params) == 0:
+        return
+    target_data = [p.data for p in target_params]
+    source_data = [p.data for p in source_params]
+    if hasattr(torch, "_foreach_mul_"):
+        torch._foreach_mul_(target_data, 1.0 - tau)
+        torch._foreach_add_(target_data, source_data, alpha=tau)
+    else:
+        flat_target = torch.cat([t.reshape(-1) for t in target_data])
+        flat_target.mul_(1.0 - tau).add_(torch.cat([t.reshape(-1) for t in source_data]), alpha=tau)
+        offset = 0
+        for t in target_data:
+            t.copy_(flat_target[offset:offset + t.numel()].view_as(t))
+            offset += t.numel()
+
+
 def soft_update(source, target, tau):
     """
     Soft update from the parameters of a @source torch module to a @target torch module
-    with strength @tau. The update follows target = target * (1 - tau) + source * tau.
+    with strength @tau. The update follows target = target * (1 - tau) + source * tau,
+    and is applied in-place to all parameters at once (see @EMAUpdater). Modules can also
+    be whole ensembles (e.g. nn.ModuleList of critics).
 
     Args:
         source (torch.nn.Module): source network to push target network parameters towards
         target (torch.nn.Module): target network to update
     """
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.copy_(
-            target_param * (1.0 - tau) + param * tau
-        )
+    target_params = list(target.parameters())
+    source_params = list(source.parameters())
+    assert len(target_params) == len(source_params)
+    _soft_update_params(source_params=source_params, target_params=target_params, tau=tau)
 
 
 def hard_update(source, target):
@@ -163,7 +187,31 @@ def lr_scheduler_from_optim_params(net_optim_params, net, optimizer):
     return lr_scheduler
 
 
-def backprop_for_loss(net, optim, loss, max_grad_norm=None, retain_graph=False):
+def grad_norm_squared(parameters):
+    """
+    Compute the sum of squared gradient norms over @parameters without synchronizing
+    with the device. Per-parameter norms are computed with a single fused (foreach) kernel
+    where available.
+
+    Args:
+        parameters (iterable): parameters to compute gradient norms for. Parameters without
+            gradients are skipped.
+
+    Returns:
+        grad_norms (torch.Tensor): 0-dim tensor with the sum of squared gradient norms. Call
+            .item() on it only when the value is needed (e.g. for logging).
+    """
+    grads = [p.grad.detach() for p in parameters if p.grad is not None]
+    if len(grads) == 0:
+        return torch.zeros(())
+    if hasattr(torch, "_foreach_norm"):
+        norms = torch._foreach_norm(grads, 2)
+    else:
+        norms = [g.norm(2) for g in grads]
+    return torch.stack(norms).pow(2).sum()
+
+
+def backprop_for_loss(net, optim, loss, max_grad_norm=None, retain_graph=False, scaler=None):
     """
     Backpropagate loss and update parameters for network with
     name @name.
@@ -179,31 +227,89 @@ def backprop_for_loss(net, optim, loss, max_grad_norm=None, retain_graph=False):
 
         retain_graph (bool): if True, graph is not freed after backward call
 
+        scaler (GradScaler): if provided and enabled, the loss is scaled before backpropagation
+            and gradients are unscaled before clipping, so that float16 gradients do not underflow.
+            Steps with inf / nan gradients are skipped. The loss scale is not updated here - call
+            scaler.update() once per training iteration (algos do this through
+            @Algo.backprop_for_loss and @Algo.on_train_batch_end).
+
     Returns:
-        grad_norms (float): average gradient norms from backpropagation
+        grad_norms (torch.Tensor): 0-dim tensor with the sum of squared gradient norms from
+            backpropagation. It is not synchronized with the device until it is converted
+            to a float (see @TrainUtils.run_epoch).
     """
+    if (scaler is not None) and (not scaler.is_enabled()):
+        scaler = None
 
     # backprop
     optim.zero_grad()
-    loss.backward(retain_graph=retain_graph)
+    if scaler is not None:
+        scaler.scale(loss).backward(retain_graph=retain_graph)
+        # unscale in-place so that clipping and grad norms see the true gradients
+        scaler.unscale_(optim)
+    else:
+        loss.backward(retain_graph=retain_graph)
 
     # gradient clipping
     if max_grad_norm is not None:
         torch.nn.utils.clip_grad_norm_(net.parameters(), max_grad_norm)
 
     # compute grad norms
-    grad_norms = 0.
-    for p in net.parameters():
-        # only clip gradients for parameters for which requires_grad is True
-        if p.grad is not None:
-            grad_norms += p.grad.data.norm(2).pow(2).item()
+    grad_norms = grad_norm_squared(net.parameters())
 
     # step
-    optim.step()
+    if scaler is not None:
+        scaler.step(optim)
+    else:
+        optim.step()
 
     return grad_norms
 
 
+def get_autocast_dtype(device, dtype="auto"):
+    """
+    Get the torch dtype to use for mixed precision (autocast) on @device.
+
+    Args:
+        device (torch.device or str): device the model lives on
+
+        dtype (str): one of ["auto", "float16", "bfloat16"]. "auto" uses float16 on GPU
+            and bfloat16 on CPU (where autocast only supports bfloat16).
+
+    Returns:
+        dtype (torch.dtype): autocast dtype
+    """
+    device_type = torch.device(device).type
+    if dtype == "auto":
+        return torch.float16 if device_type == "cuda" else torch.bfloat16
+    assert dtype in ["float16", "bfloat16"], "get_autocast_dtype: got invalid dtype {}".format(dtype)
+    if device_type != "cuda":
+        assert dtype == "bfloat16", "get_autocast_dtype: only bfloat16 is supported on {}".format(device_type)
+    return getattr(torch, dtype)
+
+
+def get_grad_scaler(device, dtype, enabled=True):
+    """
+    Get a gradient scaler for mixed precision training with autocast dtype @dtype. The scaler
+    is only enabled for float16 on GPU - bfloat16 has the same exponent range as float32 and
+    needs no loss scaling - and a disabled scaler is a no-op in @backprop_for_loss.
+
+    Args:
+        device (torch.device or str): device the model lives on
+
+        dtype (torch.dtype): autocast dtype (see @get_autocast_dtype)
+
+        enabled (bool): whether mixed precision is used at all
+
+    Returns:
+        scaler (GradScaler): gradient scaler
+    """
+    enabled = enabled and (torch.device(device).type == "cuda") and (dtype == torch.float16)
+    if hasattr(torch, "amp") and hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler("cuda", enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
+
 class dummy_context_mgr():
     """
     A dummy context manager - useful for having conditional scopes (such
@@ -222,3 +328,86 @@ def maybe_no_grad(no_grad):
             it will be a dummy context
     """
     return torch.no_grad() if no_grad else dummy_context_mgr()
+
+
+class TensorRingBuffer(object):
+    """
+    Fixed-capacity history of equally-shaped tensors, stored in a single preallocated
+    tensor on the device of the appended tensors. Once full, each append overwrites
+    the oldest entry, so memory stays constant over training.
+    """
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): maximum number of entries to keep
+        """
+        assert capacity > 0
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all entries (storage is reallocated on the next append).
+        """
+        self._data = None
+        self._next = 0 # slot that the next append writes to
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, x):
+        """
+        Append a (detached) copy of tensor @x. If @x does not match the shape, dtype, or device
+        of earlier entries (e.g. a smaller final batch), the history restarts from @x.
+        """
+        x = x.detach()
+        if (self._data is None) or (self._data.shape[1:] != x.shape) or \
+                (self._data.dtype != x.dtype) or (self._data.device != x.device):
+            self.reset()
+            self._data = torch.zeros((self.capacity,) + tuple(x.shape), dtype=x.dtype, device=x.device)
+        self._data[self._next].copy_(x)
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def last(self, n):
+        """
+        Return the @n most recent entries, oldest first, as a tensor of shape [n, ...]
+        gathered with a single index operation.
+        """
+        assert n <= self._size
+        inds = torch.arange(self._next - n, self._next, device=self._data.device) % self.capacity
+        return self._data.index_select(0, inds)
+
+
+class EMAUpdater(object):
+    """
+    Keeps the parameters of a @target module as an exponential moving average of the
+    parameters of a @source module (e.g. target critics, or EMA policy weights). The
+    parameter lists are collected once, and each update is a fused in-place multi-tensor
+    operation over all parameters.
+    """
+    def __init__(self, source, target, tau):
+        """
+        Args:
+            source (torch.nn.Module): source network to push target network parameters towards
+
+            target (torch.nn.Module): target network to update
+
+            tau (float): update strength - target = target * (1 - tau) + source * tau
+        """
+        self.source_params = list(source.parameters())
+        self.target_params = list(target.parameters())
+        assert len(self.source_params) == len(self.target_params)
+        self.tau = tau
+
+    def update(self, tau=None):
+        """
+        Apply one moving average update.
+
+        Args:
+            tau (float): if provided, use this update strength instead of the default one
+        """
+        tau = self.tau if tau is None else tau
+        with torch.no_grad():
+            _soft_update_params(source_params=self.source_params, target_params=self.target_params, tau=tau)
@@ -18,12 +18,15 @@ import torch
 
 import robomimic
 import robomimic.utils.tensor_utils as TensorUtils
+import robomimic.utils.obs_utils as ObsUtils
 import robomimic.utils.log_utils as LogUtils
 import robomimic.utils.file_utils as FileUtils
+import robomimic.utils.vis_utils as VisUtils
 
 from robomimic.utils.dataset import SequenceDataset
 from robomimic.envs.env_base import EnvBase
 from robomimic.envs.wrappers import EnvWrapper
+from robomimic.envs.vec_env import SubprocVectorEnv
 from robomimic.algo import RolloutPolicy
 
 from robomimic.classifier.classifier import MultiTrajectoryDataset
@@ -33,10 +36,8 @@ from memory_profiler import profile
 import sys
 from memory_profiler import LogFile
 
-import cv2
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
 
 import torch.optim as optim
@@ -100,7 +101,7 @@ def get_exp_dir(config, auto_remove_exp_dir=False):
     return log_dir, output_dir, video_dir
 
 
-def load_data_for_training(config, obs_keys):
+def load_data_for_training(config, obs_keys, seq_fetch_indices=None):
     """
     Data loading at the start of an algorithm.
 
@@ -108,6 +109,8 @@ def load_data_for_training(config, obs_keys):
         config (BaseConfig instance): config object
         obs_keys (list): list of observation modalities that are required for
             training (this will inform the dataloader on what modalities to load)
+        seq_fetch_indices (dict): if provided, timesteps of each sequence to fetch per key
+            (see @Algo.get_seq_fetch_indices and @SequenceDataset)
 
     Returns:
         train_dataset (SequenceDataset instance): train dataset object
@@ -136,16 +139,16 @@ def load_data_for_training(config, obs_keys):
         )
         assert set(train_demo_keys).isdisjoint(set(valid_demo_keys)), "training demonstrations overlap with " \
             "validation demonstrations!"
-        train_dataset = dataset_factory(config, obs_keys, filter_by_attribute=train_filter_by_attribute)
-        valid_dataset = dataset_factory(config, obs_keys, filter_by_attribute=valid_filter_by_attribute)
+        train_dataset = dataset_factory(config, obs_keys, filter_by_attribute=train_filter_by_attribute, seq_fetch_indices=seq_fetch_indices)
+        valid_dataset = dataset_factory(config, obs_keys, filter_by_attribute=valid_filter_by_attribute, seq_fetch_indices=seq_fetch_indices)
     else:
-        train_dataset = dataset_factory(config, obs_keys, filter_by_attribute=train_filter_by_attribute)
+        train_dataset = dataset_factory(config, obs_keys, filter_by_attribute=train_filter_by_attribute, seq_fetch_indices=seq_fetch_indices)
         valid_dataset = None
 
     return train_dataset, valid_dataset
 
 
-def dataset_factory(config, obs_keys, filter_by_attribute=None, dataset_path=None):
+def dataset_factory(config, obs_keys, filter_by_attribute=None, dataset_path=None, seq_fetch_indices=None):
     """
     Create a SequenceDataset instance to pass to a torch DataLoader.
 
@@ -161,12 +164,20 @@ def dataset_factory(config, obs_keys, filter_by_attribute=None, dataset_path=Non
         dataset_path (str): if provided, the SequenceDataset instance should load
             data from this dataset path. Defaults to config.train.data.
 
+        seq_fetch_indices (dict): if provided, timesteps of each sequence to fetch per key
+            (see @Algo.get_seq_fetch_indices and @SequenceDataset)
+
     Returns:
         dataset (SequenceDataset instance): dataset object
     """
     if dataset_path is None:
         dataset_path = config.train.data
 
+    if config.train.hdf5_use_visual_features:
+        # read precomputed backbone features in place of images (see ObsUtils.visual_feature_key)
+        assert not config.train.hdf5_normalize_obs, "no support for observation normalization with precomputed visual features"
+        obs_keys = [ObsUtils.visual_feature_key(k) if ObsUtils.key_is_obs_modality(k, "rgb") else k for k in obs_keys]
+
     ds_kwargs = dict(
         hdf5_path=dataset_path,
         obs_keys=obs_keys,
@@ -179,8 +190,13 @@ def dataset_factory(config, obs_keys, filter_by_attribute=None, dataset_path=Non
         get_pad_mask=False,
         goal_mode=config.train.goal_mode,
         hdf5_cache_mode=config.train.hdf5_cache_mode,
+        hdf5_mmap_cache_dir=config.train.hdf5_mmap_cache_dir,
+        hdf5_use_metadata_cache=config.train.hdf5_use_metadata_cache,
         hdf5_use_swmr=config.train.hdf5_use_swmr,
         hdf5_normalize_obs=config.train.hdf5_normalize_obs,
+        hdf5_normalize_obs_num_workers=config.train.hdf5_normalize_obs_num_workers,
+        batched_fetch=config.train.batched_fetch,
+        seq_fetch_indices=seq_fetch_indices,
         filter_by_attribute=filter_by_attribute
     )
     dataset = SequenceDataset(**ds_kwargs)
@@ -202,6 +218,10 @@ def concatenate_state_dict(state_dict):
     
     return state_array
 
+# slices of the concatenated observation (see @concatenate_state_dict) that make up the classifier state, per env
+ROLLOUT_STATE_INDICES = {'lift': [(0, 10), (37, 40), (40, 44), (51, 53)], 'square': [(0,14), (41, 44), (44, 48), (55, 57)],
+    'PickPlaceCan': [(0,14), (41, 44), (44, 48), (55, 57)] }
+
 def run_rollout(
         policy, 
         env, 
@@ -253,7 +273,6 @@ def run_rollout(
         # retrieve goal from the environment
         goal_dict = env.get_goal()
 
-    results = {}
     video_count = 0  # video frame counter
 
     total_reward = 0.
@@ -265,10 +284,7 @@ def run_rollout(
 
     num_steps = 0
 
-    state_indices_list = {'lift': [(0, 10), (37, 40), (40, 44), (51, 53)], 'square': [(0,14), (41, 44), (44, 48), (55, 57)],
-    'PickPlaceCan': [(0,14), (41, 44), (44, 48), (55, 57)] }
-
-    state_indices = state_indices_list[env.name]
+    state_indices = ROLLOUT_STATE_INDICES[env.name]
 
     classifier.eval()
 
@@ -320,25 +336,47 @@ def run_rollout(
     except env.rollout_exceptions as e:
         print("WARNING: got rollout exception {}".format(e))
 
+    results = summarize_rollout(
+        classifier=classifier,
+        rollout=rollout,
+        actions=actions,
+        success=success,
+        total_reward=total_reward,
+        horizon=step_i + 1,
+        saved_frames=saved_frames,
+        video_path=video_path,
+        at_end=at_end,
+    )
+    return results, rollout, actions, success["task"]
+
+
+def summarize_rollout(classifier, rollout, actions, success, total_reward, horizon, saved_frames, video_path, at_end):
+    """
+    Evaluate the classifier on a finished rollout and collect its statistics.
+
+    Args:
+        classifier (TrajectoryClassifier instance): classifier to evaluate on the rollout
+        rollout (list): classifier states along the rollout
+        actions (list): actions along the rollout
+        success (dict): success metrics of the rollout
+        total_reward (float): return of the rollout
+        horizon (int): number of environment steps taken
+        saved_frames (list): rendered frames, used to write the classifier video if @at_end
+        video_path (str): path of classifier video
+        at_end (bool): if True, write the classifier video for this rollout
+
+    Returns:
+        results (dict): dictionary containing return, success rate, etc.
+    """
     trajectory_lengths = [len(rollout)]
     result = [success["task"]]
     single_trajectory_dataset = MultiTrajectoryDataset(rollout, actions, result, trajectory_lengths, classifier.num_past, classifier.num_future,'train')
 
     true_labels, predicted_labels = evaluate_trajectory_performance(classifier, single_trajectory_dataset, 0, classifier.threshold, saved_frames, video_path, at_end, device='cpu')
-    # with h5py.File(f'bc_trajectories_manipulator_transport.hdf5', 'a') as f:
-    #     demo_group = f.create_group(f"data/demo_{epoch}_{episode}")
-    #     actions_ds = demo_group.create_dataset("actions", (num_steps, 14), dtype='f8')
-    #     states_ds = demo_group.create_dataset("states", (num_steps, 131), dtype='f8')
-        
-
-    #     actions_ds[:] = np.array(actions)
-    #     states_ds[:] = np.array(rollout)
-
-    #     demo_group.attrs['label'] = success["task"]
-
 
+    results = {}
     results["Return"] = total_reward
-    results["Horizon"] = step_i + 1
+    results["Horizon"] = horizon
     results["Success_Rate"] = float(success["task"])
 
     # Classifier Stuff
@@ -351,187 +389,194 @@ def run_rollout(
         if k != "task":
             results["{}_Success_Rate".format(k)] = float(success[k])
 
-    return results, rollout, actions, success["task"]
-
-def evaluate_trajectory_performance(classifier, dataset, trajectory_idx, threshold, saved_frames, video_path, at_end, device='cpu'):
-    classifier.eval()
-    classifier.to(device)
-
-    # Filter trajectory indices for the specified trajectory
-    trajectory_indices = [
-        idx for idx, (traj_idx, _) in enumerate(dataset.indices) if traj_idx == trajectory_idx
-    ]
+    return results
 
-    if at_end:
-        # Get video properties
-        frame_width = 512
-        frame_height = 512
-        fps = 20
-        total_frames = len(saved_frames)
-
-        # Debug: print video properties
-        print(f"Video properties - Width: {frame_width}, Height: {frame_height}, FPS: {fps}, Total Frames: {total_frames}, Path: {video_path}")
-
-        if frame_width == 0 or frame_height == 0 or fps == 0:
-            print("Invalid video properties.")
-            return 0.0  # Invalid video properties
-
-        # Set up video writer with the 'mp4v' codec for MP4 compatibility
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Switch to 'mp4v' codec for MP4 files
-
-        combined_video_writer = imageio.get_writer(video_path, fps=fps)
-        
-        # Set up plots
-        fig_scatter, ax_scatter = plt.subplots()  # Scatter plot figure
-        fig_logit, ax_logit = plt.subplots()      # Logit line graph figure
-
-    # Lists to store plot data
-    x_coords, y_coords, colors, logits, predicted_labels, true_labels, indices = [], [], [], [], [], [], []
-    logit_values, time_points = [], []
 
-    # Initialize variables for performance evaluation
-    total_correct_predictions = 0
-    total_predictions = 0
-
-
-
-    def update_frame(i):
-        # Read the next frame from the video
-        correct_predictions = 0
-        num_predictions = 0
-        frame = saved_frames[i]
-
-        # Get the state-action sequence and true label for the current index
-        points_per_frame = 5
-
-        for k in range(points_per_frame):
-            idx = points_per_frame * i + k
-            if (idx < len(trajectory_indices)):
-                state_action_seq, true_label = dataset[trajectory_indices[idx]]
-                state_action_seq = state_action_seq.to(device)
+def run_vectorized_rollouts(
+        policy,
+        env,
+        horizon,
+        num_episodes,
+        use_goals=False,
+        video_skip=5,
+        terminate_on_success=False,
+        classifier=None,
+        video_path=None,
+    ):
+    """
+    Runs @num_episodes rollouts in a vectorized environment, in waves of @env.num_envs episodes.
+    All copies in a wave step in lockstep, and their observations are batched into a single
+    policy forward pass per step. Copies whose episode has ended are no longer stepped, but
+    their last observation stays in the batch, so that stateful policies (e.g. RNNs) keep a
+    constant batch size over the wave.
 
+    Args:
+        policy (RolloutPolicy instance): policy to use for rollouts.
 
-                true_label = true_label.to(device)
+        env (SubprocVectorEnv instance): vectorized environment to use for rollouts.
 
-                # Predict the label using the model
-                output = classifier(state_action_seq.unsqueeze(0))  # Add batch dimension
-                logit = output.squeeze().item()
-                predicted_label = (output > threshold).float()
+        horizon (int): maximum number of steps to roll the agent out for
 
-                predicted_labels.append(predicted_label.item())
-                logits.append(logit)
-                true_labels.append(true_label.item())
-                indices.append(idx)
+        num_episodes (int): number of rollout episodes
 
-                correct_predictions += 1 if predicted_label.item() == true_label.item() else 0
-                num_predictions += 1
-                color = 'green' if predicted_label.item() == true_label.item() else 'red'
-                colors.append(color)
-            
-            else:
-                return False, correct_predictions, num_predictions, true_labels, predicted_labels
+        use_goals (bool): if True, agent is goal-conditioned, so provide goal observations from env
 
-        # Update scatter plot
-        ax_scatter.cla()
-        ax_scatter.set_xlabel('Time (frames)')
-        ax_scatter.set_ylabel('Classification')
-        ax_scatter.set_title('Real-Time Model Performance Over Time')
+        video_skip (int): how often to write video frame
 
-        time_axis = list(range(1, len(predicted_labels) + 1))
+        terminate_on_success (bool): if True, terminate episode early as soon as a success is encountered
 
-        # Scatter plot using time as the x-axis, with the same colors for success/failure
-        ax_scatter.scatter(time_axis, [1] * len(time_axis), c=colors, marker='o', edgecolor='k')
+        classifier (TrajectoryClassifier instance): classifier to evaluate on each rollout
 
-        for i in range(len(time_axis)):
-            t = time_axis[i]  # x-coordinate on time axis
-            y = 1  # y-coordinate since you are plotting at y=1
-            ax_scatter.annotate(f"{indices[i]} (P: {int(predicted_labels[i])}, T: {int(true_labels[i])}, Logit: {logits[i]:.2f})",
-                                (t, y), textcoords="offset points", xytext=(5, 5), ha='center', fontsize=8, color='blue')
+        video_path (str): if not None, render the final episode and write the classifier video to this path
 
-        # Render scatter plot to a buffer
-        fig_scatter.canvas.draw()
-        scatter_image = np.frombuffer(fig_scatter.canvas.tostring_rgb(), dtype=np.uint8)
-        scatter_image = scatter_image.reshape(fig_scatter.canvas.get_width_height()[::-1] + (3,))
+    Returns:
+        episodes (list): one (results, rollout, actions, success) tuple per episode, as returned by @run_rollout
+    """
+    assert isinstance(policy, RolloutPolicy)
+    assert isinstance(env, SubprocVectorEnv)
 
-        # Resize the scatter plot image to match the video frame size
-        scatter_image_resized = cv2.resize(scatter_image, (frame_width, frame_height))
+    state_indices = ROLLOUT_STATE_INDICES[env.name]
+    classifier.eval()
 
-        # Concatenate the video frame and the scatter plot image side by side
-        scatter_combined_frame = np.concatenate((frame, scatter_image_resized), axis=1)
+    episodes = []
+    for wave_start in range(0, num_episodes, env.num_envs):
+        wave_timestamp = time.time()
+        num_wave_envs = min(env.num_envs, num_episodes - wave_start)
+        env_inds = list(range(num_wave_envs))
+
+        # only the final episode is rendered, for the classifier video
+        video_env_ind = None
+        if (video_path is not None) and (wave_start + num_wave_envs == num_episodes):
+            video_env_ind = num_wave_envs - 1
+
+        policy.start_episode()
+        obs = env.reset(env_inds=env_inds)
+        goals = env.get_goal(env_inds=env_inds) if use_goals else None
+
+        success = [{ k: False for k in s } for s in env.is_success(env_inds=env_inds)]
+        total_reward = np.zeros(num_wave_envs)
+        horizons = np.zeros(num_wave_envs, dtype=np.int64)
+        active = np.ones(num_wave_envs, dtype=bool)
+        rollouts = [[] for _ in env_inds]
+        actions = [[] for _ in env_inds]
+        saved_frames = []
+        video_count = 0
 
-        # Write the combined frame to the scatter plot video
-        # scatter_video_writer.write(scatter_combined_frame)
+        for step_i in range(horizon):
+            ac = policy.get_batch_action(obs, goals=goals)
+
+            step_inds = np.nonzero(active)[0]
+            step_results = env.step([ac[i] for i in step_inds], env_inds=step_inds)
+            stepped_inds = [i for i, res in zip(step_inds, step_results) if not isinstance(res, Exception)]
+            success_metrics = env.is_success(env_inds=stepped_inds)
+            success_metrics = dict(zip(stepped_inds, success_metrics))
+
+            for i, res in zip(step_inds, step_results):
+                horizons[i] = step_i + 1
+                if isinstance(res, Exception):
+                    print("WARNING: got rollout exception {}".format(res))
+                    active[i] = False
+                    continue
+
+                ob, r, done, _ = res
+                obs[i] = ob
+                total_reward[i] += r
+                for k in success[i]:
+                    success[i][k] = success[i][k] or success_metrics[i][k]
+
+                if done or (terminate_on_success and success[i]["task"]):
+                    active[i] = False
+                    continue
+
+                state = concatenate_state_dict(ob)
+                rollouts[i].append(np.hstack([state[start:end] for start, end in state_indices]))
+                actions[i].append(ac[i])
 
-        # Update logit line plot
-        ax_logit.cla()
-        ax_logit.set_ylim(0, 1)
-        ax_logit.set_xlabel('Time (frames)')
-        ax_logit.set_ylabel('Probability Value')
-        ax_logit.set_title('Probability Progression Over Time')
+            # visualization
+            if (video_env_ind is not None) and (video_env_ind in stepped_inds):
+                if video_count % video_skip == 0:
+                    saved_frames.append(env.render(env_inds=[video_env_ind], mode="rgb_array", height=512, width=512)[0])
+                video_count += 1
 
-        # Plot logit values over time
-        ax_logit.plot(indices, logits, label='Probability', color='blue')
-        ax_logit.legend()
+            if not active.any():
+                break
 
-        # Render logit plot to a buffer
-        fig_logit.canvas.draw()
-        logit_image = np.frombuffer(fig_logit.canvas.tostring_rgb(), dtype=np.uint8)
-        logit_image = logit_image.reshape(fig_logit.canvas.get_width_height()[::-1] + (3,))
+        wave_time = time.time() - wave_timestamp
+        for i in env_inds:
+            results = summarize_rollout(
+                classifier=classifier,
+                rollout=rollouts[i],
+                actions=actions[i],
+                success=success[i],
+                total_reward=total_reward[i],
+                horizon=int(horizons[i]),
+                saved_frames=saved_frames,
+                video_path=video_path,
+                at_end=(i == video_env_ind),
+            )
+            # episodes in a wave run concurrently, so split the wave time between them
+            results["time"] = wave_time / num_wave_envs
+            episodes.append((results, rollouts[i], actions[i], success[i]["task"]))
 
-        # Resize the logit plot image to match the video frame size
-        logit_image_resized = cv2.resize(logit_image, (frame_width, frame_height))
+    return episodes
 
-        # Concatenate the video frame and the logit plot image side by side
-        logit_combined_frame = np.concatenate((frame, logit_image_resized), axis=1)
 
-        # Write the combined frame to the logit video
-        # logit_video_writer.write(logit_combined_frame)
+def evaluate_trajectory_performance(classifier, dataset, trajectory_idx, threshold, saved_frames, video_path, at_end, device='cpu', render_in_background=True):
+    """
+    Score every window of a trajectory with the classifier in a single batched forward pass.
 
-        combined_frame = np.concatenate((frame, scatter_image_resized, logit_image_resized), axis=1)
+    Args:
+        classifier (TrajectoryClassifier instance): classifier to evaluate
+        dataset (MultiTrajectoryDataset instance): dataset containing the trajectory
+        trajectory_idx (int): index of the trajectory in @dataset
+        threshold (float): probability threshold for a positive prediction
+        saved_frames (list): rendered rollout frames, used for the diagnostic video if @at_end
+        video_path (str): path of the diagnostic video
+        at_end (bool): if True, write a diagnostic video of the predictions (see
+            VisUtils.write_classifier_video), and only score the windows covered by @saved_frames
+        device (str): device to run the classifier on
+        render_in_background (bool): if True, the diagnostic video is written in a background process
 
-        # Write the combined frame to the third video
-        combined_video_writer.append_data(combined_frame)
+    Returns:
+        true_labels (list): true label of each scored window
+        predicted_labels (list): predicted label of each scored window
+    """
+    classifier.eval()
+    classifier.to(device)
 
+    # windows of the specified trajectory
+    trajectory_indices = np.nonzero(dataset.indices[:, 0] == trajectory_idx)[0] if len(dataset) > 0 else np.zeros(0, dtype=np.int64)
 
-        return True, correct_predictions, num_predictions, true_labels, predicted_labels
-    
+    points_per_frame = 5
     if at_end:
-        frame_idx = 0
-        while frame_idx < len(saved_frames):
-            update, correct_predictions, num_predictions, true_labels, predicted_labels = update_frame(frame_idx)
-            total_correct_predictions += correct_predictions
-            total_predictions += num_predictions
-            if not update:
-                break
-            frame_idx += 1
-        
-        combined_video_writer.close()
-        plt.close(fig_scatter)
-        plt.close(fig_logit)
-    else:
-        for i in range(len(trajectory_indices)):
-            state_action_seq, true_label = dataset[trajectory_indices[i]]
-            state_action_seq = state_action_seq.to(device)
-
-
-            true_label = true_label.to(device)
+        # the video shows @points_per_frame windows per frame, so only windows covered by frames are scored
+        trajectory_indices = trajectory_indices[:points_per_frame * len(saved_frames)]
+    if len(trajectory_indices) == 0:
+        return [], []
 
-            # Predict the label using the model
-            output = classifier(state_action_seq.unsqueeze(0))  # Add batch dimension
-            logit = output.squeeze().item()
-            predicted_label = (output > threshold).float()
+    state_action_seq, true_labels = dataset.get_batch(trajectory_indices)
+    with torch.no_grad():
+        logits = classifier(state_action_seq.to(device)).reshape(-1)
+    predicted_labels = (logits > threshold).float()
 
-            predicted_labels.append(predicted_label.item())
-            logits.append(logit)
-            true_labels.append(true_label.item())
-            indices.append(i)
-
-            total_correct_predictions += 1 if predicted_label.item() == true_label.item() else 0
-            total_predictions += 1
-        
+    # single device-to-host copy for everything
+    logits, predicted_labels, true_labels = TensorUtils.to_numpy(torch.stack([logits, predicted_labels, true_labels.to(logits.device)]))
 
+    if at_end:
+        video_kwargs = dict(
+            video_path=video_path,
+            frames=saved_frames,
+            logits=logits,
+            predicted_labels=predicted_labels,
+            true_labels=true_labels,
+            points_per_frame=points_per_frame,
+        )
+        if render_in_background:
+            VisUtils.write_classifier_video_in_background(**video_kwargs)
+        else:
+            VisUtils.write_classifier_video(**video_kwargs)
 
-    return true_labels, predicted_labels
+    return true_labels.tolist(), predicted_labels.tolist()
 
 
 def rollout_with_stats(
@@ -560,7 +605,8 @@ def rollout_with_stats(
         policy (RolloutPolicy instance): policy to use for rollouts.
 
         envs (dict): dictionary that maps env_name (str) to EnvBase instance. The policy will
-            be rolled out in each env.
+            be rolled out in each env. If an env is a SubprocVectorEnv instance, episodes are run
+            in parallel across its copies (see @run_vectorized_rollouts).
 
         horizon (int): maximum number of steps to roll the agent out for
 
@@ -633,32 +679,56 @@ def rollout_with_stats(
         true_labels = []
         predicted_labels = []
 
-        for ep_i in iterator:
-
-            env_video_writer = None
+        vectorized_episodes = None
+        if isinstance(env, SubprocVectorEnv):
+            assert not render, "rollout_with_stats: on-screen rendering is not supported for vectorized envs"
+            vectorized_video_path = video_path
             if write_video:
-                video_str = "_epoch_{}_episode_{}.mp4".format(epoch, ep_i) if epoch is not None else "_episode_{}.mp4".format(ep_i)
-                video_path = os.path.join(video_dir, "{}{}".format(env_name, video_str))
-                print("video writes to " + video_path)
-                env_video_writer = imageio.get_writer(video_path, fps=20)
-            rollout_timestamp = time.time()
-            at_end = (ep_i == num_episodes - 1)
-            rollout_info, states, actions, result = run_rollout(
+                video_str = "_epoch_{}_episode_{}.mp4".format(epoch, num_episodes - 1) if epoch is not None else "_episode_{}.mp4".format(num_episodes - 1)
+                vectorized_video_path = os.path.join(video_dir, "{}{}".format(env_name, video_str))
+                print("video writes to " + vectorized_video_path)
+            vectorized_episodes = run_vectorized_rollouts(
                 policy=policy,
                 env=env,
                 horizon=horizon,
-                epoch = epoch,
-                episode = ep_i,
-                render=render,
+                num_episodes=num_episodes,
                 use_goals=use_goals,
-                video_writer=env_video_writer,
                 video_skip=video_skip,
                 terminate_on_success=terminate_on_success,
                 classifier=classifier,
-                video_path=video_path,
-                at_end = at_end
+                video_path=vectorized_video_path,
             )
 
+        for ep_i in iterator:
+
+            if vectorized_episodes is not None:
+                rollout_info, states, actions, result = vectorized_episodes[ep_i]
+            else:
+                env_video_writer = None
+                if write_video:
+                    video_str = "_epoch_{}_episode_{}.mp4".format(epoch, ep_i) if epoch is not None else "_episode_{}.mp4".format(ep_i)
+                    video_path = os.path.join(video_dir, "{}{}".format(env_name, video_str))
+                    print("video writes to " + video_path)
+                    env_video_writer = imageio.get_writer(video_path, fps=20)
+                rollout_timestamp = time.time()
+                at_end = (ep_i == num_episodes - 1)
+                rollout_info, states, actions, result = run_rollout(
+                    policy=policy,
+                    env=env,
+                    horizon=horizon,
+                    epoch = epoch,
+                    episode = ep_i,
+                    render=render,
+                    use_goals=use_goals,
+                    video_writer=env_video_writer,
+                    video_skip=video_skip,
+                    terminate_on_success=terminate_on_success,
+                    classifier=classifier,
+                    video_path=video_path,
+                    at_end = at_end
+                )
+                rollout_info["time"] = time.time() - rollout_timestamp
+
             # Classifier Stuff
 
             all_states.extend(states)
@@ -666,8 +736,6 @@ def rollout_with_stats(
             all_results.append(result)
             trajectory_lengths.append(len(states))
 
-            rollout_info["time"] = time.time() - rollout_timestamp
-
             true_labels.extend(rollout_info["classifier_true_labels"])
             predicted_labels.extend(rollout_info["classifier_predicted_labels"])
 
@@ -687,7 +755,8 @@ def rollout_with_stats(
 
         dataset = MultiTrajectoryDataset(all_states, all_actions, all_results, trajectory_lengths, classifier.num_past, classifier.num_future, 'train')
 
-        data_loader = DataLoader(dataset, batch_size=8, shuffle=True)
+        # each batch of windows is gathered at once by the dataset (see MultiTrajectoryDataset.get_batch)
+        data_loader = DataLoader(dataset, sampler=dataset.get_batch_sampler(batch_size=8, shuffle=True), batch_size=None)
         num_epochs = 3
 
         if (not classifier.checkpoint):
@@ -854,8 +923,8 @@ def save_model(model, config, env_meta, shape_meta, ckpt_path, obs_normalization
 
         ckpt_path (str): writes model checkpoint to this path
 
-        obs_normalization_stats (dict): optionally pass a dictionary for observation
-            normalization. This should map observation keys to dicts
+        obs_normalization_stats (ObsUtils.ObsNormalizationStats or dict): optionally pass statistics
+            for observation normalization. This should map observation keys to dicts
             with a "mean" and "std" of shape (1, ...) where ... is the default
             shape for the observation.
     """
@@ -870,13 +939,112 @@ def save_model(model, config, env_meta, shape_meta, ckpt_path, obs_normalization
     )
     if obs_normalization_stats is not None:
         assert config.train.hdf5_normalize_obs
-        obs_normalization_stats = deepcopy(obs_normalization_stats)
+        obs_normalization_stats = ObsUtils.ObsNormalizationStats(obs_normalization_stats).as_dict()
         params["obs_normalization_stats"] = TensorUtils.to_list(obs_normalization_stats)
+    grad_scaler = getattr(model, "grad_scaler", None)
+    if (grad_scaler is not None) and grad_scaler.is_enabled():
+        # loss scale state for float16 mixed precision training
+        params["grad_scaler"] = grad_scaler.state_dict()
     torch.save(params, ckpt_path)
     print("save checkpoint to {}".format(ckpt_path))
 
 
-def run_epoch(model, data_loader, epoch, validate=False, num_steps=None, obs_normalization_stats=None):
+class DevicePrefetcher(object):
+    """
+    Serves batches from a data loader with their tensors already on the training device. On CUDA
+    devices, each batch is pinned and copied with non-blocking transfers on a separate stream, so
+    that the copy of batch k+1 (issued by @preload right after batch k has been queued for training)
+    overlaps with the compute of batch k. On other devices, batches are simply moved synchronously.
+
+    Like @run_epoch, the data loader is restarted when it runs out of batches.
+    """
+    def __init__(self, data_loader, device, uint8_to_float=False):
+        """
+        Args:
+            data_loader (DataLoader instance): data loader that serves batches of data
+
+            device (torch.device): device to copy batches to
+
+            uint8_to_float (bool): if True, uint8 tensors (such as images) are converted to float on
+                the device after the copy, so that only the compact uint8 data is transferred
+        """
+        self.data_loader = data_loader
+        self.device = torch.device(device)
+        self.uint8_to_float = uint8_to_float
+        self.stream = torch.cuda.Stream(device=self.device) if self.device.type == "cuda" else None
+        self._data_loader_iter = None
+        self._batch = None
+
+        # time spent fetching the preloaded batch from the data loader and issuing its copies
+        self.load_time = 0.
+
+    def _next_from_loader(self):
+        if self._data_loader_iter is None:
+            self._data_loader_iter = iter(self.data_loader)
+        try:
+            return next(self._data_loader_iter)
+        except StopIteration:
+            # reset for next dataset pass
+            self._data_loader_iter = iter(self.data_loader)
+            return next(self._data_loader_iter)
+
+    def _copy(self, x):
+        if self.stream is not None:
+            if not x.is_pinned():
+                x = x.pin_memory()
+            x = x.to(self.device, non_blocking=True)
+        else:
+            x = x.to(self.device)
+        if self.uint8_to_float and (x.dtype == torch.uint8):
+            x = x.float()
+        return x
+
+    def preload(self):
+        """
+        Fetch the next batch from the data loader and start copying it to the device.
+        """
+        t = time.time()
+        batch = self._next_from_loader()
+        if self.stream is not None:
+            with torch.cuda.stream(self.stream):
+                batch = TensorUtils.map_tensor(batch, self._copy)
+        else:
+            batch = TensorUtils.map_tensor(batch, self._copy)
+        self._batch = batch
+        self.load_time = time.time() - t
+
+    def next(self):
+        """
+        Get the preloaded batch (calling @preload first if there is none). On CUDA, work queued on
+        the current stream after this call waits for the batch copies to finish, without blocking
+        the host - so host-side timers do not see this wait.
+
+        Returns:
+            batch (dict): batch with tensors on the device
+        """
+        if self._batch is None:
+            self.preload()
+        batch, self._batch = self._batch, None
+        if self.stream is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            # tensors were allocated on the copy stream - make sure the caching allocator does not
+            # reuse their memory while the current stream is still using them
+            TensorUtils.map_tensor(batch, lambda x: x.record_stream(current_stream))
+        return batch
+
+
+def run_epoch(
+    model,
+    data_loader,
+    epoch,
+    validate=False,
+    num_steps=None,
+    obs_normalization_stats=None,
+    log_every_n_steps=1,
+    prefetch_to_device=False,
+    prefetch_uint8_to_float=False,
+):
     """
     Run an epoch of training or validation.
 
@@ -898,8 +1066,21 @@ def run_epoch(model, data_loader, epoch, validate=False, num_steps=None, obs_nor
             with a "mean" and "std" of shape (1, ...) where ... is the default
             shape for the observation.
 
+        log_every_n_steps (int): only summarize training info with @model.log_info every n batches
+            (and on the last batch). Logged tensors are only copied to the host at these steps,
+            so larger values avoid stalling the device on every step.
+
+        prefetch_to_device (bool): if True, serve batches through a @DevicePrefetcher, which copies
+            batch k+1 to the model device while batch k trains. Time_Data_Loading then measures the
+            time to fetch each batch and issue its copies. On CUDA, the wait for the copies happens
+            on the device stream and does not block the host, so it is not measured by any of the
+            timing stats.
+
+        prefetch_uint8_to_float (bool): if True (and @prefetch_to_device is True), convert uint8
+            tensors to float on the device as part of the prefetch
+
     Returns:
-        step_log_all (dict): dictionary of logged training metrics averaged across all batches
+        step_log_all (dict): dictionary of logged training metrics averaged across the logged batches
     """
     epoch_timestamp = time.time()
     if validate:
@@ -913,22 +1094,31 @@ def run_epoch(model, data_loader, epoch, validate=False, num_steps=None, obs_nor
     timing_stats = dict(Data_Loading=[], Process_Batch=[], Train_Batch=[], Log_Info=[])
     start_time = time.time()
 
-    data_loader_iter = iter(data_loader)
-    for _ in LogUtils.custom_tqdm(range(num_steps)):
-
-        # load next batch from data loader
-        try:
-            t = time.time()
-            batch = next(data_loader_iter)
-        except StopIteration:
-            # reset for next dataset pass
-            data_loader_iter = iter(data_loader)
-            t = time.time()
-            batch = next(data_loader_iter)
-        timing_stats["Data_Loading"].append(time.time() - t)
+    prefetcher = None
+    if prefetch_to_device:
+        prefetcher = DevicePrefetcher(data_loader, device=model.device, uint8_to_float=prefetch_uint8_to_float)
+    else:
+        data_loader_iter = iter(data_loader)
+    for step in LogUtils.custom_tqdm(range(num_steps)):
+
+        if prefetcher is None:
+            # load next batch from data loader
+            try:
+                t = time.time()
+                batch = next(data_loader_iter)
+            except StopIteration:
+                # reset for next dataset pass
+                data_loader_iter = iter(data_loader)
+                t = time.time()
+                batch = next(data_loader_iter)
+            timing_stats["Data_Loading"].append(time.time() - t)
 
         # process batch for training
         t = time.time()
+        if prefetcher is not None:
+            # batch was already fetched (and its copies issued) during the previous step
+            batch = prefetcher.next()
+            timing_stats["Data_Loading"].append(prefetcher.load_time)
         input_batch = model.process_batch_for_training(batch)
         input_batch = model.postprocess_batch_for_training(input_batch, obs_normalization_stats=obs_normalization_stats)
         timing_stats["Process_Batch"].append(time.time() - t)
@@ -938,9 +1128,17 @@ def run_epoch(model, data_loader, epoch, validate=False, num_steps=None, obs_nor
         info = model.train_on_batch(input_batch, epoch, validate=validate)
         timing_stats["Train_Batch"].append(time.time() - t)
 
+        # start copying the next batch while the device works on this one
+        if (prefetcher is not None) and (step != num_steps - 1):
+            prefetcher.preload()
+
         # tensorboard logging
+        if (step % log_every_n_steps != 0) and (step != num_steps - 1):
+            continue
         t = time.time()
         step_log = model.log_info(info)
+        # materialize any lazily-computed tensors (such as grad norms) as floats
+        step_log = dict((k, v.item() if isinstance(v, torch.Tensor) else v) for k, v in step_log.items())
         step_log_all.append(step_log)
         timing_stats["Log_Info"].append(time.time() - t)
 
@@ -2,9 +2,13 @@
 This file contains utility functions for visualizing image observations in the training pipeline.
 These functions can be a useful debugging tool.
 """
+import queue
+import threading
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 import robomimic.utils.tensor_utils as TensorUtils
 import robomimic.utils.obs_utils as ObsUtils
@@ -96,6 +100,8 @@ def visualize_image_randomizer(original_image, randomized_image, randomizer_name
 def depth_to_rgb(depth_map, depth_min=None, depth_max=None):
     """
     Convert depth map to rgb array by computing normalized depth values in [0, 1].
+    Depth maps can be of shape [H, W], [H, W, 1], or batches of those with leading
+    dimensions, such as [T, H, W, 1].
     """
     # normalize depth map into [0, 1]
     if depth_min is None:
@@ -104,8 +110,160 @@ def depth_to_rgb(depth_map, depth_min=None, depth_max=None):
         depth_max = depth_map.max()
     depth_map = (depth_map - depth_min) / (depth_max - depth_min)
     # depth_map = np.clip(depth_map / 3., 0., 1.)
-    if len(depth_map.shape) == 3:
-        assert depth_map.shape[-1] == 1
+    if depth_map.shape[-1] == 1:
         depth_map = depth_map[..., 0]
-    assert len(depth_map.shape) == 2 # [H, W]
+    assert len(depth_map.shape) >= 2 # [..., H, W]
     return (255. * cm.hot(depth_map, 3)).astype(np.uint8)[..., :3]
+
+
+class ThreadedVideoWriter(object):
+    """
+    Wraps an imageio video writer so that frames are encoded on a separate thread. Frames
+    are passed through a bounded queue, so the caller only waits for the encoder when
+    @max_queue_size frames are pending.
+    """
+    def __init__(self, video_writer, max_queue_size=64):
+        """
+        Args:
+            video_writer (imageio writer): video writer to encode frames with
+
+            max_queue_size (int): maximum number of frames waiting to be encoded
+        """
+        self.video_writer = video_writer
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            if self._error is not None:
+                # drain the queue so the caller does not block
+                continue
+            try:
+                self.video_writer.append_data(frame)
+            except Exception as e:
+                self._error = e
+
+    def _check_error(self):
+        if self._error is not None:
+            raise Exception("ThreadedVideoWriter: video encoding failed") from self._error
+
+    def append_data(self, frame):
+        """
+        Queue @frame (np.array of shape [H, W, 3]) to be written to the video.
+        """
+        self._check_error()
+        self._queue.put(frame)
+
+    def close(self):
+        """
+        Wait for all queued frames to be written, and close the video writer.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.video_writer.close()
+        self._check_error()
+
+
+def write_classifier_video(video_path, frames, logits, predicted_labels, true_labels, points_per_frame=5, fps=20, frame_size=512):
+    """
+    Write a diagnostic video of trajectory classifier predictions. Each rollout frame is shown next to
+    a scatter plot of the predictions made so far (green if correct, red otherwise) and a plot of the
+    predicted probabilities over time. Frame i covers the predictions for windows
+    [points_per_frame * i, points_per_frame * (i + 1)).
+
+    Args:
+        video_path (str): path to write video to
+        frames (list): rollout frames of shape (frame_size, frame_size, 3)
+        logits (np.array): classifier probabilities, one per window
+        predicted_labels (np.array): predicted labels, one per window
+        true_labels (np.array): true labels, one per window
+        points_per_frame (int): number of windows covered by each frame
+        fps (int): video frame rate
+        frame_size (int): height and width of frames and plots
+    """
+    import cv2
+    import imageio
+
+    num_frames = min(len(frames), len(logits) // points_per_frame)
+    colors = ['green' if p == t else 'red' for p, t in zip(predicted_labels, true_labels)]
+
+    def make_figure():
+        # render with an Agg canvas directly, so that pyplot's global state (such as the backend)
+        # is left untouched in the calling process
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot()
+
+    def plot_to_image(fig):
+        fig.canvas.draw()
+        image = np.ascontiguousarray(np.asarray(fig.canvas.buffer_rgba())[..., :3])
+        return cv2.resize(image, (frame_size, frame_size))
+
+    video_writer = imageio.get_writer(video_path, fps=fps)
+    fig_scatter, ax_scatter = make_figure()
+    fig_logit, ax_logit = make_figure()
+    for i in range(num_frames):
+        n = points_per_frame * (i + 1)
+        time_axis = list(range(1, n + 1))
+
+        # scatter plot of predictions so far, annotated with prediction, label, and probability
+        ax_scatter.cla()
+        ax_scatter.set_xlabel('Time (frames)')
+        ax_scatter.set_ylabel('Classification')
+        ax_scatter.set_title('Real-Time Model Performance Over Time')
+        ax_scatter.scatter(time_axis, [1] * n, c=colors[:n], marker='o', edgecolor='k')
+        for j in range(n):
+            ax_scatter.annotate(f"{j} (P: {int(predicted_labels[j])}, T: {int(true_labels[j])}, Logit: {logits[j]:.2f})",
+                                (time_axis[j], 1), textcoords="offset points", xytext=(5, 5), ha='center', fontsize=8, color='blue')
+
+        # probability progression over time
+        ax_logit.cla()
+        ax_logit.set_ylim(0, 1)
+        ax_logit.set_xlabel('Time (frames)')
+        ax_logit.set_ylabel('Probability Value')
+        ax_logit.set_title('Probability Progression Over Time')
+        ax_logit.plot(list(range(n)), logits[:n], label='Probability', color='blue')
+        ax_logit.legend()
+
+        combined_frame = np.concatenate((frames[i], plot_to_image(fig_scatter), plot_to_image(fig_logit)), axis=1)
+        video_writer.append_data(combined_frame)
+
+    video_writer.close()
+
+
+# background processes writing videos (see @write_classifier_video_in_background)
+_BACKGROUND_VIDEO_WRITERS = []
+
+
+def write_classifier_video_in_background(**kwargs):
+    """
+    Run @write_classifier_video in a background process, so that the caller does not wait for
+    plotting and encoding. Use @wait_for_background_video_writers to wait for all videos.
+
+    Args:
+        kwargs: arguments to @write_classifier_video
+    """
+    import multiprocessing
+
+    # forget about writers that already finished
+    _BACKGROUND_VIDEO_WRITERS[:] = [p for p in _BACKGROUND_VIDEO_WRITERS if p.is_alive()]
+
+    # spawn, so that the writer does not inherit the caller's CUDA or renderer state
+    p = multiprocessing.get_context("spawn").Process(target=write_classifier_video, kwargs=kwargs)
+    p.start()
+    _BACKGROUND_VIDEO_WRITERS.append(p)
+    return p
+
+
+def wait_for_background_video_writers():
+    """
+    Wait for all videos started with @write_classifier_video_in_background to be written.
+    """
+    for p in _BACKGROUND_VIDEO_WRITERS:
+        p.join()
+    _BACKGROUND_VIDEO_WRITERS[:] = []
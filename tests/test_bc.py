@@ -5,13 +5,19 @@ the model. Excludes stdout output by default (pass --verbose
 to see stdout output).
 """
 import argparse
+import traceback
 from collections import OrderedDict
+from termcolor import colored
+
+import torch
+import torchvision.transforms.functional as TVF
 
 import robomimic
 from robomimic.config import Config
 import robomimic.utils.test_utils as TestUtils
 from robomimic.utils.log_utils import silence_stdout
 from robomimic.utils.torch_utils import dummy_context_mgr
+from robomimic.models.obs_core import ColorRandomizer
 
 
 def get_algo_base_config():
@@ -249,6 +255,74 @@ def bc_transformer_gmm_modifier(config):
     return config
 
 
+@register_mod("bc-transformer-incremental")
+def bc_transformer_incremental_modifier(config):
+    config.algo.gmm.enabled = True
+    config.algo.transformer.enabled = True
+    config.algo.transformer.incremental_inference = True
+    config.train.frame_stack = 10
+    config.train.seq_length = 1
+    return config
+
+
+@register_mod("bc-mmap-cache")
+def bc_mmap_cache_modifier(config):
+    config.train.hdf5_cache_mode = "mmap"
+    return config
+
+
+@register_mod("bc-normalize-obs")
+def bc_normalize_obs_modifier(config):
+    # normalization stats are read from the metadata cache on repeated runs
+    config.train.hdf5_normalize_obs = True
+    config.train.hdf5_use_metadata_cache = True
+    return config
+
+
+@register_mod("bc-normalize-obs-parallel")
+def bc_normalize_obs_parallel_modifier(config):
+    config.train.hdf5_normalize_obs = True
+    config.train.hdf5_use_metadata_cache = False
+    config.train.hdf5_normalize_obs_num_workers = 2
+    return config
+
+
+@register_mod("bc-batched-fetch")
+def bc_batched_fetch_modifier(config):
+    config.train.batched_fetch = True
+    config.train.hdf5_cache_mode = "all"
+    config.train.frame_stack = 2
+    config.train.seq_length = 3
+    return config
+
+
+@register_mod("bc-prefetch-to-device")
+def bc_prefetch_to_device_modifier(config):
+    config.train.prefetch_to_device = True
+    config.train.prefetch_uint8_to_float = True
+    return config
+
+
+@register_mod("bc-sparse-fetch")
+def bc_sparse_fetch_modifier(config):
+    config.train.sparse_fetch = True
+    return config
+
+
+@register_mod("bc-amp")
+def bc_amp_modifier(config):
+    config.train.amp.enabled = True
+    config.train.amp.dtype = "auto"
+    config.train.channels_last = True
+    return config
+
+
+@register_mod("bc-vectorized-rollout")
+def bc_vectorized_rollout_modifier(config):
+    config.experiment.rollout.num_envs = 2
+    return config
+
+
 # add image version of all tests
 image_modifiers = OrderedDict()
 for test_name in MODIFIERS:
@@ -274,6 +348,16 @@ def bc_image_crop_modifier(config):
     return config
 
 
+@register_mod("bc-image-color-jitter")
+def bc_image_color_jitter_modifier(config):
+    config = convert_config_for_images(config)
+
+    # observation randomizer class - using Color randomizer with 2 jitters per image
+    config.observation.encoder.rgb.obs_randomizer_class = "ColorRandomizer"
+    config.observation.encoder.rgb.obs_randomizer_kwargs.num_samples = 2
+    return config
+
+
 def test_bc(silence=True):
     for test_name in MODIFIERS:
         context = silence_stdout() if silence else dummy_context_mgr()
@@ -283,6 +367,53 @@ def test_bc(silence=True):
         print("{}: {}".format(test_name, res_str))
 
 
+def test_color_randomizer(silence=True):
+    """
+    Checks that the batched color jitter in ColorRandomizer matches applying torchvision's
+    per-image adjustments with the same factors and in the same order.
+    """
+    context = silence_stdout() if silence else dummy_context_mgr()
+    with context:
+
+        try:
+            torch.manual_seed(0)
+            randomizer = ColorRandomizer(input_shape=(3, 16, 16), brightness=0.3, contrast=0.3, saturation=0.3, hue=0.3)
+            x = torch.rand(6, 3, 16, 16)
+
+            # fixed factors (brightness, contrast, saturation, hue) and a different order for each image
+            factors = [
+                torch.tensor([0.7, 0.8, 0.9, 1.1, 1.2, 1.3]),
+                torch.tensor([1.3, 0.7, 1.2, 0.8, 1.1, 0.9]),
+                torch.tensor([0.9, 1.3, 0.7, 1.2, 0.8, 1.1]),
+                torch.tensor([-0.3, -0.2, -0.1, 0.1, 0.2, 0.3]),
+            ]
+            order = torch.tensor([
+                [0, 1, 2, 3],
+                [3, 2, 1, 0],
+                [1, 3, 0, 2],
+                [2, 0, 3, 1],
+                [3, 0, 1, 2],
+                [1, 2, 3, 0],
+            ])
+            out = randomizer._batch_color_jitter(x, factors=factors, order=order)
+
+            adjust_fns = [TVF.adjust_brightness, TVF.adjust_contrast, TVF.adjust_saturation, TVF.adjust_hue]
+            for i in range(x.shape[0]):
+                img = x[i]
+                for j in order[i].tolist():
+                    img = adjust_fns[j](img, factors[j][i].item())
+                assert torch.allclose(out[i], img, atol=1e-4), "mismatch with torchvision for image {}".format(i)
+
+            # indicate success
+            ret = colored("passed!", "green")
+
+        except Exception as e:
+            # indicate failure by returning error string
+            ret = colored("failed with error:\n{}\n\n{}".format(e, traceback.format_exc()), "red")
+
+    print("{}: {}".format("bc-color-randomizer-torchvision", ret))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -292,4 +423,5 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
+    test_color_randomizer(silence=(not args.verbose))
     test_bc(silence=(not args.verbose))
@@ -7,6 +7,8 @@ to see stdout output).
 import argparse
 from collections import OrderedDict
 
+import torch
+
 import robomimic
 from robomimic.config import Config
 import robomimic.utils.test_utils as TestUtils
@@ -242,6 +244,16 @@ def bcq_image_crop_modifier(config):
     return config
 
 
+# float16 mixed precision scales the losses of the action sampler, critic, and actor optimizers with one
+# gradient scaler, which is only enabled on GPU
+if torch.cuda.is_available():
+    @register_mod("bcq-amp-float16")
+    def bcq_amp_float16_modifier(config):
+        config.train.amp.enabled = True
+        config.train.amp.dtype = "float16"
+        return config
+
+
 def test_bcq(silence=True):
     for test_name in MODIFIERS:
         context = silence_stdout() if silence else dummy_context_mgr()
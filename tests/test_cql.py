@@ -106,6 +106,12 @@ def cql_gaussian_modifier(config):
     return config
 
 
+@register_mod("cql-shared-encoder-ensemble")
+def cql_shared_encoder_ensemble_modifier(config):
+    config.algo.critic.ensemble.shared_encoder = True
+    return config
+
+
 # add image version of all tests
 image_modifiers = OrderedDict()
 for test_name in MODIFIERS:
@@ -163,6 +163,12 @@ def hbc_vae_modifier_10(config):
     return config
 
 
+@register_mod("hbc-sparse-fetch")
+def hbc_sparse_fetch_modifier(config):
+    config.train.sparse_fetch = True
+    return config
+
+
 def test_hbc(silence=True):
     for test_name in MODIFIERS:
         context = silence_stdout() if silence else dummy_context_mgr()
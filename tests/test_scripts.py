@@ -84,7 +84,11 @@ def test_playback_script(silence=True, use_actions=False, use_obs=False):
             args.use_obs = use_obs
             args.render = False
             args.video_path = TestUtils.temp_video_path() # dump video
+            args.video_dir = None
+            args.num_workers = 0
             args.video_skip = 5
+            args.read_block_size = 4 # blocks that are not aligned with video_skip
+            args.render_depth_names = None
             if use_obs:
                 # camera observation names
                 args.render_image_names = ["agentview_image", "robot0_eye_in_hand_image"]
@@ -130,6 +134,8 @@ def test_run_agent_script(silence=True):
             args.camera_names = ["agentview", "robot0_eye_in_hand"]
             args.dataset_path = TestUtils.temp_dataset_path() # dump dataset
             args.dataset_obs = True
+            args.write_chunk_size = 4 # several chunks per rollout
+            args.background_write = True
             args.seed = 0
             run_trained_agent(args)
 
@@ -137,6 +143,8 @@ def test_run_agent_script(silence=True):
             f = h5py.File(TestUtils.temp_dataset_path(), "r")
             assert f["data/demo_1/obs/agentview_image"].shape == (10, 84, 84, 3)
             assert f["data/demo_1/obs/agentview_image"].dtype == np.uint8
+            assert f["data/demo_1"].attrs["num_samples"] == f["data/demo_1/actions"].shape[0]
+            assert "partial" not in f["data/demo_1"].attrs
             f.close()
 
             # indicate success